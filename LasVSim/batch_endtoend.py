@@ -0,0 +1,279 @@
+"""Batched end-to-end highway env: many `EndtoendEnv` + `ObservationWrapper` episodes stepped together on
+arrays, with the numpy traffic model instead of SUMO.
+
+Ego paths, traffic, collision and road checks, rewards and the 56-dim encoding of all envs are computed on
+(nb_envs, ...) arrays, the episodes are independent and reset automatically like in `SubprocVecEnv`.
+"""
+import numpy as np
+
+from rl.common.vec_env import VecEnv
+from LasVSim.endtoend import sample_init_state
+from LasVSim.init_states import VehicleIndex
+from LasVSim.kernels import HAVE_NUMBA, encode_frames
+from LasVSim.numpy_traffic import BatchTraffic, LANE_CENTER_Y, LANE_WIDTH, LANE_NUMBER, lane_of, on_road
+from LasVSim.reference import BatchReference
+from LasVSim.simulator import Settings
+from LasVSim.traffic_module import TrafficData
+
+ENCODE_VEC_LEN = 56  # 6 dim * 8 veh + 8 ego
+GOAL_LENGTH = 500  # episode ends on running 500m
+ROAD_X_LIMIT = 900  # judge_feasible
+
+
+def collided(ego_x, ego_y, ego_heading, ego_length, ego_width, x, y, angle, length, width, active):
+    """`Simulation`'s collision check of every ego with the vehicles of its env, (nb_envs,) bool.
+
+    Ego states are (nb_envs,) arrays, vehicle states (nb_envs, N) arrays.
+    """
+    env, veh = np.nonzero(active & (np.abs(x - ego_x[:, None]) < 10) & (np.abs(y - ego_y[:, None]) < 2))
+    ego_x, ego_y, ego_heading = ego_x[env], ego_y[env], np.radians(ego_heading[env])
+    x, y, angle, length, width = x[env, veh], y[env, veh], np.radians(angle[env, veh]), length[env, veh], width[env, veh]
+    ego_lw = (ego_length - ego_width) / 2
+    lw = (length - width) / 2
+    ego_dx, ego_dy = np.cos(ego_heading) * ego_lw, np.sin(ego_heading) * ego_lw
+    dx, dy = np.cos(angle) * lw, np.sin(angle) * lw
+    threshold = ((width + ego_width) / 2 + 0.5) ** 2
+    hit = np.zeros(len(env), dtype=bool)
+    for ego_sign, sign in [(1, 1), (1, -1), (-1, -1), (-1, 1)]:
+        hit |= ((ego_x + ego_sign * ego_dx - x - sign * dx) ** 2
+                + (ego_y + ego_sign * ego_dy - y - sign * dy) ** 2 < threshold)
+    return np.bincount(env[hit], minlength=len(active)) > 0
+
+
+def road_violated(ego_x, ego_y, ego_heading, ego_length, ego_width):
+    """Whether a corner of the ego is off the lower straight, (nb_envs,) bool."""
+    heading = np.radians(ego_heading)
+    cos, sin = np.cos(heading), np.sin(heading)
+    violated = np.zeros(len(ego_x), dtype=bool)
+    for along, across in [(1, 1), (1, -1), (-1, 1), (-1, -1)]:
+        corner_x = ego_x + along * ego_length / 2 * cos - across * ego_width / 2 * sin
+        corner_y = ego_y + along * ego_length / 2 * sin + across * ego_width / 2 * cos
+        violated |= ~((-ROAD_X_LIMIT < corner_x) & (corner_x < ROAD_X_LIMIT) & on_road(corner_y))
+    return violated
+
+
+class BatchEncoder(object):
+    """`ObservationWrapper._divide_6parts_and_encode` of a batch of frames."""
+
+    def __init__(self, interested_rear_dist=30, interested_front_dist=60):
+        self.interested_rear_dist = interested_rear_dist
+        self.interested_front_dist = interested_front_dist
+
+    def encode(self, ego_x, ego_y, ego_v, ego_heading, ego_length, ego_width, x, y, v, angle, length, width,
+               active):
+        """Encode one frame of each env.
+
+        Ego states are (nb_envs,) arrays, vehicle states (nb_envs, N) arrays.
+
+        Returns:
+            (nb_envs, 56) array.
+        """
+        nb_envs = len(ego_x)
+        ego_lane = lane_of(ego_y)
+        dist2center = ego_y - LANE_CENTER_Y[ego_lane]
+        if HAVE_NUMBA:
+            # inactive vehicles are put on a lane that is never interested
+            lane = np.where(active, lane_of(y), -LANE_NUMBER)
+            return encode_frames(np.empty((nb_envs, ENCODE_VEC_LEN)), ego_x, ego_y, ego_v, ego_heading,
+                                 float(ego_length), float(ego_width), dist2center, ego_lane, x, y, v, angle, length,
+                                 width, lane, float(self.interested_rear_dist), float(self.interested_front_dist))
+        ego_length, ego_width = np.full(nb_envs, ego_length, dtype=float), np.full(nb_envs, ego_width, dtype=float)
+        dx = x - ego_x[:, None]
+        relative_lane = lane_of(y) - ego_lane[:, None]
+        interested = active & (-self.interested_rear_dist < dx) & (dx < self.interested_front_dist) & on_road(y)
+        rows = np.arange(nb_envs)
+
+        def vehicle(idx):
+            return [dx[rows, idx], y[rows, idx] - ego_y, v[rows, idx], angle[rows, idx], length[rows, idx],
+                    width[rows, idx]]
+
+        def nearest(mask, key):
+            key = np.where(mask, key, np.inf)
+            idx = np.argmin(key, axis=1)
+            return idx, np.isfinite(key[rows, idx]), key
+
+        def encode_part(side, no_car_dy, has_lane, nb_front):
+            """nb_front front vehicles (farthest first) and one rear vehicle of the lane at `side`."""
+            lane_mask = interested & (relative_lane == side)
+            no_front = [np.full(nb_envs, self.interested_front_dist), no_car_dy, ego_v, 0, ego_length, ego_width]
+            no_rear = [np.full(nb_envs, -self.interested_rear_dist), no_car_dy, 0, 0, ego_length, ego_width]
+            no_road = [0, 0, ego_v, 0, ego_length, ego_width]
+            front = []
+            key = dx
+            for _ in range(nb_front):
+                idx, found, key = nearest(lane_mask & (dx > 0), key)
+                front.insert(0, [np.where(found, a, b) for a, b in zip(vehicle(idx), no_front)])
+                key = key.copy()
+                key[rows, idx] = np.inf
+            idx, found, _ = nearest(lane_mask & (dx < 0), -dx)
+            rear = [np.where(found, a, b) for a, b in zip(vehicle(idx), no_rear)]
+            features = sum(front, []) + rear
+            return [np.where(has_lane, feature, no_road[i % 6]) for i, feature in enumerate(features)]
+
+        left_y = LANE_CENTER_Y[np.minimum(ego_lane + 1, LANE_NUMBER - 1)] - ego_y
+        # ObservationWrapper fills an empty right lane with the center of the ego lane, kept for the same encoding
+        right_y = -dist2center
+        left = encode_part(1, left_y, ego_lane != LANE_NUMBER - 1, 2)
+        middle = encode_part(0, -dist2center, True, 1)
+        right = encode_part(-1, right_y, ego_lane != 0, 2)
+        dist2roadleft = (LANE_NUMBER - 1 - ego_lane) * LANE_WIDTH + LANE_WIDTH / 2 - dist2center
+        dist2roadright = ego_lane * LANE_WIDTH + LANE_WIDTH / 2 + dist2center
+        ego = [ego_v, ego_heading, ego_length, ego_width, dist2center, ego_lane, dist2roadleft, dist2roadright]
+        # left front (2 veh) + left rear + middle front + middle rear + right front (2 veh) + right rear + ego
+        features = left + middle + right + ego
+        return np.stack([np.broadcast_to(feature, (nb_envs,)) for feature in features], axis=1).astype(float)
+
+
+class BatchEndtoendEnv(VecEnv):
+    """`nb_envs` highway episodes of `ObservationWrapper(EndtoendEnv(...))` stepped together.
+
+    Takes (nb_envs, 3) env actions `[behavior, goal_delta_x, acc]` and returns (nb_envs, history_len, 56)
+    observations, (nb_envs,) rewards and dones and the infos of `EndtoendEnv.step`. Envs that are done are
+    reset right away, their last observation is kept in `info['terminal_observation']`.
+    """
+
+    def __init__(self, nb_envs, setting_path, plan_horizon=30, history_len=10, seed=None, init_state_sampler=None,
+                 start_gap=None):
+        VecEnv.__init__(self, nb_envs, None, None)
+        settings = Settings(file_path=setting_path + 'simulation_setting_file.xml')
+        self.step_length = settings.step_length
+        self.ego_length, self.ego_width = settings.car_length, settings.car_width
+        self.horizon = plan_horizon
+        self.history_len = history_len
+        map_path = '{}/Map/{}/'.format(__file__.rsplit('/', 1)[0], settings.map)
+        # the traffic is stepped on every tick, whatever the traffic frequency of the settings
+        init_traffic = TrafficData().load_traffic(setting_path)
+        self.traffic = BatchTraffic(nb_envs, map_path, init_traffic, self.step_length, self.ego_length, seed)
+        self.reference = BatchReference(self.step_length, plan_horizon)
+        self.encoder = BatchEncoder()
+        self.np_random = np.random.RandomState(seed)
+        # a LasVSim.init_states sampler for the resets, sample_init_state(np_random) if None
+        self.init_state_sampler = init_state_sampler
+        # init states too close to the scenario's vehicles are moved along their lane, see EndtoendEnv
+        self.start_index = None
+        if start_gap is not None:
+            self.start_index = VehicleIndex(init_traffic, min_gap=start_gap, ego_length=self.ego_length)
+        self.actions = None
+
+        self.ego_x, self.ego_y, self.ego_v, self.ego_heading = [np.zeros(nb_envs) for _ in range(4)]
+        self.final_goal_x = np.zeros(nb_envs)
+        # the frames of the last history_len ticks (EndtoendEnv.obs_deque) and the encoded observation
+        self.frames = np.zeros((nb_envs, history_len, ENCODE_VEC_LEN))
+        self.nb_frames = np.zeros(nb_envs, dtype=int)
+        self.encoded_obs = np.zeros((nb_envs, history_len, ENCODE_VEC_LEN))
+
+    def seed(self, seed=None):
+        self.np_random = np.random.RandomState(seed)
+        self.traffic.rng = np.random.RandomState(seed)
+        return [seed]
+
+    def reset(self):
+        self._reset_envs(np.arange(self.num_envs))
+        return self.encoded_obs.copy()
+
+    def _reset_envs(self, env_ids, init_states=None):
+        if init_states is None and self.init_state_sampler is not None:
+            init_states = self.init_state_sampler.sample(len(env_ids))
+        elif init_states is None:
+            init_states = [sample_init_state(self.np_random) for _ in env_ids]
+        x, y, v, heading = np.array(init_states, dtype=float).reshape(-1, 4).T
+        if self.start_index is not None:
+            free_x = self.start_index.free_x(x, lane_of(y))
+            x = np.where(on_road(y) & ~np.isnan(free_x), free_x, x)
+        self.ego_x[env_ids], self.ego_y[env_ids], self.ego_v[env_ids], self.ego_heading[env_ids] = x, y, v, heading
+        self.final_goal_x[env_ids] = x + GOAL_LENGTH
+        self.traffic.reset(env_ids, x, y, v)
+        frame = self._encode(env_ids)
+        self.frames[env_ids] = 0.
+        self.frames[env_ids, -1] = frame
+        self.nb_frames[env_ids] = 1
+        self.encoded_obs[env_ids] = 0.
+        self.encoded_obs[env_ids, -1] = frame
+
+    def _encode(self, env_ids):
+        t = self.traffic
+        angle = np.degrees(np.arctan2(t.vy[env_ids], np.maximum(t.v[env_ids], 0.1)))
+        return self.encoder.encode(self.ego_x[env_ids], self.ego_y[env_ids], self.ego_v[env_ids],
+                                   self.ego_heading[env_ids], self.ego_length, self.ego_width,
+                                   t.x[env_ids], t.y[env_ids], t.v[env_ids], angle, t.length[env_ids],
+                                   t.width[env_ids], t.active[env_ids])
+
+    def step_async(self, actions):
+        self.actions = np.asarray(actions, dtype=float).reshape(self.num_envs, 3)
+
+    def step_wait(self):
+        behavior, goal_delta_x, acc = self.actions.T
+        nb_envs, dt = self.num_envs, self.step_length / 1000
+        goal_y = LANE_CENTER_Y[lane_of(self.ego_y)] - (behavior - 1) * LANE_WIDTH
+        state_on_begin_of_step = [self.ego_x.copy(), self.ego_y.copy(), self.ego_v.copy(), self.ego_heading.copy()]
+        self.reference.reset_reference_path(
+            state_on_begin_of_step,
+            [self.ego_x + goal_delta_x, goal_y, np.clip(self.ego_v + dt * self.horizon * acc, 0, 33),
+             np.zeros(nb_envs)])
+
+        done_reward = np.zeros(nb_envs)
+        done_type = np.full(nb_envs, 3)
+        running = np.ones(nb_envs, dtype=bool)
+        nb_ticks = np.zeros(nb_envs, dtype=int)
+        new_frames = np.zeros((nb_envs, self.horizon, ENCODE_VEC_LEN))
+        t = self.traffic
+        for tick in range(self.horizon):
+            x, y, v, heading = self.reference.sim_step()
+            self.ego_x, self.ego_y, self.ego_v, self.ego_heading = [np.where(running, a, b) for a, b in zip(
+                (x, y, v, heading), (self.ego_x, self.ego_y, self.ego_v, self.ego_heading))]
+            t.set_egos(self.ego_x, self.ego_y, self.ego_v)
+            t.step()  # done envs are reset after the step anyway
+            ids = np.nonzero(running)[0]
+            new_frames[ids, tick] = self._encode(ids)
+            nb_ticks[ids] += 1
+
+            angle = np.degrees(np.arctan2(t.vy[ids], np.maximum(t.v[ids], 0.1)))
+            ego = self.ego_x[ids], self.ego_y[ids], self.ego_heading[ids], self.ego_length, self.ego_width
+            collision = collided(*(ego + (t.x[ids], t.y[ids], angle, t.length[ids], t.width[ids], t.active[ids])))
+            violation = road_violated(*ego)
+            complete = self.ego_x[ids] > self.final_goal_x[ids]
+            tick_done_type = np.where(violation, 0, np.where(collision, 1, np.where(complete, 2, 3)))
+            done_type[ids] = tick_done_type
+            done_reward[ids] += np.where(tick_done_type == 3, -1, np.where(tick_done_type == 2, 1000, -1000))
+            running[ids[tick_done_type != 3]] = False
+            if not running.any():
+                break
+
+        done = done_type != 3
+        state_on_end_of_step = [np.where(done, a, b) for a, b in zip(
+            state_on_begin_of_step, (self.ego_x, self.ego_y, self.ego_v, self.ego_heading))]
+        longitudinal_reward = np.where(done, 0., state_on_end_of_step[0] - state_on_begin_of_step[0])
+        lateral_reward = np.where(done, 0., -5 * np.abs(state_on_end_of_step[1] - goal_y))
+        velocity_reward = np.where(done, 0., 0.5 * (state_on_end_of_step[2] + state_on_begin_of_step[2]))
+        lane_change_reward = np.where(done, 0., 10. * np.isin(behavior, [0, 2]))
+        reward = done_reward + longitudinal_reward + lateral_reward + lane_change_reward + velocity_reward
+        self._update_observations(new_frames, nb_ticks)
+
+        infos = [dict(done_rew=done_reward[i],
+                      long_rew=longitudinal_reward[i],
+                      lat_rew=lateral_reward[i],
+                      vel_rew=velocity_reward[i],
+                      lane_change_reward=lane_change_reward[i],
+                      done_type=int(done_type[i]),
+                      state_on_end_of_step=[s[i] for s in state_on_end_of_step]) for i in range(nb_envs)]
+        done_ids = np.nonzero(done)[0]
+        for i in done_ids:
+            infos[i]['terminal_observation'] = self.encoded_obs[i].copy()
+        if len(done_ids):
+            self._reset_envs(done_ids)
+        return self.encoded_obs.copy(), reward, done, infos
+
+    def _update_observations(self, new_frames, nb_ticks):
+        """Append the new frames to the frame deques and shift the deques into the encoded observations, as
+        `ObservationWrapper.observation` does."""
+        history_len, rows = self.history_len, np.arange(self.num_envs)[:, None]
+        frames = np.concatenate([self.frames, new_frames], axis=1)
+        self.frames = frames[rows, nb_ticks[:, None] + np.arange(history_len)]
+        self.nb_frames = np.minimum(self.nb_frames + nb_ticks, history_len)
+        # the last history_len rows of encoded_obs followed by the nb_frames valid frames
+        positions = self.nb_frames[:, None] + np.arange(history_len)
+        positions = np.where(positions < history_len, positions, positions + history_len - self.nb_frames[:, None])
+        self.encoded_obs = np.concatenate([self.encoded_obs, self.frames], axis=1)[rows, positions]
+
+    def close(self):
+        pass
@@ -0,0 +1,216 @@
+# coding=utf-8
+"""Data module of LasVSim
+
+Records ego and traffic states of a simulation tick by tick and replays
+them offline without re-running SUMO.
+"""
+import glob
+import os
+import threading
+from operator import itemgetter
+try:
+    import queue
+except ImportError:  # python 2
+    import Queue as queue
+import numpy as np
+
+EGO_FIELDS = ['time', 'x', 'y', 'v', 'heading']
+VEHICLE_FIELDS = ['x', 'y', 'v', 'angle', 'length', 'width', 'lane_index']
+CHUNK_FILE_PATTERN = 'chunk_{:05d}.npz'
+_get_vehicle_fields = itemgetter(*VEHICLE_FIELDS)
+
+
+class _ChunkWriter(object):
+    """Background thread compressing finished chunks to disk in submission order."""
+
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name='lasvsim-data-writer')
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                break
+            file_path, columns = job
+            tmp_path = file_path + '.tmp.npz'
+            np.savez_compressed(tmp_path, **columns)
+            os.rename(tmp_path, file_path)  # readers never see a half written chunk
+
+    def submit(self, file_path, columns):
+        self.queue.put((file_path, columns))
+
+    def close(self, wait=True):
+        self.queue.put(None)
+        if wait:
+            self.thread.join()
+
+
+def _split_columns(ego, traffic, ticks):
+    columns = {'ego_' + name: ego[:ticks, i] for i, name in enumerate(EGO_FIELDS)}
+    columns.update({'traffic_' + name: traffic[:ticks, :, i] for i, name in enumerate(VEHICLE_FIELDS)})
+    return columns
+
+
+class Data(object):
+    """Per tick recorder of ego and traffic states.
+
+    States are appended into preallocated float32 chunks of `chunk_size` ticks.
+    When a chunk is full it is handed to a background writer which stores it
+    as a compressed npz file in `path`, so recording never blocks on disk I/O.
+    Without a `path`, chunks are kept in memory until `save` is called.
+
+    Attributes:
+        path: Directory the chunks are written to, None to keep them in memory.
+        chunk_size: Number of ticks per chunk.
+        ego_length: Ego vehicle's length, m.
+        ego_width: Ego vehicle's width, m.
+    """
+
+    def __init__(self, path=None, chunk_size=1000, ego_length=0., ego_width=0.):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.ego_length = ego_length
+        self.ego_width = ego_width
+        self.vehicle_count = None
+        self.tick_count = 0
+        self._chunk_index = 0
+        self._row = 0
+        self._ego = None
+        self._traffic = None
+        self._memory_chunks = []
+        self._writer = None
+
+    def append(self, self_status, vehicles):
+        """Record one tick.
+
+        Args:
+            self_status: [time, x, y, v, heading] of the ego vehicle.
+            vehicles: List of vehicle dicts as returned by `Traffic.get_vehicles`.
+        """
+        if self._ego is None:
+            self.vehicle_count = len(vehicles)
+            self._ego = np.empty((self.chunk_size, len(EGO_FIELDS)), dtype=np.float32)
+            self._traffic = np.empty((self.chunk_size, self.vehicle_count, len(VEHICLE_FIELDS)),
+                                     dtype=np.float32)
+        self._ego[self._row] = self_status
+        if self.vehicle_count:
+            self._traffic[self._row] = [_get_vehicle_fields(veh) for veh in vehicles]
+        self._row += 1
+        self.tick_count += 1
+        if self._row == self.chunk_size:
+            self._finish_chunk()
+
+    def _finish_chunk(self):
+        if self._row == 0:
+            return
+        if self.path is None:
+            self._memory_chunks.append(_split_columns(self._ego.copy(), self._traffic.copy(), self._row))
+        else:
+            self._submit(_split_columns(self._ego, self._traffic, self._row))
+            # the writer owns the filled buffers now, record into fresh ones
+            self._ego = np.empty_like(self._ego)
+            self._traffic = np.empty_like(self._traffic)
+        self._row = 0
+
+    def _submit(self, columns):
+        if self._writer is None:
+            if not os.path.exists(self.path):
+                os.makedirs(self.path)
+            self._writer = _ChunkWriter()
+            meta = dict(ego_length=self.ego_length, ego_width=self.ego_width,
+                        chunk_size=self.chunk_size)
+            np.savez(os.path.join(self.path, 'meta.npz'), **meta)
+        self._writer.submit(os.path.join(self.path, CHUNK_FILE_PATTERN.format(self._chunk_index)), columns)
+        self._chunk_index += 1
+
+    def close(self, wait=False):
+        """Flush the partially filled chunk and stop the writer.
+
+        Args:
+            wait: Block until every chunk is on disk.
+        """
+        self._finish_chunk()
+        if self._writer is not None:
+            self._writer.close(wait=wait)
+            self._writer = None
+
+    def save(self, path):
+        """Write everything recorded so far to `path` and wait for it to be on disk.
+
+        Raises:
+            ValueError: If the data is already written to another directory.
+        """
+        if self.path is None:
+            self.path = path
+            for columns in self._memory_chunks:
+                self._submit(columns)
+            self._memory_chunks = []
+        elif os.path.abspath(path) != os.path.abspath(self.path):
+            raise ValueError('data is written to {}, can not save it to {}'.format(self.path, path))
+        self.close(wait=True)
+
+    def export_csv(self, path):
+        """Export all recorded ticks as `path`/simulation_data.csv, one row per tick.
+
+        Data kept in memory is saved to `path` first, data streamed to disk is read from its directory.
+        """
+        if self.path is None:
+            self.save(path)
+        else:
+            self.close(wait=True)
+        if not os.path.exists(path):
+            os.makedirs(path)
+        Replay(self.path).export_csv(os.path.join(path, 'simulation_data.csv'))
+
+
+class Replay(object):
+    """Load data saved by `Data` for offline analysis and rendering.
+
+    Attributes:
+        ego: Dict of (ticks,) arrays keyed by `EGO_FIELDS`.
+        traffic: Dict of (ticks, vehicles) arrays keyed by `VEHICLE_FIELDS`.
+    """
+
+    def __init__(self, path):
+        chunk_files = sorted(glob.glob(os.path.join(path, 'chunk_*[0-9].npz')))
+        if not chunk_files:
+            raise IOError('No recorded simulation data found in {}'.format(path))
+        meta = np.load(os.path.join(path, 'meta.npz'))
+        self.ego_length = float(meta['ego_length'])
+        self.ego_width = float(meta['ego_width'])
+        chunks = [np.load(f) for f in chunk_files]
+        self.ego = {name: np.concatenate([c['ego_' + name] for c in chunks]) for name in EGO_FIELDS}
+        self.traffic = {name: np.concatenate([c['traffic_' + name] for c in chunks])
+                        for name in VEHICLE_FIELDS}
+
+    def __len__(self):
+        return len(self.ego['time'])
+
+    def get_frame(self, tick):
+        """Return (ego_dynamics, all_vehicles) of a tick in the format used by the env."""
+        ego_dynamics = dict(x=float(self.ego['x'][tick]),
+                            y=float(self.ego['y'][tick]),
+                            v=float(self.ego['v'][tick]),
+                            heading=float(self.ego['heading'][tick]),
+                            length=self.ego_length,
+                            width=self.ego_width)
+        rows = np.stack([self.traffic[name][tick] for name in VEHICLE_FIELDS], axis=1).tolist()
+        all_vehicles = [dict(zip(VEHICLE_FIELDS, row)) for row in rows]
+        for veh in all_vehicles:
+            veh['lane_index'] = int(veh['lane_index'])
+        return ego_dynamics, all_vehicles
+
+    def frames(self):
+        """Iterate over (ego_dynamics, all_vehicles) of every tick, e.g. for `endtoend_render.render_episode`."""
+        for tick in range(len(self)):
+            yield self.get_frame(tick)
+
+    def export_csv(self, file_path):
+        vehicle_count = self.traffic['x'].shape[1]
+        header = EGO_FIELDS + ['veh{}_{}'.format(i, name) for i in range(vehicle_count) for name in VEHICLE_FIELDS]
+        table = np.concatenate([np.stack([self.ego[name] for name in EGO_FIELDS], axis=1),
+                                np.stack([self.traffic[name] for name in VEHICLE_FIELDS], axis=2)
+                                .reshape(len(self), -1)], axis=1)
+        np.savetxt(file_path, table, fmt='%.3f', delimiter=',', header=','.join(header), comments='')
@@ -4,10 +4,11 @@ from gym.utils import seeding
 import math
 import numpy as np
 from LasVSim.endtoend_env_utils import shift_coordination, rotate_coordination
+from LasVSim.init_states import VehicleIndex
+from LasVSim.kernels import HAVE_NUMBA, encode_frame, vehicle_arrays
 from collections import deque
 from LasVSim.reference import Reference
-from matplotlib import pyplot as plt
-from matplotlib.pyplot import MultipleLocator
+from LasVSim.traffic_module import TrafficData
 from math import pi
 from collections import OrderedDict
 
@@ -15,6 +16,20 @@ from collections import OrderedDict
 
 
 
+def sample_init_state(np_random):
+    """Random ego init state [x, y, v, heading] on Map3_Highway_v2: x in [-800, 200), any of the 4 lanes, v in [0, 25).
+
+    Args:
+        np_random: A numpy RandomState (or Generator), e.g. the env's `np_random`.
+    """
+    x = np_random.uniform(0, 1) * 1000 - 800
+    lane = np_random.choice([0, 1, 2, 3])
+    y = [-150 - 3.75 * 7 / 2, -150 - 3.75 * 5 / 2, -150 - 3.75 * 3 / 2, -150 - 3.75 * 1 / 2][lane]
+    v = np_random.uniform(0, 1) * 25
+    heading = 0
+    return [x, y, v, heading]
+
+
 class EndtoendEnv(gym.Env):
     r"""The main OpenAI Gym class. It encapsulates an environment with
     arbitrary behind-the-scenes dynamics. An environment can be
@@ -42,14 +57,22 @@ class EndtoendEnv(gym.Env):
     """
 
     # Set this in SOME subclasses
-    # metadata = {'render.modes': []}
+    metadata = {'render.modes': ['human', 'rgb_array']}
     # reward_range = (-float('inf'), float('inf'))
     # spec = None
 
     # Set these in ALL subclasses
 
-    def __init__(self, setting_path, plan_horizon, history_len):
+    def __init__(self, setting_path, plan_horizon, history_len, record_frames=False, traffic_engine=None,
+                 init_state_sampler=None, start_gap=None):
         self.goal_length = 500  # episode ends on running 500m
+        # a LasVSim.init_states sampler for resets without init_state, sample_init_state(np_random) if None
+        self.init_state_sampler = init_state_sampler
+        # with start_gap, init states closer than start_gap (bumper to bumper, m) to a vehicle of the scenario
+        # on their lane are moved along it before the traffic is started
+        self.start_index = None
+        if start_gap is not None:
+            self.start_index = VehicleIndex(TrafficData().load_traffic(setting_path), min_gap=start_gap)
         self.horizon = plan_horizon
         self.setting_path = setting_path
         self.action_space = None
@@ -64,15 +87,20 @@ class EndtoendEnv(gym.Env):
         self.final_goal_x = None
         self.history_len = history_len
         self.obs_deque = deque(maxlen=history_len)
-        self.simulation = lasvsim.create_simulation(setting_path + 'simulation_setting_file.xml')
+        # traffic_engine='numpy' runs the SUMO-free traffic model of LasVSim.numpy_traffic
+        self.simulation = lasvsim.create_simulation(setting_path + 'simulation_setting_file.xml', traffic_engine)
         self.seed()  # call this for giving self.np_random
         self.reference = Reference(self.simulation.step_length, self.horizon)
         self.interested_rear_dist = 30
         self.interested_front_dist = 60  # if you change this, you should change process action too
         self.interested_vehicles_4lane_list = []
-        self.ego_dynamics_list = []
         self.interested_4lane_vehicles = []
-        self.all_vehicles_list = []
+        # per-tick frames of the last action, only read by render() and trajectory export,
+        # so they are recorded only when asked for (the encoder just needs obs_deque)
+        self.record_frames = record_frames
+        self.ego_dynamics_list = deque(maxlen=plan_horizon)
+        self.all_vehicles_list = deque(maxlen=plan_horizon)
+        self.rasterizer = None  # built on first render(mode='rgb_array')
 
 
 
@@ -102,8 +130,8 @@ class EndtoendEnv(gym.Env):
             done (bool): whether the episode has ended, in which case further step() calls will return undefined results
             info (dict): contains auxiliary diagnostic information (helpful for debugging, and sometimes learning)
         """
-        self.all_vehicles_list = []
-        self.ego_dynamics_list = []
+        self.all_vehicles_list.clear()
+        self.ego_dynamics_list.clear()
         behavior, goal_delta_x, acc = action
         goal_y = ObservationWrapper.laneindex2centery(self.ego_road_related_info['egolane_index']) - (behavior - 1) * 3.75
         goal_delta_v = self.simulation.step_length/1000 * self.horizon * acc
@@ -145,8 +173,9 @@ class EndtoendEnv(gym.Env):
 
             done, done_type = self._judge_done()
             reward += self.compute_done_reward(done_type)
-            self.ego_dynamics_list.append(self.ego_dynamics)
-            self.all_vehicles_list.append(self.all_vehicles)
+            if self.record_frames:
+                self.ego_dynamics_list.append(self.ego_dynamics)
+                self.all_vehicles_list.append(self.all_vehicles)
 
             if done:
                 break
@@ -174,23 +203,17 @@ class EndtoendEnv(gym.Env):
 
     def reset(self, **kwargs):  # if not assign 'init_state', it will generate random init state
         #  clear deque
-        def random_init_state(flag=True):
-            init_state = [-800, -150 - 3.75 * 5 / 2, 5, 0]
-            if flag:
-                x = self.np_random.uniform(0, 1) * 1000 - 800
-                lane = self.np_random.choice([0, 1, 2, 3])
-                y_fn = lambda lane: \
-                [-150 - 3.75 * 7 / 2, -150 - 3.75 * 5 / 2, -150 - 3.75 * 3 / 2, -150 - 3.75 * 1 / 2][lane]
-                y = y_fn(lane)
-                v = self.np_random.uniform(0, 1) * 25
-                heading = 0
-                init_state = [x, y, v, heading]
-            return init_state
         self.obs_deque.clear()
+        self.all_vehicles_list.clear()
+        self.ego_dynamics_list.clear()
         if 'init_state' in kwargs:
             self.init_state = kwargs['init_state']
+        elif self.init_state_sampler is not None:
+            self.init_state = self.init_state_sampler.sample()
         else:
-            self.init_state = random_init_state()
+            self.init_state = sample_init_state(self.np_random)
+        if self.start_index is not None:
+            self.init_state = self.start_index.place(self.init_state)
 
         self.final_goal_x = self.init_state[0] + self.goal_length
         lasvsim.reset_simulation(overwrite_settings={'init_state': self.init_state},
@@ -205,7 +228,28 @@ class EndtoendEnv(gym.Env):
     def is_in_interested_area(self, ego_x, pos_x, pos_y):
         return True if ego_x - self.interested_rear_dist < pos_x < ego_x + self.interested_front_dist and -150 - 3.75 * 4 < pos_y < -150 else False
 
+    def enable_frame_recording(self, flag=True):
+        """Turn on (or off) recording of the per-tick frames used by render()."""
+        self.record_frames = flag
+        if not flag:
+            self.all_vehicles_list.clear()
+            self.ego_dynamics_list.clear()
+
     def render(self, mode='human', **kwargs):
+        """Render the ticks of the last step.
+
+        mode='human' draws them one by one in a matplotlib window, mode='rgb_array' rasterizes
+        them offscreen and returns a (ticks, height, width, 3) uint8 array.
+        """
+        if not self.record_frames:
+            # nothing recorded yet, start recording so that the next step can be rendered
+            self.enable_frame_recording()
+        if mode == 'rgb_array':
+            if self.rasterizer is None:
+                from LasVSim.endtoend_render import HighwayRasterizer
+                self.rasterizer = HighwayRasterizer(self.interested_rear_dist, self.interested_front_dist)
+            return self.rasterizer.draw_frames(self.ego_dynamics_list, self.all_vehicles_list,
+                                               self.reference.horizon_path_points)
         self.interested_vehicles_4lane_list = []
         for index, all_vehicles in enumerate(self.all_vehicles_list):
             self.interested_4lane_vehicles = [veh for veh in all_vehicles
@@ -259,6 +303,7 @@ class EndtoendEnv(gym.Env):
                        }]
         points=[{'x':10,'y':4},{'x':-7,'y':4}]
         """
+        from matplotlib import pyplot as plt  # only needed for rendering, kept out of the env import
         plt.cla()
         plt.title("Render")
         # x_major_locator = MultipleLocator(10)  # 把x轴的刻度间隔设置为5，并存在变量里
@@ -420,13 +465,22 @@ class ObservationWrapper(gym.Wrapper):
                                                                       ego_dynamics['y'], ego_dynamics['v'], ego_dynamics['heading'], ego_dynamics['length'], ego_dynamics['width']
             dist2current_lane_center, egolane_index = ego_road_related_info['dist2current_lane_center'],\
                                                       ego_road_related_info['egolane_index']
-            self.interested_vehicles = [veh for veh in all_vehicles
-                                              if self.is_in_interested_area(ego_x, veh['x'], veh['y'])
-                                              and veh['lane_index'] in self._interested_lane_index(egolane_index)]
-            current_timestep_info = self._divide_6parts_and_encode(ego_x, ego_y, ego_v, ego_heading, ego_length,
-                                                                   ego_width, dist2current_lane_center, egolane_index)
+            if HAVE_NUMBA:
+                current_timestep_info = encode_frame(np.empty(self.encode_vec_len), ego_x, ego_y, ego_v, ego_heading,
+                                                     ego_length, ego_width, dist2current_lane_center, egolane_index,
+                                                     *vehicle_arrays(all_vehicles), self.interested_rear_dist,
+                                                     self.interested_front_dist)
+            else:
+                self.interested_vehicles = [veh for veh in all_vehicles
+                                                  if self.is_in_interested_area(ego_x, veh['x'], veh['y'])
+                                                  and veh['lane_index'] in self._interested_lane_index(egolane_index)]
+                current_timestep_info = self._divide_6parts_and_encode(ego_x, ego_y, ego_v, ego_heading, ego_length,
+                                                                       ego_width, dist2current_lane_center,
+                                                                       egolane_index)
             self.encoded_obs = self.encoded_obs[1:]
             self.encoded_obs = np.append(self.encoded_obs, current_timestep_info.reshape((1, self.encode_vec_len)), axis=0)
+        # every call builds a new array and never writes to it again, so the agents may keep it without a copy
+        self.encoded_obs.flags.writeable = False
         return self.encoded_obs  # [time_step, 6*8 + 8]
 
     def _interested_lane_index(self, ego_lane_index):
@@ -0,0 +1,168 @@
+import math
+import os
+import struct
+import zlib
+import numpy as np
+
+ROAD_LEFT_Y = -150  # y of the left road edge of Map3_Highway_v2, coordination 2
+LANE_WIDTH = 3.75
+LANE_NUM = 4
+
+BACKGROUND_COLOR = (255, 255, 255)
+ROAD_COLOR = (235, 235, 235)
+LANE_COLOR = (0, 0, 255)
+EGO_COLOR = (255, 0, 0)
+VEHICLE_COLOR = (0, 0, 255)
+PATH_COLOR = (255, 0, 0)
+
+
+class HighwayRasterizer(object):
+    """Rasterize the highway scene around the ego car straight into a numpy image.
+
+    The view follows the ego car in x (from `rear_dist` behind to `front_dist` ahead of it)
+    and covers the whole road in y, same as `EndtoendEnv._render`, but without matplotlib,
+    so frames can be produced headless and far faster than real time.
+
+    Args:
+        rear_dist: Visible distance behind the ego car, m.
+        front_dist: Visible distance in front of the ego car, m.
+        pixels_per_meter: Image resolution.
+        margin: Visible distance beyond each road edge, m.
+        dash_length: Length of a lane line dash (and of the gap between two dashes), m.
+    """
+
+    def __init__(self, rear_dist=30, front_dist=60, pixels_per_meter=8, margin=2., dash_length=3.):
+        self.rear_dist = rear_dist
+        self.front_dist = front_dist
+        self.ppm = pixels_per_meter
+        self.dash_length = dash_length
+        self.y_max = ROAD_LEFT_Y + margin
+        self.y_min = ROAD_LEFT_Y - LANE_WIDTH * LANE_NUM - margin
+        self.width = int(round((rear_dist + front_dist) * self.ppm))
+        self.height = int(round((self.y_max - self.y_min) * self.ppm))
+
+        # pixel center coordinates, x relative to the ego car, y in coordination 2
+        self._col_x = (np.arange(self.width) + 0.5) / self.ppm - rear_dist
+        self._row_y = self.y_max - (np.arange(self.height) + 0.5) / self.ppm
+
+        # static part of the background: road surface, road edges and lane line rows
+        self._background = np.empty((self.height, self.width, 3), dtype=np.uint8)
+        self._background[:] = BACKGROUND_COLOR
+        road_rows = (self._row_y <= ROAD_LEFT_Y) & (self._row_y >= ROAD_LEFT_Y - LANE_WIDTH * LANE_NUM)
+        self._background[road_rows] = ROAD_COLOR
+        for edge_y in [ROAD_LEFT_Y, ROAD_LEFT_Y - LANE_WIDTH * LANE_NUM]:
+            self._background[self._y2row(edge_y)] = LANE_COLOR
+        self._lane_rows = [self._y2row(ROAD_LEFT_Y - LANE_WIDTH * i) for i in range(1, LANE_NUM)]
+
+    def _y2row(self, y):
+        return int(np.clip((self.y_max - y) * self.ppm, 0, self.height - 1))
+
+    def _x2col(self, x):
+        return int(np.clip((x + self.rear_dist) * self.ppm, 0, self.width - 1))
+
+    def _fill_rectangle(self, image, center_x, center_y, length, width, angle, color):
+        """Fill a rotated rectangle, center_x relative to the ego car, angle in deg."""
+        half_diag = math.sqrt(length ** 2 + width ** 2) / 2
+        col_min = self._x2col(center_x - half_diag)
+        col_max = self._x2col(center_x + half_diag) + 1
+        row_min = self._y2row(center_y + half_diag)
+        row_max = self._y2row(center_y - half_diag) + 1
+        if col_max - col_min <= 1 or row_max - row_min <= 1:
+            return
+        dx = self._col_x[np.newaxis, col_min:col_max] - center_x
+        dy = self._row_y[row_min:row_max, np.newaxis] - center_y
+        cos_a = math.cos(angle * math.pi / 180)
+        sin_a = math.sin(angle * math.pi / 180)
+        inside = (np.abs(dx * cos_a + dy * sin_a) <= length / 2) & (np.abs(-dx * sin_a + dy * cos_a) <= width / 2)
+        image[row_min:row_max, col_min:col_max][inside] = color
+
+    def draw_frame(self, ego_dynamics, all_vehicles, path_points=(), out=None):
+        """Rasterize one simulation tick.
+
+        Args:
+            ego_dynamics: Ego state dict as returned by `lasvsim.get_ego_info()[0]`.
+            all_vehicles: List of vehicle dicts as returned by `lasvsim.get_all_objects()`.
+            path_points: List of path point dicts with 'x' and 'y' keys.
+            out: Optional (height, width, 3) uint8 array to draw into.
+
+        Returns:
+            A (height, width, 3) uint8 image.
+        """
+        image = out if out is not None else np.empty((self.height, self.width, 3), dtype=np.uint8)
+        image[:] = self._background
+        ego_x = ego_dynamics['x']
+
+        # dashed lane lines move with the road
+        dashes = np.mod(self._col_x + ego_x, 2 * self.dash_length) < self.dash_length
+        for row in self._lane_rows:
+            image[row, dashes] = LANE_COLOR
+
+        for veh in all_vehicles:
+            rel_x = veh['x'] - ego_x
+            if -self.rear_dist - veh['length'] < rel_x < self.front_dist + veh['length'] and \
+                    self.y_min - veh['length'] < veh['y'] < self.y_max + veh['length']:
+                self._fill_rectangle(image, rel_x, veh['y'], veh['length'], veh['width'], veh['angle'],
+                                     VEHICLE_COLOR)
+        self._fill_rectangle(image, 0., ego_dynamics['y'], ego_dynamics['length'], ego_dynamics['width'],
+                             ego_dynamics['heading'], EGO_COLOR)
+
+        for point in path_points:
+            col = int((point['x'] - ego_x + self.rear_dist) * self.ppm)
+            row = int((self.y_max - point['y']) * self.ppm)
+            if 0 <= col < self.width and 0 <= row < self.height:
+                image[max(row - 1, 0):row + 2, max(col - 1, 0):col + 2] = PATH_COLOR
+        return image
+
+    def draw_frames(self, ego_dynamics_list, all_vehicles_list, path_points=()):
+        """Rasterize a sequence of ticks into a (T, height, width, 3) uint8 array."""
+        assert len(ego_dynamics_list) == len(all_vehicles_list)
+        images = np.empty((len(ego_dynamics_list), self.height, self.width, 3), dtype=np.uint8)
+        for index, (ego_dynamics, all_vehicles) in enumerate(zip(ego_dynamics_list, all_vehicles_list)):
+            self.draw_frame(ego_dynamics, all_vehicles, path_points, out=images[index])
+        return images
+
+
+def render_episode(frames, rasterizer=None):
+    """Offscreen rendering of a saved episode.
+
+    Args:
+        frames: Iterable of (ego_dynamics, all_vehicles) or (ego_dynamics, all_vehicles, path_points) tuples.
+        rasterizer: A `HighwayRasterizer`, a default one is built if None.
+
+    Yields:
+        One (height, width, 3) uint8 image per frame.
+    """
+    if rasterizer is None:
+        rasterizer = HighwayRasterizer()
+    for frame in frames:
+        yield rasterizer.draw_frame(*frame)
+
+
+def _png_bytes(image):
+    height, width, _ = image.shape
+    raw = np.empty((height, width * 3 + 1), dtype=np.uint8)
+    raw[:, 0] = 0  # no filter
+    raw[:, 1:] = image.reshape(height, width * 3)
+
+    def chunk(tag, data):
+        return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff)
+    return b'\x89PNG\r\n\x1a\n' + \
+        chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)) + \
+        chunk(b'IDAT', zlib.compress(raw.tobytes(), 1)) + \
+        chunk(b'IEND', b'')
+
+
+def save_frames(images, dir_path, prefix='frame'):
+    """Write images as a numbered png sequence, e.g. for `ffmpeg -i frame_%05d.png out.mp4`.
+
+    Returns:
+        The number of frames written.
+    """
+    if not os.path.exists(dir_path):
+        os.makedirs(dir_path)
+    count = 0
+    for index, image in enumerate(images):
+        with open(os.path.join(dir_path, '{}_{:05d}.png'.format(prefix, index)), 'wb') as f:
+            f.write(_png_bytes(image))
+        count += 1
+    return count
@@ -0,0 +1,248 @@
+"""Samplers of the episode init states [x, y, v, heading] of the ego vehicle on the lower straight of
+Map3_Highway_v2.
+
+A sampler draws its states in precomputed batches from its own numpy Generator, seeded by (seed, worker_id):
+parallel workers sharing a seed get distinct but reproducible streams. Pass one to `EndtoendEnv`,
+`BatchEndtoendEnv` or `DQNAgent.fit_hrl`/`test_hrl`, e.g.
+
+    sampler = DensityCurriculumSampler(TrafficData().load_traffic(setting_path), difficulty=0., seed=0,
+                                       worker_id=rank)
+    env = EndtoendEnv(setting_path, plan_horizon=30, history_len=10, init_state_sampler=sampler)
+    ...
+    sampler.set_difficulty(0.5)  # denser starts from the next reset on
+"""
+import numpy as np
+
+from LasVSim.numpy_traffic import (EGO_LENGTH, KEY_STRIDE, LANE_CENTER_Y, LANE_NUMBER, ROAD_X_START, ROAD_X_END,
+                                   lane_of, on_road)
+
+INIT_X_RANGE = (-800., 200.)
+INIT_V_RANGE = (0., 25.)
+
+
+def straight_vehicles(init_traffic):
+    """Shape center x and lane of the vehicles of a scenario's initial traffic that are on the lower straight.
+
+    Args:
+        init_traffic: Initial traffic of the scenario, as loaded by `traffic_module.TrafficData.load_traffic`.
+
+    Returns:
+        x, lane: Arrays of the vehicles.
+    """
+    rows = [(state[66][0] - state[68] / 2, state[66][1]) for state in (init_traffic or {}).values()
+            if _on_straight(state)]
+    rows = np.array(rows, dtype=float).reshape(-1, 2)
+    return rows[:, 0], lane_of(rows[:, 1])
+
+
+class InitStateSampler(object):
+    """Base class of the init state samplers, subclasses implement `sample_batch`.
+
+    Args:
+        seed: Seed shared by all workers, None for fresh entropy.
+        worker_id: Index of the worker (process) using the sampler.
+        batch_size: Number of states precomputed at once.
+    """
+
+    def __init__(self, seed=None, worker_id=0, batch_size=256):
+        self.seed = seed
+        self.worker_id = worker_id
+        self.batch_size = batch_size
+        self.rng = np.random.Generator(np.random.PCG64(np.random.SeedSequence(seed, spawn_key=(worker_id,))))
+        self.nb_sampled = 0
+        self._batch = np.zeros((0, 4))
+        self._next = 0
+
+    def sample(self, nb_states=None):
+        """Next init state, a list [x, y, v, heading], or the next `nb_states` of them as a (nb_states, 4) array."""
+        if nb_states is None:
+            return self.sample(1)[0].tolist()
+        states = []
+        while nb_states > 0:
+            if self._next >= len(self._batch):
+                self._batch = self.sample_batch(self.batch_size)
+                self._next = 0
+            chunk = self._batch[self._next:self._next + nb_states]
+            self._next += len(chunk)
+            self.nb_sampled += len(chunk)
+            nb_states -= len(chunk)
+            states.append(chunk)
+        return np.concatenate(states) if states else np.zeros((0, 4))
+
+    def sample_batch(self, nb_states):
+        """(nb_states, 4) array of new init states [x, y, v, heading], use `sample` to draw states."""
+        raise NotImplementedError()
+
+    def _discard_batch(self):
+        """Drop the precomputed states, e.g. after the distribution changed."""
+        self._batch = np.zeros((0, 4))
+        self._next = 0
+
+    def _states(self, x, lane, nb_states):
+        v = self.rng.uniform(INIT_V_RANGE[0], INIT_V_RANGE[1], nb_states)
+        return np.stack([x, LANE_CENTER_Y[lane], v, np.zeros(nb_states)], axis=1)
+
+
+class UniformInitStateSampler(InitStateSampler):
+    """x uniform in INIT_X_RANGE, any lane, v uniform in INIT_V_RANGE, heading 0: the distribution of
+    `endtoend.sample_init_state`."""
+
+    def sample_batch(self, nb_states):
+        x = self.rng.uniform(INIT_X_RANGE[0], INIT_X_RANGE[1], nb_states)
+        lane = self.rng.integers(LANE_NUMBER, size=nb_states)
+        return self._states(x, lane, nb_states)
+
+
+class DensityCurriculumSampler(InitStateSampler):
+    """Init states ordered by the density of the scenario's traffic around them, for curricula from empty to
+    dense roads.
+
+    INIT_X_RANGE is cut into cells of `cell_length` on every lane. The density of a cell is the number of
+    vehicles of the initial traffic on its lane and the adjacent lanes within `radius` of the cell center.
+    With difficulty d, states are drawn uniformly from the cells whose density is at most the d-quantile of
+    all cells: 0 keeps the emptiest cells, 1 samples like `UniformInitStateSampler`.
+
+    Args:
+        init_traffic: Initial traffic of the scenario, as loaded by `traffic_module.TrafficData.load_traffic`.
+        difficulty: Difficulty in [0, 1], or a function of the number of states sampled so far returning it,
+            evaluated whenever a new batch is precomputed.
+        radius: Half length of the counted area, m.
+        cell_length: Length of the cells, m.
+        seed, worker_id, batch_size: See `InitStateSampler`.
+    """
+
+    def __init__(self, init_traffic, difficulty=1., radius=50., cell_length=1., seed=None, worker_id=0,
+                 batch_size=256):
+        super(DensityCurriculumSampler, self).__init__(seed, worker_id, batch_size)
+        self.cell_length = cell_length
+        self.cell_x = np.arange(INIT_X_RANGE[0], INIT_X_RANGE[1], cell_length)
+        vehicle_x, vehicle_lane = straight_vehicles(init_traffic)
+        centers = self.cell_x + cell_length / 2
+        # (lane, cell) number of vehicles around the cell center on each lane
+        per_lane = np.zeros((LANE_NUMBER, len(centers)), dtype=int)
+        for lane in range(LANE_NUMBER):
+            x = np.sort(vehicle_x[vehicle_lane == lane])
+            per_lane[lane] = np.searchsorted(x, centers + radius) - np.searchsorted(x, centers - radius)
+        padded = np.pad(per_lane, ((1, 1), (0, 0)))
+        self.density = padded[:-2] + padded[1:-1] + padded[2:]
+        self.difficulty = difficulty
+
+    def set_difficulty(self, difficulty):
+        """Use `difficulty` (a value or a schedule, see the class doc) from the next sample on."""
+        self.difficulty = difficulty
+        self._discard_batch()
+
+    def allowed_cells(self):
+        """Flat (lane, cell) indices of the cells states are currently drawn from."""
+        difficulty = self.difficulty(self.nb_sampled) if callable(self.difficulty) else self.difficulty
+        threshold = np.quantile(self.density, float(np.clip(difficulty, 0., 1.)))
+        return np.flatnonzero(self.density <= threshold)
+
+    def sample_batch(self, nb_states):
+        cells = self.rng.choice(self.allowed_cells(), nb_states)
+        lane, cell = np.unravel_index(cells, self.density.shape)
+        x = self.cell_x[cell] + self.rng.uniform(0., self.cell_length, nb_states)
+        return self._states(x, lane, nb_states)
+
+
+class VehicleIndex(object):
+    """Vehicles of a scenario's initial traffic sorted by lane and x, for start placement queries in O(log n).
+
+    Start states whose bumper gap to a vehicle on their lane is below `min_gap` collide or brake hard right
+    away, `free_x` moves them to the closest x with enough room before the traffic is started.
+
+    Args:
+        init_traffic: Initial traffic of the scenario, as loaded by `traffic_module.TrafficData.load_traffic`.
+        min_gap: Smallest bumper to bumper gap of a free start, m.
+        ego_length: Length of the ego vehicle, m.
+        x_range: Range of the free starts.
+    """
+
+    def __init__(self, init_traffic, min_gap=20., ego_length=EGO_LENGTH, x_range=(ROAD_X_START, ROAD_X_END)):
+        self.min_gap = min_gap
+        self.ego_length = ego_length
+        self.x_range = x_range
+        init_traffic = init_traffic or {}
+        # vehicles of the lower straight by lane and center x, for `gaps`
+        center_x, lane = straight_vehicles(init_traffic)
+        half_length = np.array([state[68] / 2 for state in init_traffic.values()
+                                if _on_straight(state)], dtype=float)
+        key = lane * KEY_STRIDE + (center_x - ROAD_X_START)
+        order = np.argsort(key, kind='stable')
+        self.key, self.x, self.half_length = key[order], center_x[order], half_length[order]
+        self.lane = lane[order]
+        self._build_free_intervals()
+
+    def _build_free_intervals(self):
+        """Sorted (lane keyed) ranges of ego center x with at least min_gap to the vehicles of the lane."""
+        room = self.ego_length / 2 + self.min_gap
+        starts, ends, lanes = [], [], []
+        for lane in range(LANE_NUMBER):
+            on_lane = self.lane == lane
+            x, half_length = self.x[on_lane], self.half_length[on_lane]
+            # a long vehicle may block past the shorter ones ahead of it
+            blocked_from = np.minimum.accumulate((x - half_length - room)[::-1])[::-1]
+            blocked_to = np.maximum.accumulate(x + half_length + room)
+            start = np.concatenate([[self.x_range[0]], blocked_to])
+            end = np.concatenate([blocked_from, [self.x_range[1]]])
+            start, end = np.maximum(start, self.x_range[0]), np.minimum(end, self.x_range[1])
+            keep = start <= end
+            starts.append(start[keep])
+            ends.append(end[keep])
+            lanes.append(np.full(int(keep.sum()), lane))
+        self.free_lane = np.concatenate(lanes)
+        self.free_start, self.free_end = np.concatenate(starts), np.concatenate(ends)
+        self.free_end_key = self.free_lane * KEY_STRIDE + (self.free_end - ROAD_X_START)
+
+    def gaps(self, x, lane):
+        """Bumper to bumper gaps of egos at center x on `lane` (arrays or scalars) to the vehicles of the lane
+        nearest ahead and behind, inf where there is none."""
+        x, lane = np.asarray(x, dtype=float), np.asarray(lane, dtype=int)
+        if len(self.key) == 0:
+            return np.full(x.shape, np.inf), np.full(x.shape, np.inf)
+        query = lane * KEY_STRIDE + (x - ROAD_X_START)
+        ahead = np.searchsorted(self.key, query, side='right')
+        behind = np.searchsorted(self.key, query, side='left') - 1
+        has_ahead = ahead < len(self.key)
+        has_behind = behind >= 0
+        ahead, behind = np.where(has_ahead, ahead, 0), np.where(has_behind, behind, 0)
+        ego_half = self.ego_length / 2
+        front = np.where(has_ahead & (self.lane[ahead] == lane),
+                         self.x[ahead] - self.half_length[ahead] - x - ego_half, np.inf)
+        rear = np.where(has_behind & (self.lane[behind] == lane),
+                        x - ego_half - self.x[behind] - self.half_length[behind], np.inf)
+        return front, rear
+
+    def free_x(self, x, lane):
+        """Closest center x to `x` on `lane` (arrays or scalars) with at least min_gap to the vehicles of the
+        lane, `x` itself if it has, nan if the lane has no room within x_range."""
+        x, lane = np.asarray(x, dtype=float), np.asarray(lane, dtype=int)
+        if len(self.free_end_key) == 0:
+            return np.full(x.shape, np.nan)
+        query = lane * KEY_STRIDE + (x - ROAD_X_START)
+        last = len(self.free_end_key) - 1
+        # first range ending at or after x, and the one before it
+        after = np.searchsorted(self.free_end_key, query, side='left')
+        before = np.maximum(after - 1, 0)
+        after = np.minimum(after, last)
+        after_x = np.where(self.free_lane[after] == lane, np.maximum(self.free_start[after], x), np.nan)
+        after_x = np.where(self.free_end[after] >= x, after_x, np.nan)
+        before_x = np.where((self.free_lane[before] == lane) & (self.free_end[before] < x),
+                            self.free_end[before], np.nan)
+        closest = np.where(np.abs(after_x - x) <= np.abs(x - before_x), after_x, before_x)
+        return np.where(np.isnan(after_x), before_x, np.where(np.isnan(before_x), after_x, closest))
+
+    def place(self, init_state):
+        """`init_state` [x, y, v, heading] moved along its lane to `free_x`, unchanged off the lower straight
+        or on a lane without room."""
+        x, y, v, heading = init_state
+        if not on_road(y):
+            return list(init_state)
+        x_free = float(self.free_x(x, lane_of(y)))
+        return [x if np.isnan(x_free) else x_free, y, v, heading]
+
+
+def _on_straight(state):
+    (x, y), heading, length = state[66], state[67], state[68]
+    # positions are front bumper centers, SUMO angle 90 is +x
+    return ROAD_X_START < x - length / 2 < ROAD_X_END and on_road(y) and abs(heading - 90) < 10
@@ -0,0 +1,149 @@
+"""Observation encoding kernels of the simulation hot path.
+
+The kernels are plain Python loops over numpy arrays, compiled with Numba when it is installed. Without Numba
+(or with the environment variable LASVSIM_KERNELS=python) their callers keep their numpy or Python code, see
+`HAVE_NUMBA`. Numba takes a few hundred ms to import, so it is only imported by the first kernel call.
+"""
+import functools
+import importlib.util
+import itertools
+import operator
+import os
+
+import numpy as np
+
+HAVE_NUMBA = (os.environ.get('LASVSIM_KERNELS', 'numba') != 'python'
+              and importlib.util.find_spec('numba') is not None)
+
+LANE_NUMBER = 4
+LANE_WIDTH = 3.75
+ROAD_LEFT_Y = -150.0
+_VEHICLE_FIELDS = operator.itemgetter('x', 'y', 'v', 'angle', 'length', 'width', 'lane_index')
+
+
+_kernels = []  # python functions of the kernels, compiled together on the first kernel call
+
+
+def jit(fn):
+    """Compile `fn` with Numba on the first kernel call if it is available, return it unchanged otherwise."""
+    if not HAVE_NUMBA:
+        return fn
+    _kernels.append(fn)
+
+    @functools.wraps(fn)
+    def call(*args):
+        _compile_kernels()
+        return globals()[fn.__name__](*args)
+    return call
+
+
+def _compile_kernels():
+    """Replace all kernels by their Numba dispatchers, so that kernels calling each other are compiled."""
+    if _kernels:
+        from numba import njit
+        for fn in _kernels:
+            globals()[fn.__name__] = njit(cache=True)(fn)
+        del _kernels[:]
+
+
+@jit
+def _write_vehicle(out, offset, dx, dy, v, angle, length, width):
+    out[offset] = dx
+    out[offset + 1] = dy
+    out[offset + 2] = v
+    out[offset + 3] = angle
+    out[offset + 4] = length
+    out[offset + 5] = width
+
+
+@jit
+def encode_frame(out, ego_x, ego_y, ego_v, ego_heading, ego_length, ego_width, dist2center, ego_lane,
+                 x, y, v, angle, length, width, lane, interested_rear_dist, interested_front_dist):
+    """`ObservationWrapper._divide_6parts_and_encode` of one frame, vehicles given as arrays.
+
+    Writes [left front (2 veh, farthest first), left rear, middle front, middle rear, right front (2 veh),
+    right rear, ego] into `out`, a (56,) array.
+    """
+    # nearest and second nearest vehicle of left front, left rear, middle front, middle rear, right front,
+    # right rear; -1 if there is none
+    nearest = np.full(6, -1)
+    second = np.full(6, -1)
+    for i in range(len(x)):
+        if not (ego_x - interested_rear_dist < x[i] < ego_x + interested_front_dist
+                and ROAD_LEFT_Y - LANE_NUMBER * LANE_WIDTH < y[i] < ROAD_LEFT_Y):
+            continue
+        if lane[i] == ego_lane + 1 and ego_lane != LANE_NUMBER - 1:
+            part = 0
+        elif lane[i] == ego_lane:
+            part = 2
+        elif lane[i] == ego_lane - 1 and ego_lane != 0:
+            part = 4
+        else:
+            continue
+        if x[i] < ego_x:
+            part += 1
+        elif x[i] == ego_x:
+            continue
+        # the distance grows with the key, ties keep the earlier vehicle first like the stable sort
+        key = abs(x[i] - ego_x)
+        if nearest[part] < 0 or key < abs(x[nearest[part]] - ego_x):
+            second[part] = nearest[part]
+            nearest[part] = i
+        elif second[part] < 0 or key < abs(x[second[part]] - ego_x):
+            second[part] = i
+
+    center_y = ROAD_LEFT_Y - (2 * (LANE_NUMBER - ego_lane) - 1) * LANE_WIDTH / 2
+    left_center_y = center_y + LANE_WIDTH
+    for part, offset in [(0, 6), (1, 12), (2, 18), (3, 24), (4, 36), (5, 42)]:
+        has_road = not ((part < 2 and ego_lane == LANE_NUMBER - 1) or (part >= 4 and ego_lane == 0))
+        front = part % 2 == 0
+        # empty lanes on the left are at the left lane center, the others at the ego lane center
+        no_car_dy = -dist2center if part in (2, 3) else (left_center_y if part < 2 else center_y) - ego_y
+        if front and part != 2:
+            # second nearest vehicle comes first
+            i = second[part]
+            if not has_road:
+                _write_vehicle(out, offset - 6, 0., 0., ego_v, 0., ego_length, ego_width)
+            elif i < 0:
+                _write_vehicle(out, offset - 6, interested_front_dist, no_car_dy, ego_v, 0., ego_length, ego_width)
+            else:
+                _write_vehicle(out, offset - 6, x[i] - ego_x, y[i] - ego_y, v[i], angle[i], length[i], width[i])
+        i = nearest[part]
+        if not has_road:
+            _write_vehicle(out, offset, 0., 0., ego_v, 0., ego_length, ego_width)
+        elif i < 0 and front:
+            _write_vehicle(out, offset, interested_front_dist, no_car_dy, ego_v, 0., ego_length, ego_width)
+        elif i < 0:
+            _write_vehicle(out, offset, -interested_rear_dist, no_car_dy, 0., 0., ego_length, ego_width)
+        else:
+            _write_vehicle(out, offset, x[i] - ego_x, y[i] - ego_y, v[i], angle[i], length[i], width[i])
+
+    out[48] = ego_v
+    out[49] = ego_heading
+    out[50] = ego_length
+    out[51] = ego_width
+    out[52] = dist2center
+    out[53] = ego_lane
+    out[54] = (LANE_NUMBER - 1 - ego_lane) * LANE_WIDTH + LANE_WIDTH / 2 - dist2center
+    out[55] = ego_lane * LANE_WIDTH + LANE_WIDTH / 2 + dist2center
+    return out
+
+
+@jit
+def encode_frames(out, ego_x, ego_y, ego_v, ego_heading, ego_length, ego_width, dist2center, ego_lane,
+                  x, y, v, angle, length, width, lane, interested_rear_dist, interested_front_dist):
+    """`encode_frame` of a batch of frames, ego states given as (nb_envs,) arrays and vehicles as (nb_envs, N)
+    arrays into the (nb_envs, 56) array `out`."""
+    for env in range(len(ego_x)):
+        encode_frame(out[env], ego_x[env], ego_y[env], ego_v[env], ego_heading[env], ego_length, ego_width,
+                     dist2center[env], ego_lane[env], x[env], y[env], v[env], angle[env], length[env],
+                     width[env], lane[env], interested_rear_dist, interested_front_dist)
+    return out
+
+
+def vehicle_arrays(vehicles):
+    """x, y, v, angle, length, width and lane_index of vehicle dicts as arrays, for the array kernels."""
+    columns = np.fromiter(itertools.chain.from_iterable(map(_VEHICLE_FIELDS, vehicles)), dtype=float,
+                          count=7 * len(vehicles)).reshape(-1, 7)
+    x, y, v, angle, length, width, lane = columns.T
+    return x, y, v, angle, length, width, lane.astype(np.int64)
@@ -3,14 +3,16 @@ from LasVSim.simulator import *
 simulation = None
 
 
-def create_simulation(path=None):
+def create_simulation(path=None, traffic_engine=None):
     """Create a LasVSim simulation.
 
     Args:
         path: Simulation setting file path.
+        traffic_engine: 'sumo' or 'numpy', overrides the engine of the setting
+            file if given.
     """
     global simulation
-    simulation = Simulation(path)
+    simulation = Simulation(path, traffic_engine)
     return simulation
 
 
@@ -77,9 +79,22 @@ def set_ego(x, y, v, heading):
     simulation.agent.update_dynamic_state(x, y, v, heading)
 
 
+def enable_data_recording(path=None, chunk_size=1000):
+    """Record ego and traffic states of every tick, starting from the next reset.
+
+    Args:
+        path: Directory the data is streamed into, one sub directory per episode.
+            If None, data is kept in memory until `save_simulation_data` is called.
+        chunk_size: Number of ticks per compressed chunk file.
+    """
+    simulation.enable_data_recording(path, chunk_size)
+
+
 def save_simulation_data(path):
-    """Save simulation data."""
-    simulation.export_data(path)
+    """Save simulation data as compressed npz chunks.
+
+    Saved data can be loaded by `LasVSim.data_module.Replay` without re-running SUMO."""
+    simulation.save_data(path)
 
 
 def export_simulation_data(path):
@@ -0,0 +1,514 @@
+# coding=utf-8
+"""NumPy traffic module of LasVSim
+
+A SUMO-free stand-in for `traffic_module.Traffic` on Map3_Highway_v2: IDM
+car-following and MOBIL lane changes on the 4 lanes of the lower straight,
+all vehicles stepped at once with numpy. `BatchTraffic` steps many
+independent copies of the road together, `NumpyTraffic` wraps a single one
+behind the Traffic interface. Select it with
+<Traffic><Engine>numpy</Engine></Traffic> in the setting file or with
+`traffic_engine='numpy'` when creating the simulation.
+
+Only the lower straight (the road of the end-to-end scenario, driven towards
++x) is modelled. Its two ends are joined, vehicles leaving it at the end
+re-enter at the start.
+"""
+import os
+import re
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+LANE_NUMBER = 4
+LANE_WIDTH = 3.75
+ROAD_LEFT_Y = -150.0  # left edge of the leftmost lane, y grows to the left
+ROAD_X_START = -915.6
+ROAD_X_END = 915.6
+ROAD_LENGTH = ROAD_X_END - ROAD_X_START
+KEY_STRIDE = 2 * ROAD_LENGTH  # sort key offset between two lanes
+LANE_SPEED = 34.0  # speed limit of the lanes in grid-map.net.xml, m/s
+LANE_CENTER_Y = np.array([ROAD_LEFT_Y - (2 * (LANE_NUMBER - lane) - 1) * LANE_WIDTH / 2
+                          for lane in range(LANE_NUMBER)])
+SIM_PERIOD = 1.0 / 10
+WINKER_PERIOD = 0.5
+EGO_LENGTH = 4.8  # same as the ego inserted into SUMO
+EGO_WIDTH = 2.2
+VEHICLE_TYPE_ID = {'car_1': 0, 'car_2': 1, 'car_3': 2, 'truck_1': 100}
+
+# IDM and MOBIL parameters, the vehicle type specific ones are read from the
+# route file (accel, decel, tau, minGap, maxSpeedLat)
+IDM_DELTA = 4.0
+MOBIL_POLITENESS = 0.3
+MOBIL_THRESHOLD = 0.2  # m/s^2
+MOBIL_KEEP_RIGHT_BIAS = 0.1  # m/s^2
+MOBIL_SAFE_DECEL = 4.0  # m/s^2
+LANE_CHANGE_DECISION_PERIOD = 1.0  # mean time between two lane change decisions of a vehicle, s
+SIGNAL_LEFT = 0x01
+SIGNAL_RIGHT = 0x02
+SIGNAL_NONE = 0x04
+
+
+def _parse_speed_factor(value):
+    """'normc(mean,dev,min,max)' or a constant, as (mean, dev, min, max)."""
+    if value is None:
+        return 1.0, 0.0, 1.0, 1.0
+    match = re.match(r'normc\(([^)]*)\)', value.strip())
+    if match is None:
+        return float(value), 0.0, float(value), float(value)
+    mean, dev, low, high = [float(v) for v in match.group(1).split(',')]
+    return mean, dev, low, high
+
+
+def load_vehicle_types(map_path):
+    """Read the vehicle types of the route file used by the map's configuration.sumocfg.
+
+    Args:
+        map_path: Directory of the map.
+
+    Returns:
+        A dict from vehicle type id to a dict of its length, width, accel,
+        decel, emergency_decel, tau, min_gap, max_speed, max_speed_lat and
+        speed_factor (mean, dev, min, max).
+    """
+    config = ET.parse(os.path.join(map_path, 'configuration.sumocfg')).getroot()
+    route_file = config.find('input/route-files').get('value').split(',')[0]
+    vehicle_types = {}
+    for vtype in ET.parse(os.path.join(map_path, route_file)).getroot().iter('vType'):
+        decel = float(vtype.get('decel', 4.5))
+        vehicle_types[vtype.get('id')] = dict(
+            length=float(vtype.get('length', 5.0)),
+            width=float(vtype.get('width', 1.8)),
+            accel=float(vtype.get('accel', 2.6)),
+            decel=decel,
+            emergency_decel=float(vtype.get('emergencyDecel', decel)),
+            tau=float(vtype.get('tau', 1.0)),
+            min_gap=float(vtype.get('minGap', 2.5)),
+            max_speed=float(vtype.get('maxSpeed', 55.55)),
+            max_speed_lat=float(vtype.get('maxSpeedLat', 1.0)),
+            speed_factor=_parse_speed_factor(vtype.get('speedFactor')))
+    return vehicle_types
+
+
+def _sample_speed_factors(rng, speed_factor, size):
+    mean, dev, low, high = speed_factor
+    factors = mean + dev * rng.randn(size)
+    for _ in range(10):  # resample out of range values like SUMO's normc
+        outside = (factors < low) | (factors > high)
+        if not outside.any():
+            break
+        factors[outside] = mean + dev * rng.randn(int(outside.sum()))
+    return np.clip(factors, low, high)
+
+
+def idm_acceleration(v, v_leader, gap, v0, a_max, b, time_headway, s0):
+    """Intelligent driver model acceleration, vectorized over all arguments.
+
+    Args:
+        v: Speed, m/s.
+        v_leader: Speed of the leader, m/s.
+        gap: Bumper to bumper distance to the leader, m, inf without leader.
+        v0: Desired speed, m/s.
+        a_max: Maximum acceleration, m/s^2.
+        b: Comfortable deceleration, m/s^2.
+        time_headway: Desired time headway, s.
+        s0: Minimum gap, m.
+    """
+    s_star = s0 + np.maximum(0., v * time_headway + v * (v - v_leader) / (2 * np.sqrt(a_max * b)))
+    free = 1 - (v / v0) ** IDM_DELTA
+    with np.errstate(divide='ignore'):
+        interaction = (s_star / np.maximum(gap, 0.1)) ** 2
+    return a_max * (free - interaction)
+
+
+class _LaneIndex(object):
+    """Obstacles sorted by x within each group, an env's lane of the looped straight, for leader and follower
+    queries."""
+
+    def __init__(self, x, group, v, length, nb_groups):
+        key = group * KEY_STRIDE + (x - ROAD_X_START)
+        order = np.argsort(key, kind='stable')  # nearly sorted from one tick to the next
+        self.key, self.x, self.v, self.half_length = key[order], x[order], v[order], length[order] / 2
+        self.group = group[order]
+        self.rank = np.empty(len(order), dtype=int)
+        self.rank[order] = np.arange(len(order))
+        self.bounds = np.searchsorted(self.group, np.arange(nb_groups + 1))
+
+    def neighbours(self, x, group, half_length):
+        """Gaps and speeds of the closest obstacles of the same group strictly ahead of and behind the queries.
+
+        Returns:
+            (leader_gap, leader_v, follower_gap, follower_v), gaps are bumper to
+            bumper and inf where the group is empty.
+        """
+        if len(self.key) == 0:
+            return np.full(len(x), np.inf), np.zeros(len(x)), np.full(len(x), np.inf), np.zeros(len(x))
+        query = group * KEY_STRIDE + (x - ROAD_X_START)
+        ahead = np.searchsorted(self.key, query, side='right')
+        behind = np.searchsorted(self.key, query, side='left') - 1
+        return self._gaps(x, group, half_length, ahead, behind)
+
+    def member_neighbours(self, members, half_length):
+        """`neighbours` of obstacles in their own group, without searching.
+
+        Args:
+            members: Indices of the obstacles in the arrays the index was built from.
+        """
+        rank = self.rank[members]
+        return self._gaps(self.x[rank], self.group[rank], half_length, rank + 1, rank - 1)
+
+    def _gaps(self, x, group, half_length, ahead, behind):
+        start, end = self.bounds[group], self.bounds[group + 1]
+        empty = start == end
+        wrap_ahead, wrap_behind = ahead >= end, behind < start
+        last = len(self.key) - 1
+        leader = np.minimum(np.where(wrap_ahead, start, ahead), last)
+        follower = np.clip(np.where(wrap_behind, end - 1, behind), 0, last)
+        leader_gap = self.x[leader] - x + ROAD_LENGTH * wrap_ahead - self.half_length[leader] - half_length
+        follower_gap = x - self.x[follower] + ROAD_LENGTH * wrap_behind - self.half_length[follower] - half_length
+        return (np.where(empty, np.inf, leader_gap), np.where(empty, 0., self.v[leader]),
+                np.where(empty, np.inf, follower_gap), np.where(empty, 0., self.v[follower]))
+
+
+def _non_overlapping(x, lane, length):
+    """Mask of the vehicles not overlapping the vehicle kept ahead of them in their lane."""
+    keep = np.ones(len(x), dtype=bool)
+    for l in range(LANE_NUMBER):
+        in_lane = np.nonzero(lane == l)[0]
+        rear = np.inf
+        for i in in_lane[np.argsort(-x[in_lane])]:  # front to back
+            if x[i] + length[i] / 2 > rear:
+                keep[i] = False
+            else:
+                rear = x[i] - length[i] / 2
+    return keep
+
+
+def lane_of(y):
+    """Index of the lane containing lateral position y, clipped to the road."""
+    return np.clip(np.floor((np.asarray(y) - (ROAD_LEFT_Y - LANE_NUMBER * LANE_WIDTH)) / LANE_WIDTH),
+                   0, LANE_NUMBER - 1).astype(int)
+
+
+def on_road(y, width=0.):
+    """Whether a vehicle of the given width centered at y overlaps the road."""
+    return (ROAD_LEFT_Y - LANE_NUMBER * LANE_WIDTH - width / 2 < y) & (y < ROAD_LEFT_Y + width / 2)
+
+
+class BatchTraffic(object):
+    """Traffic of independent copies of the lower straight, stepped together.
+
+        Every copy (env) holds the vehicles of the initial traffic on the lower
+        straight, so the states are (nb_envs, N) arrays; vehicles left out of an
+        env, e.g. those too close to its ego vehicle at reset, are inactive and
+        stand still outside of the road model. IDM gives the longitudinal
+        acceleration, MOBIL decides lane changes, which are then driven
+        laterally with the vehicle type's maxSpeedLat. The ego vehicles are
+        obstacles the traffic reacts to, moved by `set_egos`.
+
+        Attributes:
+            names: The ids of the N vehicles in the initial traffic.
+            x, y, v, vy, lane, origin_lane, active: (nb_envs, N) vehicle states,
+                x and y of the shape center. Vehicles changing lanes are in
+                `lane` and still in `origin_lane` until they reach the center of
+                `lane`.
+            ego_x, ego_y, ego_v: (nb_envs,) ego states.
+    """
+
+    def __init__(self, nb_envs, map_path, init_traffic, step_length=100, ego_length=EGO_LENGTH, seed=None):
+        """
+        Args:
+            nb_envs: Number of envs.
+            map_path: Directory of the map, for the vehicle types.
+            init_traffic: Initial traffic of the scenario, as loaded by
+                `traffic_module.TrafficData.load_traffic`.
+            step_length: Step length, ms.
+            ego_length: Length of the ego vehicles, m.
+            seed: Seed of the speed factors and lane change decisions.
+        """
+        self.nb_envs = nb_envs
+        self.dt = float(step_length) / 1000
+        self.ego_length = ego_length
+        self.rng = np.random.RandomState(None if seed is None else int(seed) % 2 ** 32)
+        self.vehicle_types = load_vehicle_types(map_path)
+        self.tick = 0
+
+        names, type_names, rows = [], [], []
+        for veh, state in (init_traffic or {}).items():
+            (x, y), heading, length = state[66], state[67], state[68]
+            # positions are front bumper centers, SUMO angle 90 is +x
+            if not (ROAD_X_START < x - length / 2 < ROAD_X_END and on_road(y) and abs(heading - 90) < 10):
+                continue
+            if state[79] not in self.vehicle_types:
+                continue
+            names.append(veh)
+            type_names.append(state[79])
+            rows.append((x, y, state[64], length, state[77]))
+        rows = np.array(rows, dtype=float).reshape(-1, 5)
+        # SUMO's sublane model lets narrow vehicles drive side by side in one lane
+        keep = _non_overlapping(rows[:, 0] - rows[:, 3] / 2, lane_of(rows[:, 1]), rows[:, 3])
+        self.names = [name for name, k in zip(names, keep) if k]
+        self.type_names = [type_name for type_name, k in zip(type_names, keep) if k]
+        self.init_front_x, self.init_front_y, self.init_v, length, width = rows[keep].T
+        self.init_lane = lane_of(self.init_front_y)
+        self.type_id = np.array([VEHICLE_TYPE_ID.get(t, 200) for t in self.type_names], dtype=int)
+
+        shape = (nb_envs, len(self.names))
+        self.length = np.broadcast_to(length, shape).copy()
+        self.width = np.broadcast_to(width, shape).copy()
+        self.params = {}
+        for key in ['accel', 'decel', 'emergency_decel', 'tau', 'min_gap', 'max_speed_lat']:
+            values = np.array([self.vehicle_types[t][key] for t in self.type_names], dtype=float)
+            self.params[key] = np.broadcast_to(values, shape).copy()
+        self.params['v0'] = np.zeros(shape)
+        self.x, self.y, self.v, self.vy = np.zeros(shape), np.zeros(shape), np.zeros(shape), np.zeros(shape)
+        self.lane = np.zeros(shape, dtype=int)
+        self.origin_lane = np.zeros(shape, dtype=int)
+        self.active = np.zeros(shape, dtype=bool)
+        self.ego_x, self.ego_y, self.ego_v = np.zeros(nb_envs), np.zeros(nb_envs), np.zeros(nb_envs)
+        self._env_of = np.repeat(np.arange(nb_envs), len(self.names))
+
+    def reset(self, env_ids, ego_x, ego_y, ego_v):
+        """Put the initial traffic back into the envs `env_ids`, leaving out vehicles within 20m of their ego.
+
+        Args:
+            env_ids: Indices of the envs to reset.
+            ego_x, ego_y, ego_v: Ego states of these envs.
+        """
+        env_ids = np.asarray(env_ids, dtype=int)
+        ego_x, ego_y = np.asarray(ego_x, dtype=float), np.asarray(ego_y, dtype=float)
+        self.x[env_ids] = self.init_front_x - self.length[env_ids] / 2
+        self.y[env_ids] = LANE_CENTER_Y[self.init_lane]
+        self.v[env_ids] = self.init_v
+        self.vy[env_ids] = 0.
+        self.lane[env_ids] = self.init_lane
+        self.origin_lane[env_ids] = self.init_lane
+        self.active[env_ids] = ~((np.abs(self.init_front_x - ego_x[:, None]) < 20)
+                                 & (np.abs(self.init_front_y - ego_y[:, None]) < 20))
+        v0 = np.zeros((len(env_ids), len(self.names)))
+        for type_name in sorted(set(self.type_names)):
+            members = np.array([t == type_name for t in self.type_names])
+            vtype = self.vehicle_types[type_name]
+            speed_factors = _sample_speed_factors(self.rng, vtype['speed_factor'], len(env_ids) * int(members.sum()))
+            v0[:, members] = np.minimum(vtype['max_speed'], speed_factors * LANE_SPEED).reshape(len(env_ids), -1)
+        self.params['v0'][env_ids] = v0
+        self.set_egos(ego_x, ego_y, ego_v, env_ids)
+
+    def set_egos(self, x, y, v, env_ids=slice(None)):
+        """Move the ego vehicles (of `env_ids`), the traffic reacts to them from the next step on."""
+        self.ego_x[env_ids], self.ego_y[env_ids], self.ego_v[env_ids] = x, y, v
+
+    def _obstacles(self, group, x, v, length, changing, origin_group):
+        """Vehicles in their lane, vehicles changing lanes also in the lane they leave, and the ego vehicles in
+        every lane they overlap."""
+        ego_on_road = on_road(self.ego_y, EGO_WIDTH)
+        right_lane, left_lane = lane_of(self.ego_y - EGO_WIDTH / 2), lane_of(self.ego_y + EGO_WIDTH / 2)
+        ego_envs = np.concatenate([np.nonzero(ego_on_road)[0], np.nonzero(ego_on_road & (left_lane != right_lane))[0]])
+        nb_right = int(ego_on_road.sum())
+        ego_lanes = np.concatenate([right_lane[ego_envs[:nb_right]], left_lane[ego_envs[nb_right:]]])
+        ego_x = (self.ego_x[ego_envs] - ROAD_X_START) % ROAD_LENGTH + ROAD_X_START
+        return _LaneIndex(np.concatenate([x, x[changing], ego_x]),
+                          np.concatenate([group, origin_group[changing], ego_envs * LANE_NUMBER + ego_lanes]),
+                          np.concatenate([v, v[changing], self.ego_v[ego_envs]]),
+                          np.concatenate([length, length[changing], np.full(len(ego_envs), self.ego_length)]),
+                          self.nb_envs * LANE_NUMBER + 1)
+
+    def _change_lanes(self, obstacles, p, x, v, lane, half_length, deciding, acc, leader_gap, leader_v):
+        """MOBIL lane change decisions of the `deciding` vehicles, returns their new lanes.
+
+        The parameters of the followers are not tracked by the obstacles, their
+        accelerations are estimated with the IDM parameters of the deciding vehicle.
+        """
+        target = lane.copy()
+        candidates = np.nonzero(deciding)[0]
+        if len(candidates) == 0:
+            return target
+
+        def idm(idx, v_, v_leader, gap):
+            return idm_acceleration(v_, v_leader, gap, p['v0'][idx], p['accel'][idx], p['decel'][idx],
+                                    p['tau'][idx], p['min_gap'][idx])
+
+        # the old follower closes up to the leader once the vehicle has left
+        env = self._env_of[candidates]
+        _, _, old_gap, old_v = obstacles.member_neighbours(candidates, half_length[candidates])
+        old_follower_gain = (idm(candidates, old_v, leader_v[candidates],
+                                 old_gap + 2 * half_length[candidates] + leader_gap[candidates])
+                             - idm(candidates, old_v, v[candidates], old_gap))
+
+        # to the right on even ticks, to the left on odd ones, so that no two vehicles
+        # merge into the same lane from both sides at once
+        direction, bias = [(-1, MOBIL_KEEP_RIGHT_BIAS), (1, -MOBIL_KEEP_RIGHT_BIAS)][self.tick % 2]
+        new_lane = lane[candidates] + direction
+        valid = np.nonzero((new_lane >= 0) & (new_lane < LANE_NUMBER))[0]
+        idx, new_lane, hl = candidates[valid], new_lane[valid], half_length[candidates[valid]]
+        s0 = p['min_gap'][idx]
+        new_gap, new_v, new_follower_gap, new_follower_v = obstacles.neighbours(
+            x[idx], env[valid] * LANE_NUMBER + new_lane, hl)
+        new_acc = idm(idx, v[idx], new_v, new_gap)
+        new_follower_acc = idm(idx, new_follower_v, v[idx], new_follower_gap)
+        new_follower_gain = new_follower_acc - idm(idx, new_follower_v, new_v, new_follower_gap + 2 * hl + new_gap)
+        safe = ((new_follower_acc > -MOBIL_SAFE_DECEL) & (new_acc > -MOBIL_SAFE_DECEL)
+                & (new_gap > s0) & (new_follower_gap > s0))
+        gain = new_acc - acc[idx] + bias + MOBIL_POLITENESS * (new_follower_gain + old_follower_gain[valid])
+        change = safe & (gain > MOBIL_THRESHOLD)
+        target[idx[change]] = new_lane[change]
+        return target
+
+    def step(self):
+        """Advance all envs by one step."""
+        self.tick += 1
+        if self.x.size == 0:
+            return
+        shape, dt = self.x.shape, self.dt
+        x, y, v = self.x.ravel(), self.y.ravel(), self.v.ravel()
+        lane, origin_lane, active = self.lane.ravel(), self.origin_lane.ravel(), self.active.ravel()
+        length = self.length.ravel()
+        p = dict((key, value.ravel()) for key, value in self.params.items())
+        half_length = length / 2
+
+        # inactive vehicles are all kept in one extra group no active vehicle is in
+        inactive_group = self.nb_envs * LANE_NUMBER
+        group = np.where(active, self._env_of * LANE_NUMBER + lane, inactive_group)
+        origin_group = np.where(active, self._env_of * LANE_NUMBER + origin_lane, inactive_group)
+        changing = np.nonzero(active & (lane != origin_lane))[0]
+        obstacles = self._obstacles(group, x, v, length, changing, origin_group)
+
+        leader_gap, leader_v, _, _ = obstacles.member_neighbours(np.arange(len(x)), half_length)
+        acc = idm_acceleration(v, leader_v, leader_gap, p['v0'], p['accel'], p['decel'], p['tau'], p['min_gap'])
+        free_gap = leader_gap.copy()
+        if len(changing):
+            # keep the distance to the leader of the lane being left, too
+            origin_gap, origin_v, _, _ = obstacles.neighbours(x[changing], origin_group[changing],
+                                                              half_length[changing])
+            acc[changing] = np.minimum(acc[changing], idm_acceleration(
+                v[changing], origin_v, origin_gap, p['v0'][changing], p['accel'][changing], p['decel'][changing],
+                p['tau'][changing], p['min_gap'][changing]))
+            free_gap[changing] = np.minimum(free_gap[changing], origin_gap)
+        deciding = active & (lane == origin_lane) & (
+            self.rng.uniform(size=len(x)) < dt / LANE_CHANGE_DECISION_PERIOD)
+        lane = self._change_lanes(obstacles, p, x, v, lane, half_length, deciding, acc, leader_gap, leader_v)
+
+        acc = np.maximum(acc, -p['emergency_decel'])
+        new_v = np.where(active, np.maximum(v + acc * dt, 0.), 0.)
+        # never drive into the current position of the leader, e.g. when braking is capped
+        dx = np.minimum((v + new_v) / 2 * dt, np.maximum(free_gap, 0.))
+        x = (x + dx - ROAD_X_START) % ROAD_LENGTH + ROAD_X_START
+        v = np.minimum(new_v, dx / dt)
+
+        target_y = LANE_CENTER_Y[lane]
+        max_dy = p['max_speed_lat'] * dt
+        dy = np.clip(target_y - y, -max_dy, max_dy)
+        y = y + dy
+        origin_lane = np.where(np.abs(target_y - y) < 1e-6, lane, origin_lane)
+
+        self.x, self.y, self.v, self.vy = x.reshape(shape), y.reshape(shape), v.reshape(shape), (dy / dt).reshape(shape)
+        self.lane, self.origin_lane = lane.reshape(shape), origin_lane.reshape(shape)
+
+
+class NumpyTraffic(object):
+    """Traffic class without SUMO.
+
+        Same interface as `traffic_module.Traffic`, a `BatchTraffic` of a
+        single env. The ego vehicle is an obstacle the traffic reacts to but
+        never moves. Given a seed, the traffic is deterministic.
+
+        Attributes:
+            vehicleName: A list containing all vehicles' id in simulation
+                including ego vehicle's id 'ego' as the first element.
+            vehicles: A list containing all other vehicles' information of the
+                last `get_vehicles` call.
+            sim_time: A float variable for recording current simulation time.
+    """
+    def __init__(self, step_length, path=None, traffic_type=None,
+                 traffic_density=None, init_traffic=None, seed=None):
+        if init_traffic is None and traffic_type != 'No Traffic':
+            raise ValueError('the numpy traffic engine needs the initial traffic of a scenario')
+        self.seed = seed
+        self.type = traffic_type
+        self.density = traffic_density
+        self.step_length = step_length
+        self.__path = os.path.dirname(__file__) + "/Map/" + path + "/"
+        self.random_traffic = {} if traffic_type == 'No Traffic' else init_traffic
+        self.__own_x, self.__own_y, self.__own_v, self.__own_a = 0.0, 0.0, 0.0, 0.0
+        self.traffic = None
+        self.sim_time = 0
+        self.vehicles = []
+        self.vehicleName = ['ego']
+
+    def init(self, source, egocar_length):
+        """Initiate traffic from the initial traffic of the scenario.
+
+        Vehicles off the lower straight, within 20m of the ego vehicle or
+        overlapping the vehicle ahead in their lane (SUMO's sublane model lets
+        narrow vehicles drive side by side) are left out, the others are put on
+        the center of their lane.
+
+        Args:
+            source: Ego vehicle's current state.
+            egocar_length: Ego vehicle's length, m.
+        """
+        self.sim_time = 0
+        self.__own_x, self.__own_y, self.__own_v, self.__own_a = source
+        self.traffic = BatchTraffic(1, self.__path, self.random_traffic, self.step_length, egocar_length, self.seed)
+        self.traffic.reset([0], [self.__own_x], [self.__own_y], [self.__own_v])
+        self.index = np.nonzero(self.traffic.active[0])[0]
+        self.vehicleName = ['ego'] + [self.traffic.names[i] for i in self.index]
+        self.winker = np.ones(len(self.index), dtype=int)
+        self.winker_time = np.zeros(len(self.index))
+        self.rotation = np.full(len(self.index), SIGNAL_NONE, dtype=int)
+        self.vehicles = []
+
+    def get_vehicles(self):
+        """Get other vehicles' information not including ego vehicle.
+
+        Returns:
+            A list of dicts with the same keys as `traffic_module.Traffic.get_vehicles`.
+        """
+        t, index = self.traffic, self.index
+        x, y, v, vy = t.x[0, index], t.y[0, index], t.v[0, index], t.vy[0, index]
+        lane, origin_lane = t.lane[0, index], t.origin_lane[0, index]
+        rotation = np.where(lane > origin_lane, SIGNAL_LEFT, np.where(lane < origin_lane, SIGNAL_RIGHT, SIGNAL_NONE))
+        changed = rotation != self.rotation
+        blink = ~changed & (self.sim_time - self.winker_time >= WINKER_PERIOD)
+        self.winker = np.where(changed, 1, np.where(blink, 1 - self.winker, self.winker))
+        self.winker_time = np.where(changed | blink, self.sim_time, self.winker_time)
+        self.rotation = rotation
+
+        angle = np.degrees(np.arctan2(vy, np.maximum(v, 0.1)))
+        render = (np.abs(x - self.__own_x) <= 200) & (np.abs(y - self.__own_y) <= 200)
+        columns = zip(t.type_id[index].tolist(), x.tolist(), y.tolist(), v.tolist(), angle.tolist(),
+                      rotation.tolist(), self.winker.tolist(), self.winker_time.tolist(), render.tolist(),
+                      t.length[0, index].tolist(), t.width[0, index].tolist(), lane_of(y).tolist(),
+                      t.params['emergency_decel'][0, index].tolist())
+        self.vehicles = [dict(type=c_t, x=c_x, y=c_y, v=c_v, angle=c_a, rotation=c_r, winker=w, winker_time=wt,
+                              render=r, length=length, width=width, lane_index=lane_index, max_decel=max_decel)
+                         for c_t, c_x, c_y, c_v, c_a, c_r, w, wt, r, length, width, lane_index, max_decel
+                         in columns]
+        return self.vehicles
+
+    def sim_step(self):
+        self.sim_time += SIM_PERIOD
+        self.traffic.step()
+
+    def set_own_car(self, x, y, v, a):
+        """Move the ego vehicle, the traffic reacts to it from the next sim_step on.
+
+        Args:
+            x: Ego vehicle's current x coordination of it's shape center, m.
+            y: Ego vehicle's current y coordination of it's shape center, m.
+            v: Ego vehicle's current velocity, m/s.
+            a: Ego vehicle's current heading angle under base coordinate, deg.
+        """
+        self.__own_x, self.__own_y, self.__own_v, self.__own_a = x, y, v, a
+        self.traffic.set_egos(x, y, v)
+
+    def get_dis2center_line(self):  # 左正右负
+        return float(self.__own_y - LANE_CENTER_Y[self.get_egolane_index()])
+
+    def get_egolane_index(self):
+        return int(lane_of(self.__own_y))
+
+    def get_road_related_info_of_ego(self):
+        dis2center_line = self.get_dis2center_line()  # 左正右负
+        egolane_index = self.get_egolane_index()
+        return dict(dist2current_lane_center=dis2center_line,
+                    egolane_index=egolane_index)
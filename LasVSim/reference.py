@@ -207,3 +207,59 @@ class Reference(object):
         return horizon_path_points
 
 
+
+
+class BatchReference(object):
+    """`Reference` of a batch of vehicles at once, in numpy arrays.
+
+    Only paths indexed by x are supported, i.e. goals less than 90 deg off the
+    initial heading, as is always the case on the highway.
+    """
+    def __init__(self, step_length, horizon):
+        self.horizon = horizon
+        self.step_length = step_length  # ms
+        self.x = self.y = self.v = self.heading = None  # in origin coordination
+
+    def reset_reference_path(self, orig_init_state, orig_goal_state):
+        """
+        Args:
+            orig_init_state: (x, y, v, heading) arrays of the batch.
+            orig_goal_state: (x, y, v, heading) arrays of the batch.
+        """
+        self.x, self.y, self.v, self.heading = [np.asarray(a, dtype=float) for a in orig_init_state]
+        self.init_x, self.init_y, self.init_v, self.init_heading = self.x, self.y, self.v, self.heading
+        goal_x, goal_y, goal_v, goal_heading = [np.asarray(a, dtype=float) for a in orig_goal_state]
+        self.goalx_in_ref, self.goaly_in_ref, self.goalheading_in_ref = self._rotate(
+            goal_x - self.init_x, goal_y - self.init_y, goal_heading, self.init_heading)
+        self.goalv_in_ref = np.clip(goal_v, 0, 33)
+        assert np.all(self.goalx_in_ref > 0) and np.all(np.abs(self.goalheading_in_ref) < 90)
+        slope = np.tan(np.radians(self.goalheading_in_ref))
+        self.a3 = (slope - 2 * self.goaly_in_ref / self.goalx_in_ref) / self.goalx_in_ref ** 2
+        self.a2 = self.goaly_in_ref / self.goalx_in_ref ** 2 - self.a3 * self.goalx_in_ref
+        self.w = (self.goalv_in_ref - self.init_v) / self.goalx_in_ref
+        self.x_in_ref = self.init_v * self.step_length / 1000.0  # next path point
+
+    @staticmethod
+    def _rotate(x, y, d, coordi_rotate_d):
+        """`rotate_coordination` on arrays."""
+        rad = np.radians(coordi_rotate_d)
+        d = d - coordi_rotate_d
+        d = np.where(d > 180, d - 360, np.where(d < -180, d + 360, d))
+        return x * np.cos(rad) + y * np.sin(rad), -x * np.sin(rad) + y * np.cos(rad), d
+
+    def sim_step(self):
+        """Next point of every path, continued straight on with constant speed past the goal."""
+        x_in_ref = self.x_in_ref
+        y_in_ref = self.a2 * x_in_ref ** 2 + self.a3 * x_in_ref ** 3
+        v = self.w * x_in_ref + self.init_v
+        heading_in_ref = np.degrees(np.arctan(2 * self.a2 * x_in_ref + 3 * self.a3 * x_in_ref ** 2))
+        orig_x, orig_y, orig_heading = self._rotate(x_in_ref, y_in_ref, heading_in_ref, -self.init_heading)
+        on_path = x_in_ref < self.goalx_in_ref
+        # same as Reference, which steps by v * cos(slope) along x
+        v_x = v * np.cos(np.tan(np.radians(heading_in_ref)))
+        self.x_in_ref = np.where(on_path, x_in_ref + v_x * self.step_length / 1000.0, x_in_ref)
+        self.x = np.where(on_path, orig_x + self.init_x, self.x + self.v * self.step_length / 1000)
+        self.y = np.where(on_path, orig_y + self.init_y, self.y)
+        self.v = np.where(on_path, v, self.v)
+        self.heading = np.where(on_path, orig_heading, 0.)
+        return self.x, self.y, self.v, self.heading
@@ -7,7 +7,8 @@ Date: 2017-8-23
 """
 
 import _struct as struct
-import untangle
+import hashlib
+import json
 import os
 from LasVSim.traffic_module import *
 from LasVSim.agent_module import *
@@ -16,7 +17,12 @@ from xml.dom.minidom import Document
 import time
 from LasVSim import data_structures
 from LasVSim.traffic_module import TrafficData
+from LasVSim.numpy_traffic import NumpyTraffic
+from LasVSim.data_module import Data
 from math import cos, sin, pi, fabs
+from collections import OrderedDict
+
+TRAFFIC_ENGINES = {'sumo': Traffic, 'numpy': NumpyTraffic}
 
 class Simulation(object):
     """Simulation Class.
@@ -31,7 +37,9 @@ class Simulation(object):
             ended.
         traffic: A traffic module instance.
         agent: A Agent module instance.
-        data: A data module instance.
+        data: A data module instance, None if data recording is not enabled.
+        recorded_data: Data of the finished episodes recorded in memory, oldest
+            first. Episodes streamed to disk are not kept.
         other_vehicles: A list containing all other vehicle's info at current
             simulation step from traffic module.
         light_status: A dic variable containing current intersection's traffic
@@ -41,7 +49,7 @@ class Simulation(object):
 
     """
 
-    def __init__(self, default_setting_path=None):
+    def __init__(self, default_setting_path=None, traffic_engine=None):
 
         self.tick_count = 0  # Simulation run time. Counted by simulation steps.
         self.sim_time = 0.0  # Simulation run time. Counted by steps multiply stpe length.
@@ -51,12 +59,19 @@ class Simulation(object):
         self.simulation_loaded = False  # 仿真载入标志位
         self.traffic_data = TrafficData()  # 初始交通流数据对象
         self.settings = Settings(file_path=default_setting_path)  # 仿真设置对象
+        if traffic_engine is not None:
+            self.settings.set_traffic_engine(traffic_engine)
         self.step_length = self.settings.step_length
         self.external_control_flag = False  # 外部控制输入标识，若外部输入会覆盖内部控制器
         self.traffic = None
         self.agent = None
         self.ego_history = None
         self.data = None
+        self.recorded_data = []
+        self.record_data = False  # 是否记录仿真数据
+        self.data_path = None  # 仿真数据保存目录，每个episode一个子目录
+        self.data_chunk_size = 1000
+        self.episode_count = 0
         self.seed = None
 
         # self.reset(settings=self.settings, overwrite_settings=overwrite_settings, init_traffic_path=init_traffic_path)
@@ -66,6 +81,19 @@ class Simulation(object):
         if seed is not None:
             self.seed = seed
 
+    def enable_data_recording(self, path=None, chunk_size=1000):
+        """Record ego and traffic states of every tick from the next reset on.
+
+        Args:
+            path: Directory to stream the data into, one sub directory per
+                episode. If None, data is kept in memory until saved, the
+                finished episodes in `recorded_data`.
+            chunk_size: Number of ticks per written chunk.
+        """
+        self.record_data = True
+        self.data_path = path
+        self.data_chunk_size = chunk_size
+
     def reset(self, settings=None, overwrite_settings=None, init_traffic_path=None):
         """Clear previous loaded module.
 
@@ -77,25 +105,35 @@ class Simulation(object):
             del self.traffic
         if hasattr(self, 'agent'):
             del self.agent
-        if hasattr(self, 'data'):
-            del self.data
+        if self.data is not None:
+            self.data.close()  # flushes the last episode in background
+            if self.data.path is None:
+                self.recorded_data.append(self.data)
+            self.data = None
 
         self.tick_count = 0
         self.settings = settings
         if overwrite_settings is not None:
             self.settings.start_point = overwrite_settings['init_state']
         self.stopped = False
-        # self.data = Data()
+        if self.record_data:
+            episode_path = None
+            if self.data_path is not None:
+                episode_path = os.path.join(self.data_path, 'episode_{:05d}'.format(self.episode_count))
+            self.data = Data(path=episode_path, chunk_size=self.data_chunk_size,
+                             ego_length=settings.car_length, ego_width=settings.car_width)
+        self.episode_count += 1
         self.ego_history = {}
 
         """Load traffic module."""
         step_length = self.settings.step_length * self.settings.traffic_frequency
-        self.traffic = Traffic(path=settings.map,
-                               traffic_type=settings.traffic_type,
-                               traffic_density=settings.traffic_lib,
-                               step_length=step_length,
-                               init_traffic=self.traffic_data.load_traffic(init_traffic_path),
-                               seed=self.seed)
+        self.traffic = TRAFFIC_ENGINES[settings.traffic_engine](
+            path=settings.map,
+            traffic_type=settings.traffic_type,
+            traffic_density=settings.traffic_lib,
+            step_length=step_length,
+            init_traffic=self.traffic_data.load_traffic(init_traffic_path),
+            seed=self.seed)
         self.traffic.init(settings.start_point, settings.car_length)
         self.other_vehicles = self.traffic.get_vehicles()
 
@@ -109,8 +147,7 @@ class Simulation(object):
             path:
         """
         if os.path.exists(path):
-            settings = Settings()
-            settings.load(path+'/simulation_setting_file.xml')
+            settings = Settings(path+'/simulation_setting_file.xml')
             # self.reset(settings)
             self.reset(settings, overwrite_settings=overwrite_settings, init_traffic_path=path)
             self.simulation_loaded = True
@@ -126,6 +163,9 @@ class Simulation(object):
     #     """
     #     self.settings.save(path)
 
+    def save_data(self, path):
+        self.data.save(path)
+
     def export_data(self, path):
         self.data.export_csv(path)
 
@@ -151,19 +191,14 @@ class Simulation(object):
 
 
             # 保存当前步仿真数据
-            # self.data.append(
-            #     self_status=[self.tick_count * float(self.settings.step_length),
-            #                  self.agent.dynamic.x,
-            #                  self.agent.dynamic.y,
-            #                  self.agent.dynamic.v,
-            #                  self.agent.dynamic.heading],
-            #     self_info=self.agent.dynamic.get_info(),
-            #     vehicles=self.other_vehicles
-            #     # light_values=self.traffic.get_light_values(),
-            #     # trajectory=self.agent.route
-            #     # dis=self.traffic.get_current_distance_to_stopline(),
-            #     # speed_limit=self.traffic.get_current_lane_speed_limit()
-            #     )
+            if self.data is not None:
+                self.data.append(
+                    self_status=[self.tick_count * float(self.settings.step_length) / 1000,
+                                 self.agent.x,
+                                 self.agent.y,
+                                 self.agent.v,
+                                 self.agent.heading],
+                    vehicles=self.other_vehicles)
             self.tick_count += 1
         return True
 
@@ -224,9 +259,40 @@ class Simulation(object):
         return True
 
 
+# fields of a parsed setting file and their types, as kept in the settings cache
+SETTINGS_FIELDS = OrderedDict([
+    ('step_length', int), ('map', str),
+    ('car_length', float), ('car_width', float), ('car_weight', float), ('car_center2head', float),
+    ('car_faxle2center', float), ('car_raxle2center', float),
+    ('traffic_type', str), ('traffic_lib', str), ('traffic_frequency', int), ('traffic_engine', str),
+    ('start_point', list),
+])
+SETTINGS_CACHE_VERSION = 1
+# parsed setting files are cached as json files named after the hash of their content, '' disables it
+SETTINGS_CACHE_DIR = os.environ.get('LASVSIM_CACHE_DIR',
+                                    os.path.join(os.path.expanduser('~'), '.cache', 'lasvsim', 'settings'))
+_settings_cache = {}  # content hash: fields, of the setting files loaded by this process
+
+
+def _validate_settings(fields):
+    """Fields of a setting file with their types checked, None if they are incomplete or invalid."""
+    try:
+        validated = {name: field_type(fields[name]) for name, field_type in SETTINGS_FIELDS.items()}
+        validated['start_point'] = [float(value) for value in validated['start_point']]
+    except (KeyError, TypeError, ValueError):
+        return None
+    if len(validated['start_point']) != 4 or validated['traffic_engine'] not in TRAFFIC_ENGINES:
+        return None
+    return validated
+
+
 class Settings:  # 可以直接和package版本的Settings类替换,需要转换路径点的yaw坐标
     """
     Simulation Settings Class
+
+    Only keeps the parsed fields (see `SETTINGS_FIELDS`) and the sha1 `content_hash` of the setting
+    file, so it is cheap to pickle. A setting file is parsed once: the fields are cached by content
+    hash in the process and in `SETTINGS_CACHE_DIR`.
     """
 
     def __init__(self, file_path=None):
@@ -238,16 +304,61 @@ class Settings:  # 可以直接和package版本的Settings类替换,需要转换
     def load(self, filePath=None):
         if filePath is None:
             filePath = DEFAULT_SETTING_FILE
-        self.__parse_xml(filePath)
-        self.__load_step_length()
-        self.__load_map()
-        self.__load_self_car()
-        self.__load_traffic()
-        self.__load_start_point()
-
-    def __parse_xml(self, path):
-        f = open(path)
-        self.root = untangle.parse(f.read()).Simulation
+        with open(filePath, 'rb') as f:
+            content = f.read()
+        self.content_hash = hashlib.sha1(content).hexdigest()
+        fields = _settings_cache.get(self.content_hash)
+        if fields is None:
+            fields = self.__load_cache()
+        if fields is None:
+            self.__parse_xml(content)
+            self.__load_step_length()
+            self.__load_map()
+            self.__load_self_car()
+            self.__load_traffic()
+            self.__load_start_point()
+            del self.root
+            fields = _validate_settings({name: getattr(self, name) for name in SETTINGS_FIELDS})
+            if fields is None:
+                raise ValueError('invalid simulation setting file {}'.format(filePath))
+            self.__save_cache(fields)
+        _settings_cache[self.content_hash] = fields
+        for name, value in fields.items():
+            setattr(self, name, list(value) if name == 'start_point' else value)
+
+    def __cache_path(self):
+        return os.path.join(SETTINGS_CACHE_DIR, self.content_hash + '.json')
+
+    def __load_cache(self):
+        if not SETTINGS_CACHE_DIR:
+            return None
+        try:
+            with open(self.__cache_path()) as f:
+                cached = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+        if not isinstance(cached, dict) or cached.get('version') != SETTINGS_CACHE_VERSION:
+            return None
+        return _validate_settings(cached)
+
+    def __save_cache(self, fields):
+        """Write the cache file atomically, a read-only or full disk only costs the next process a parse."""
+        if not SETTINGS_CACHE_DIR:
+            return
+        path = self.__cache_path()
+        temp_path = '{}.{}.tmp'.format(path, os.getpid())
+        try:
+            if not os.path.isdir(SETTINGS_CACHE_DIR):
+                os.makedirs(SETTINGS_CACHE_DIR)
+            with open(temp_path, 'w') as f:
+                json.dump(dict(fields, version=SETTINGS_CACHE_VERSION), f)
+            os.replace(temp_path, path)
+        except (IOError, OSError):
+            pass
+
+    def __parse_xml(self, content):
+        import untangle  # only needed when a setting file is not in the cache
+        self.root = untangle.parse(content.decode('utf-8')).Simulation
 
     def __load_step_length(self):
         self.step_length = int(self.root.StepLength.cdata)
@@ -266,6 +377,17 @@ class Settings:  # 可以直接和package版本的Settings类替换,需要转换
         self.traffic_type = str(self.root.Traffic.Type.cdata)
         self.traffic_lib = str(self.root.Traffic.Lib.cdata)
         self.traffic_frequency = int(self.root.Traffic.Frequency.cdata)
+        if hasattr(self.root.Traffic, 'Engine'):  # optional, SUMO by default
+            self.set_traffic_engine(str(self.root.Traffic.Engine.cdata))
+        else:
+            self.traffic_engine = 'sumo'
+
+    def set_traffic_engine(self, engine):
+        """Select the traffic model, 'sumo' or the SUMO-free 'numpy'."""
+        if engine not in TRAFFIC_ENGINES:
+            raise ValueError('unknown traffic engine {}, expected one of {}'.format(
+                engine, sorted(TRAFFIC_ENGINES)))
+        self.traffic_engine = engine
 
     def __load_self_car(self):
         self.car_length = float(self.root.SelfCar.Length.cdata)
@@ -21,7 +21,8 @@ class TrafficData:
         pass
 
     def __del__(self):
-        self.file.close()
+        if self.file is not None:  # only opened by save_traffic
+            self.file.close()
 
     def save_traffic(self, traffic, path):
         self.file = open(path+'/simulation_traffic_data.bin', 'wb')
@@ -102,26 +103,41 @@ class TrafficData:
         else:
             return None
 
-if 'SUMO_HOME' in os.environ:
+# SUMO is only needed by Traffic and imported when the first Traffic is created, the numpy traffic engine
+# runs without it
+traci = None
+SUMO_BINARY = None
+
+
+def _import_sumo():
+    """Import traci and look up the sumo binary on first use.
+
+    Raises:
+        ImportError: If SUMO is not installed.
+    """
+    global traci, SUMO_BINARY
+    if traci is not None:
+        return
+    if 'SUMO_HOME' not in os.environ:
+        raise ImportError("please declare environment variable 'SUMO_HOME'")
     tools = os.path.join(os.environ['SUMO_HOME'], 'tools')
     sys.path.append(tools)
-else:
-    sys.exit("please declare environment variable 'SUMO_HOME'")
-try:
     sys.path.append(os.path.join(os.path.dirname(
         __file__), '..', '..', '..', '..', "tools"))
     sys.path.append(os.path.join(os.environ.get("SUMO_HOME", os.path.join(
         os.path.dirname(__file__), "..", "..", "..")), "tools"))
+    try:
+        from sumolib import checkBinary
+        import traci as sumo_traci
+    except ImportError:
+        raise ImportError(
+            "please declare environment variable 'SUMO_HOME' as the root directory "
+            "of your sumo installation (it should contain folders 'bin', 'tools' "
+            "and 'docs')")
+    SUMO_BINARY = checkBinary('sumo')
+    traci = sumo_traci
+
 
-    from sumolib import checkBinary
-except ImportError:
-    sys.exit(
-        "please declare environment variable 'SUMO_HOME' as the root directory "
-        "of your sumo installation (it should contain folders 'bin', 'tools' "
-        "and 'docs')")
-import traci
-
-SUMO_BINARY=checkBinary('sumo')
 VEHICLE_COUNT = 501
 VEHICLE_INDEX_START = 1
 WINKER_PERIOD=0.5
@@ -308,6 +324,7 @@ class Traffic(object):
     """
     def __init__(self, step_length, path=None, traffic_type=None,
                  traffic_density=None, init_traffic=None, seed=None):  # 该部分可直接与gui相替换
+        _import_sumo()
         self.seed = None
         if seed is not None:
             self.seed = seed
@@ -356,7 +373,8 @@ class Traffic(object):
             VEHICLE_COUNT = len(self.vehicleName)
 
     def __del__(self):  # 该部分可直接与gui相替换
-        traci.close()
+        if traci is not None:
+            traci.close()
         pass
 
     def init(self, source, egocar_length):
@@ -649,6 +667,8 @@ class Traffic(object):
 
 
 if __name__ == "__main__":
+    _import_sumo()
+    from sumolib import checkBinary
     sumoBinary = checkBinary('sumo-gui')
     print(__file__)
     traci.start([sumoBinary, "-c", "Map/Map3_Highway_v2/traffic_generation_Vehicle Only Traffic_Dense.sumocfg",
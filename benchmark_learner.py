@@ -0,0 +1,169 @@
+"""Measure the per-step latency of the hierarchical learner without running the simulator.
+
+The 7 networks of `models.build_models` (upper Q network, 3 actors and 3 critics) and their target
+networks are trained on replay memories filled with random observations, which isolates the cost of
+`DQNAgent4Hrl.backward` (sampling, normalization, 4 critic/Q updates, 3 actor updates and the soft
+target updates). Hard target synchronization is timed both through `get_weights`/`set_weights` and
+through the in-graph `TargetModelUpdater`.
+
+With `--sweep` every combination of thread count, oneDNN and LSTM precision is run in a fresh
+process (oneDNN is chosen when TensorFlow is imported) and a table of learner steps/sec is printed.
+
+usage: python benchmark_learner.py [--steps 200] [--batch-size 32] [--intra-op-threads 4]
+                                   [--inter-op-threads 1] [--onednn 1] [--lstm-precision bfloat16]
+                                   [--shared-trunk]
+       python benchmark_learner.py --sweep [--threads 1 2 4] [--lstm-precisions float32 bfloat16]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+import numpy as np
+
+from rl.common.runtime import configure_learner_runtime, get_lstm_dtype, LSTM_PRECISIONS
+
+OPTION_FEATURES = dict(left=41, straight=59, right=41)
+RESULT_PREFIX = 'learner steps/sec:'
+
+
+def build_agent(batch_size, lstm_dtype=None, shared_trunk=False, target_model_update_upper=1e-3,
+                target_model_update=3e-3, memory_limit=5000):
+    from tensorflow.python.keras.optimizers import Adam
+    from models import build_models, upper_nb_actions, lower_nb_actions
+    from rl.agents.dqn4hrl import DQNAgent4Hrl
+    from rl.agents.ddpg import DDPGAgent
+    from rl.agents.option_learner import SharedTrunkOptionLearner
+    from rl.memory import SequentialMemory
+    from rl.policy import BoltzmannQPolicy
+    from rl.processors import WhiteningNormalizerProcessor
+
+    model_dict, critic_action_input = build_models(lstm_dtype=lstm_dtype)
+    option_agents = {}
+    for option in ['left', 'straight', 'right']:
+        agent = DDPGAgent(processor=WhiteningNormalizerProcessor(), nb_actions=lower_nb_actions,
+                          actor=model_dict[option + '_actor_model'], critic=model_dict[option + '_critic_model'],
+                          critic_action_input=critic_action_input,
+                          memory=SequentialMemory(limit=memory_limit, window_length=1),
+                          nb_steps_warmup_critic=0, nb_steps_warmup_actor=0, gamma=0.99,
+                          target_model_update=target_model_update, batch_size=batch_size)
+        agent.compile(Adam(lr=0.001, clipnorm=1.), metrics=['mae'])
+        option_agents[option] = agent
+    option_learner = None
+    if shared_trunk:
+        option_learner = SharedTrunkOptionLearner(critic_optimizer=Adam(lr=0.001, clipnorm=1.),
+                                                  actor_optimizer=Adam(lr=0.001, clipnorm=1.))
+    dqn = DQNAgent4Hrl(processor=WhiteningNormalizerProcessor(), model=model_dict['upper_model'],
+                       turn_left_agent=option_agents['left'], go_straight_agent=option_agents['straight'],
+                       turn_right_agent=option_agents['right'], nb_actions=upper_nb_actions,
+                       memory=SequentialMemory(limit=memory_limit, window_length=1), nb_steps_warmup=0,
+                       target_model_update=target_model_update_upper, policy=BoltzmannQPolicy(),
+                       enable_double_dqn=True, batch_size=batch_size, option_learner=option_learner)
+    dqn.compile(Adam(lr=0.001), metrics=['mae'])
+    return dqn, option_agents
+
+
+def fill_memories(dqn, option_agents, nb_transitions):
+    from models import upper_nb_actions, lower_nb_actions, TIME_STEPS, TBD_total
+    for _ in range(nb_transitions):
+        dqn.memory.append(np.random.randn(TIME_STEPS, TBD_total), np.random.randint(upper_nb_actions),
+                          np.random.randn(), False)
+        for option, agent in option_agents.items():
+            agent.memory.append(np.random.randn(TIME_STEPS, OPTION_FEATURES[option]),
+                                np.random.uniform(-1, 1, lower_nb_actions), np.random.randn(), True)
+
+
+def time_per_call(fn, nb_calls):
+    fn()  # build/warm up
+    start = time.time()
+    for _ in range(nb_calls):
+        fn()
+    return (time.time() - start) / nb_calls * 1000
+
+
+def run(args):
+    configure_learner_runtime(intra_op_threads=args.intra_op_threads, inter_op_threads=args.inter_op_threads,
+                              onednn=None if args.onednn is None else bool(args.onednn))
+    import tensorflow as tf
+    from models import lower_nb_actions, TIME_STEPS, TBD_total
+    tf.compat.v1.disable_eager_execution()
+
+    dqn, option_agents = build_agent(args.batch_size, lstm_dtype=get_lstm_dtype(args.lstm_precision),
+                                     shared_trunk=args.shared_trunk)
+    fill_memories(dqn, option_agents, 4 * args.batch_size)
+
+    dqn.training = True
+    dqn.recent_observation = np.random.randn(TIME_STEPS, TBD_total)
+    dqn.recent_action = 1
+    for option, agent in option_agents.items():
+        agent.training = True
+        agent.step = 1
+        agent.recent_observation = np.random.randn(TIME_STEPS, OPTION_FEATURES[option])
+        agent.recent_action = np.zeros(lower_nb_actions)
+    dqn.step = 1
+
+    def learner_step():
+        dqn.backward(0., terminal=False)
+        dqn.step += 1
+        for agent in option_agents.values():
+            agent.step += 1
+
+    model_pairs = [(dqn.target_model, dqn.model)]
+    for agent in option_agents.values():
+        model_pairs += agent.target_model_pairs
+
+    def numpy_hard_update():
+        for target, source in model_pairs:
+            target.set_weights(source.get_weights())
+
+    step_ms = time_per_call(learner_step, args.steps)
+    print('learner step (soft target updates in graph): {:.2f} ms'.format(step_ms))
+    print('hard target update, get/set_weights:         {:.2f} ms'.format(time_per_call(numpy_hard_update, args.steps)))
+    print('hard target update, TargetModelUpdater:      {:.2f} ms'.format(
+        time_per_call(dqn.update_all_target_models_hard, args.steps)))
+    print('{} {:.2f}'.format(RESULT_PREFIX, 1000. / step_ms))
+
+
+def sweep(args):
+    print('{:>8} {:>8} {:>7} {:>10} {:>12}'.format('intra', 'inter', 'onednn', 'lstm', 'steps/sec'))
+    for threads in args.threads:
+        for onednn in [1, 0]:
+            for precision in args.lstm_precisions:
+                cmd = [sys.executable, os.path.abspath(__file__), '--steps', str(args.steps),
+                       '--batch-size', str(args.batch_size), '--intra-op-threads', str(threads),
+                       '--inter-op-threads', str(args.inter_op_threads or 1), '--onednn', str(onednn),
+                       '--lstm-precision', precision]
+                if args.shared_trunk:
+                    cmd.append('--shared-trunk')
+                proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                        universal_newlines=True)
+                out, _ = proc.communicate()
+                result = [line[len(RESULT_PREFIX):].strip() for line in out.splitlines()
+                          if line.startswith(RESULT_PREFIX)]
+                print('{:>8} {:>8} {:>7} {:>10} {:>12}'.format(threads, args.inter_op_threads or 1, onednn,
+                                                               precision, result[0] if result else 'failed'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--steps', type=int, default=200)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--intra-op-threads', type=int, default=None)
+    parser.add_argument('--inter-op-threads', type=int, default=None)
+    parser.add_argument('--onednn', type=int, choices=[0, 1], default=None)
+    parser.add_argument('--lstm-precision', choices=sorted(LSTM_PRECISIONS), default='float32')
+    parser.add_argument('--shared-trunk', action='store_true',
+                        help='train the option agents with SharedTrunkOptionLearner')
+    parser.add_argument('--sweep', action='store_true')
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--lstm-precisions', nargs='+', choices=sorted(LSTM_PRECISIONS),
+                        default=['float32', 'bfloat16'])
+    args = parser.parse_args()
+    if args.sweep:
+        sweep(args)
+    else:
+        run(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+"""Reproducible throughput benchmarks of the simulator, the observation encoder, the replay memories
+and the learner, and the import time of the env-side entry points.
+
+Every benchmark uses fixed seeds and inputs, runs headless on CPU and returns a dict of metrics
+`{name: dict(value=..., unit=..., higher_is_better=...)}`. Results are written as json and can be
+compared against a saved baseline, see `python -m benchmarks --help`.
+"""
+import importlib
+import os
+import platform
+import sys
+import time
+import traceback
+from collections import OrderedDict
+
+import numpy as np
+
+SEED = 0
+CURR_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SCENARIO = CURR_PATH + '/LasVSim/Scenario/Highway_endtoend/'
+RESULTS_VERSION = 1
+
+# benchmark name: module.function, imported on use so that e.g. the replay benchmarks run without SUMO
+BENCHMARKS = OrderedDict([
+    ('simulator', 'benchmarks.simulator.bench_simulator'),
+    ('numpy_simulator', 'benchmarks.simulator.bench_numpy_simulator'),
+    ('batch_simulator', 'benchmarks.simulator.bench_batch_simulator'),
+    ('encoder', 'benchmarks.encoder.bench_encoder'),
+    ('encoder_kernel', 'benchmarks.encoder.bench_encoder_kernel'),
+    ('replay', 'benchmarks.replay.bench_replay'),
+    ('learner', 'benchmarks.learner.bench_learner'),
+    ('imports', 'benchmarks.imports.bench_imports'),
+])
+
+
+def metric(value, unit, higher_is_better):
+    return dict(value=float(value), unit=unit, higher_is_better=higher_is_better)
+
+
+def time_per_call(fn, nb_calls, repeat=3):
+    """Best over `repeat` runs of the mean seconds per call of `fn`, after one warm up call."""
+    fn()
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(nb_calls):
+            fn()
+        best = min(best, (time.perf_counter() - start) / nb_calls)
+    return best
+
+
+def _load(path):
+    module_name, function_name = path.rsplit('.', 1)
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+def run_benchmarks(names=None, quick=False, verbose=True):
+    """Run the benchmarks `names` (all if None) and return the results document.
+
+    A benchmark that fails, e.g. because SUMO or TensorFlow is missing, is recorded with its error
+    and does not stop the others.
+    """
+    names = list(BENCHMARKS) if names is None else names
+    results = OrderedDict()
+    errors = {}
+    for name in names:
+        if verbose:
+            print('running {} ...'.format(name))
+        np.random.seed(SEED)
+        try:
+            for key, value in _load(BENCHMARKS[name])(quick=quick).items():
+                results[name + '.' + key] = value
+        except Exception:
+            errors[name] = traceback.format_exc(limit=3)
+            if verbose:
+                print(errors[name])
+    return dict(version=RESULTS_VERSION,
+                meta=dict(python=sys.version.split()[0], numpy=np.__version__, platform=platform.platform(),
+                          processor=platform.processor(), cpu_count=os.cpu_count(), seed=SEED, quick=quick,
+                          time=time.strftime('%Y-%m-%d %H:%M:%S')),
+                benchmarks=names, results=results, errors=errors)
+
+
+def compare(results, baseline, tolerance=0.1):
+    """Compare two results documents metric by metric.
+
+    # Returns
+        A list of (name, baseline value, value, relative change, regressed) for the metrics in both,
+        the relative change is positive for improvements and `regressed` is True when the metric got
+        worse by more than `tolerance`. Benchmarks that failed and baseline metrics of the benchmarks
+        that ran but are missing from `results` are regressions too, with None as value and change.
+    """
+    rows = []
+    for name in results['errors']:
+        rows.append((name, None, None, None, True))
+    ran = set(results.get('benchmarks', list(results['errors']) +
+                          [metric_name.split('.', 1)[0] for metric_name in results['results']]))
+    for name, result in baseline['results'].items():
+        if name.split('.', 1)[0] in ran and name not in results['results']:
+            rows.append((name, result['value'], None, None, True))
+    for name, result in results['results'].items():
+        if name not in baseline['results']:
+            continue
+        old, new = baseline['results'][name]['value'], result['value']
+        change = (new - old) / abs(old) if old else 0.
+        if not result['higher_is_better']:
+            change = -change
+        rows.append((name, old, new, change, change < -tolerance))
+    return rows
+
+
+def format_results(results):
+    lines = ['{:<40} {:>14} {}'.format('metric', 'value', 'unit')]
+    for name, result in results['results'].items():
+        lines.append('{:<40} {:>14.4g} {}'.format(name, result['value'], result['unit']))
+    for name in results['errors']:
+        lines.append('{:<40} {:>14}'.format(name, 'failed'))
+    return '\n'.join(lines)
+
+
+def format_comparison(rows):
+    lines = ['{:<40} {:>12} {:>12} {:>9}'.format('metric', 'baseline', 'current', 'change')]
+    for name, old, new, change, regressed in rows:
+        if new is None:
+            # a failed benchmark has no baseline value, a missing metric has one
+            lines.append('{:<40} {:>12} {:>12}'.format(name, '' if old is None else '{:.4g}'.format(old),
+                                                       'FAILED' if old is None else 'MISSING'))
+            continue
+        lines.append('{:<40} {:>12.4g} {:>12.4g} {:>+8.1f}%{}'.format(
+            name, old, new, change * 100, '  REGRESSION' if regressed else ''))
+    return '\n'.join(lines)
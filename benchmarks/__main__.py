@@ -0,0 +1,40 @@
+"""Run the benchmarks, optionally save the results and compare them against a baseline.
+
+usage: python -m benchmarks --output results.json
+       python -m benchmarks --only replay encoder --quick
+       python -m benchmarks --baseline baseline.json --tolerance 0.1
+Exits with status 1 if a metric regressed by more than the tolerance, a benchmark failed or a metric of the
+baseline is missing.
+"""
+import argparse
+import json
+import sys
+
+from benchmarks import BENCHMARKS, run_benchmarks, compare, format_results, format_comparison
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS), default=None)
+    parser.add_argument('--quick', action='store_true', help='fewer iterations, for smoke tests')
+    parser.add_argument('--output', default=None, help='write the results as json')
+    parser.add_argument('--baseline', default=None, help='results json of an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='relative slowdown counted as regression')
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.only, quick=args.quick)
+    print(format_results(results))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        rows = compare(results, baseline, args.tolerance)
+        print(format_comparison(rows))
+        if any(regressed for *_, regressed in rows):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
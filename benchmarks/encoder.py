@@ -0,0 +1,103 @@
+"""Observation encoder cost per frame on fixed synthetic highway frames, without SUMO, and the speedup of the
+compiled encoding kernel over the Python encoding."""
+from collections import deque
+
+import numpy as np
+
+from benchmarks import SEED, metric, time_per_call
+
+NB_FRAMES = 200
+NB_VEHICLES = 40
+
+
+def make_frames(nb_frames=NB_FRAMES, nb_vehicles=NB_VEHICLES, seed=SEED):
+    """Frames `[all_vehicles, ego_dynamics, ego_road_related_info]` as kept by `EndtoendEnv.obs_deque`."""
+    from LasVSim.endtoend import ObservationWrapper
+    rng = np.random.RandomState(seed)
+    frames = []
+    for _ in range(nb_frames):
+        ego_x = rng.uniform(-800, 200)
+        ego_lane = rng.randint(4)
+        vehicles = []
+        for _ in range(nb_vehicles):
+            lane = rng.randint(4)
+            x = ego_x + rng.uniform(-100, 100)
+            if lane == ego_lane and abs(x - ego_x) < 5:
+                x += 10
+            vehicles.append(dict(x=x, y=ObservationWrapper.laneindex2centery(lane) + rng.uniform(-0.3, 0.3),
+                                 v=rng.uniform(10, 30), angle=0., length=4.5, width=1.8, lane_index=lane))
+        ego_dynamics = dict(x=ego_x, y=ObservationWrapper.laneindex2centery(ego_lane), v=rng.uniform(0, 25),
+                            heading=0., length=4.5, width=1.8)
+        road_info = dict(dist2current_lane_center=rng.uniform(-0.5, 0.5), egolane_index=ego_lane)
+        frames.append([vehicles, ego_dynamics, road_info])
+    return frames
+
+
+def make_encoder(history_len=10):
+    """An `ObservationWrapper` around a bare `EndtoendEnv` that only carries the area of interest."""
+    from LasVSim.endtoend import EndtoendEnv, ObservationWrapper
+    env = EndtoendEnv.__new__(EndtoendEnv)
+    env.interested_rear_dist = 30
+    env.interested_front_dist = 60
+    encoder = ObservationWrapper.__new__(ObservationWrapper)
+    encoder.env = env
+    encoder.interested_vehicles = []
+    encoder.interested_rear_dist = env.interested_rear_dist
+    encoder.interested_front_dist = env.interested_front_dist
+    encoder.history_len = history_len
+    encoder.encode_vec_len = 56
+    encoder.encoded_obs = np.zeros((history_len, encoder.encode_vec_len))
+    return encoder
+
+
+def bench_encoder(quick=False):
+    frames = make_frames()
+    encoder = make_encoder()
+    nb_calls = 2 if quick else 20
+
+    def encode_all():
+        for frame in frames:
+            encoder.observation(deque([frame]))
+
+    seconds = time_per_call(encode_all, nb_calls) / len(frames)
+    return dict(us_per_frame=metric(seconds * 1e6, 'us/frame', False))
+
+
+def encode_python(encoder, frame):
+    """One frame encoded by the Python path of `ObservationWrapper.observation`, whether numba is there or not."""
+    vehicles, ego, road = frame
+    encoder.interested_vehicles = [veh for veh in vehicles
+                                   if encoder.is_in_interested_area(ego['x'], veh['x'], veh['y'])
+                                   and veh['lane_index'] in encoder._interested_lane_index(road['egolane_index'])]
+    return np.array(encoder._divide_6parts_and_encode(ego['x'], ego['y'], ego['v'], ego['heading'], ego['length'],
+                                                      ego['width'], road['dist2current_lane_center'],
+                                                      road['egolane_index']), dtype=float)
+
+
+def encode_kernel(encoder, frame):
+    """One frame encoded by `kernels.encode_frame`, including the conversion of the vehicles to arrays."""
+    from LasVSim.kernels import encode_frame, vehicle_arrays
+    vehicles, ego, road = frame
+    return encode_frame(np.empty(encoder.encode_vec_len), ego['x'], ego['y'], ego['v'], ego['heading'],
+                        ego['length'], ego['width'], road['dist2current_lane_center'], road['egolane_index'],
+                        *vehicle_arrays(vehicles), encoder.interested_rear_dist, encoder.interested_front_dist)
+
+
+def bench_encoder_kernel(quick=False):
+    """Fails if numba is missing or if the kernel does not encode the frames exactly like the Python path."""
+    from LasVSim.kernels import HAVE_NUMBA
+    if not HAVE_NUMBA:
+        raise ImportError('numba is not installed (or disabled by LASVSIM_KERNELS)')
+    frames = make_frames()
+    encoder = make_encoder()
+    for index, frame in enumerate(frames):
+        error = np.abs(encode_kernel(encoder, frame) - encode_python(encoder, frame)).max()
+        if error > 0:
+            raise AssertionError('encoding of frame {} differs by {}'.format(index, error))
+    nb_calls = 2 if quick else 20
+
+    python_seconds = time_per_call(lambda: [encode_python(encoder, frame) for frame in frames], nb_calls)
+    kernel_seconds = time_per_call(lambda: [encode_kernel(encoder, frame) for frame in frames], nb_calls)
+    return dict(python_us_per_frame=metric(python_seconds / len(frames) * 1e6, 'us/frame', False),
+                kernel_us_per_frame=metric(kernel_seconds / len(frames) * 1e6, 'us/frame', False),
+                speedup=metric(python_seconds / kernel_seconds, 'x', True))
@@ -0,0 +1,39 @@
+"""Import time of the env-side entry points in a fresh interpreter, and a check that they stay free of TensorFlow
+and matplotlib."""
+import subprocess
+import sys
+
+from benchmarks import CURR_PATH, metric
+
+# modules imported by env workers, rollout and evaluation processes
+ENTRY_POINTS = ['LasVSim.endtoend', 'LasVSim.batch_endtoend', 'rl.inference', 'rl.processors']
+FORBIDDEN_MODULES = ['tensorflow', 'keras', 'matplotlib']
+
+_IMPORT_CODE = '''import sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(seconds)
+print(' '.join(name for name in {forbidden} if name in sys.modules))'''
+
+
+def import_seconds(module):
+    """Seconds to import `module` in a new interpreter and the forbidden modules it loaded."""
+    code = _IMPORT_CODE.format(module=module, forbidden=FORBIDDEN_MODULES)
+    output = subprocess.check_output([sys.executable, '-c', code], cwd=CURR_PATH, universal_newlines=True)
+    lines = output.split('\n')
+    return float(lines[-3]), lines[-2].split()
+
+
+def bench_imports(quick=False):
+    repeat = 1 if quick else 5
+    results = {}
+    for module in ENTRY_POINTS:
+        seconds = []
+        for _ in range(repeat):
+            duration, loaded = import_seconds(module)
+            if loaded:
+                raise AssertionError('importing {} loads {}'.format(module, ', '.join(loaded)))
+            seconds.append(duration)
+        results[module.replace('.', '_') + '_import'] = metric(min(seconds) * 1e3, 'ms', False)
+    return results
@@ -0,0 +1,38 @@
+"""Learner step rate and action selection latency of the hierarchical agent on random replay data.
+
+Uses the agent of `benchmark_learner.py`, see there for the thread/precision sweep.
+"""
+import numpy as np
+
+from benchmarks import SEED, metric, time_per_call
+
+
+def bench_learner(quick=False, batch_size=32):
+    import tensorflow as tf
+    from benchmark_learner import build_agent, fill_memories, OPTION_FEATURES
+    from models import lower_nb_actions, TIME_STEPS, TBD_total
+    tf.compat.v1.disable_eager_execution()
+    tf.compat.v1.set_random_seed(SEED)
+    np.random.seed(SEED)
+
+    dqn, option_agents = build_agent(batch_size)
+    fill_memories(dqn, option_agents, 4 * batch_size)
+    dqn.training = True
+    dqn.recent_observation = np.random.randn(TIME_STEPS, TBD_total)
+    dqn.recent_action = 1
+    for option, agent in option_agents.items():
+        agent.training = True
+        agent.recent_observation = np.random.randn(TIME_STEPS, OPTION_FEATURES[option])
+        agent.recent_action = np.zeros(lower_nb_actions)
+    dqn._set_step(1)
+
+    def learner_step():
+        dqn.backward(0., terminal=False)
+        dqn._set_step(dqn.step + 1)
+
+    observation = np.random.randn(TIME_STEPS, TBD_total)
+    nb_calls = 10 if quick else 100
+    step_seconds = time_per_call(learner_step, nb_calls)
+    forward_seconds = time_per_call(lambda: dqn.forward(observation), nb_calls)
+    return dict(steps_per_sec=metric(1. / step_seconds, 'steps/s', True),
+                forward_latency=metric(forward_seconds * 1e3, 'ms', False))
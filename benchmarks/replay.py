@@ -0,0 +1,31 @@
+"""Replay memory sample latency against the number of stored transitions."""
+import numpy as np
+
+from benchmarks import SEED, metric, time_per_call
+
+MEMORY_SIZES = [1000, 10000, 50000]
+BATCH_SIZE = 32
+NB_DISTINCT_OBSERVATIONS = 1000
+
+
+def _filled(memory, nb_transitions, rng):
+    # the memories keep references, a pool of distinct observations keeps large memories small in RAM
+    observations = [rng.randn(10, 56) for _ in range(NB_DISTINCT_OBSERVATIONS)]
+    for idx in range(nb_transitions):
+        memory.append(observations[idx % NB_DISTINCT_OBSERVATIONS], rng.uniform(-1, 1, 2), rng.randn(), False)
+    return memory
+
+
+def bench_replay(quick=False):
+    from rl.memory import SequentialMemory, OptionViewMemory
+    results = {}
+    nb_calls = 100 if quick else 1000
+    for size in MEMORY_SIZES[:2] if quick else MEMORY_SIZES:
+        rng = np.random.RandomState(SEED)
+        upper = _filled(SequentialMemory(limit=size, window_length=1), size, rng)
+        option = _filled(OptionViewMemory(limit=size, option='left', window_length=1), size, rng)
+        results['sequential_sample_{}'.format(size)] = metric(
+            time_per_call(lambda: upper.sample(BATCH_SIZE), nb_calls) * 1e6, 'us/batch', False)
+        results['option_view_sample_{}'.format(size)] = metric(
+            time_per_call(lambda: option.sample(BATCH_SIZE), nb_calls) * 1e6, 'us/batch', False)
+    return results
@@ -0,0 +1,78 @@
+"""Traffic tick rate, env step rate and reset latency of the highway scenario, with SUMO or the numpy traffic,
+and the env step rate of the batched numpy env."""
+import time
+
+import numpy as np
+
+from benchmarks import DEFAULT_SCENARIO, SEED, metric
+
+STRAIGHT_ACTION = [1, 30., 0.]  # keep the lane, 30 m ahead, constant speed
+
+
+def _init_states(nb_states):
+    from LasVSim.endtoend import sample_init_state
+    rng = np.random.RandomState(SEED)
+    return [sample_init_state(rng) for _ in range(nb_states)]
+
+
+def bench_simulator(quick=False, scenario=DEFAULT_SCENARIO, traffic_engine='sumo'):
+    from LasVSim import lasvsim
+    from LasVSim.endtoend import EndtoendEnv, ObservationWrapper
+    nb_resets = 3 if quick else 10
+    nb_steps = 5 if quick else 50
+    nb_ticks = 50 if quick else 500
+
+    env = ObservationWrapper(EndtoendEnv(setting_path=scenario, plan_horizon=30, history_len=10,
+                                         traffic_engine=traffic_engine))
+    env.seed(SEED)
+    init_states = _init_states(nb_resets)
+
+    reset_seconds = []
+    for init_state in init_states:
+        start = time.perf_counter()
+        env.reset(init_state=init_state)
+        reset_seconds.append(time.perf_counter() - start)
+
+    # env steps with a fixed action, restarting from the same initial states when an episode ends
+    steps, step_seconds = 0, 0.
+    env.reset(init_state=init_states[0])
+    while steps < nb_steps:
+        start = time.perf_counter()
+        _, _, done, _ = env.step(STRAIGHT_ACTION)
+        step_seconds += time.perf_counter() - start
+        steps += 1
+        if done:
+            env.reset(init_state=init_states[steps % nb_resets])
+
+    # bare traffic ticks, the ego is not moved, called on the traffic module so that a collision with the
+    # standing ego does not stop the simulation
+    env.reset(init_state=init_states[0])
+    traffic = lasvsim.simulation.traffic
+    start = time.perf_counter()
+    for _ in range(nb_ticks):
+        traffic.sim_step()
+        traffic.get_vehicles()
+    tick_seconds = time.perf_counter() - start
+
+    return dict(ticks_per_sec=metric(nb_ticks / tick_seconds, 'ticks/s', True),
+                env_steps_per_sec=metric(steps / step_seconds, 'steps/s', True),
+                reset_latency=metric(np.median(reset_seconds) * 1e3, 'ms', False))
+
+
+def bench_numpy_simulator(quick=False, scenario=DEFAULT_SCENARIO):
+    return bench_simulator(quick, scenario, traffic_engine='numpy')
+
+
+def bench_batch_simulator(quick=False, scenario=DEFAULT_SCENARIO, nb_envs=64):
+    from LasVSim.batch_endtoend import BatchEndtoendEnv
+    nb_steps = 3 if quick else 20
+
+    env = BatchEndtoendEnv(nb_envs, scenario, plan_horizon=30, history_len=10, seed=SEED)
+    env.reset()
+    actions = np.tile(STRAIGHT_ACTION, (nb_envs, 1))
+    start = time.perf_counter()
+    for _ in range(nb_steps):
+        env.step_async(actions)
+        env.step_wait()
+    step_seconds = time.perf_counter() - start
+    return dict(env_steps_per_sec=metric(nb_envs * nb_steps / step_seconds, 'steps/s', True))
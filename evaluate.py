@@ -0,0 +1,162 @@
+"""Reproducible batch evaluation of an exported hierarchical policy across a process pool.
+
+A fixed list of episodes (scenario, env seed and initial ego state, all drawn from `--seed`) is run by
+`--workers` processes, each with its own LasVSim instance and its own `rl.inference.HrlPolicy` (or a
+connection to a shared `rl.policy_server`). Nothing is rendered. Per episode results and a summary by
+done type are printed, optionally written to csv, so two checkpoints evaluated with the same seed see
+exactly the same initial states.
+
+usage: python export_policy.py rl/checkpoints/model_step10000.npz policy.npz
+       python evaluate.py policy.npz --episodes 100 --workers 8 --seed 0 --output eval.csv
+"""
+import argparse
+import csv
+import multiprocessing
+import os
+import time
+import numpy as np
+
+CURR_PATH = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SCENARIO = CURR_PATH + '/LasVSim/Scenario/Highway_endtoend/'
+DONE_TYPES = {0: 'road_violation', 1: 'collision', 2: 'complete', 3: 'max_steps'}
+RESULT_FIELDS = ['episode', 'scenario', 'seed', 'init_x', 'init_y', 'init_v', 'done_type', 'reward', 'steps',
+                 'seconds']
+
+
+def make_eval_cases(nb_episodes, seed=0, scenarios=(DEFAULT_SCENARIO,)):
+    """Deterministic list of episodes: scenario, env seed and initial ego state of each."""
+    from LasVSim.endtoend import sample_init_state
+    rng = np.random.RandomState(seed)
+    cases = []
+    for episode in range(nb_episodes):
+        cases.append(dict(episode=episode,
+                          scenario=scenarios[episode % len(scenarios)],
+                          seed=int(rng.randint(2 ** 31 - 1)),
+                          init_state=[float(value) for value in sample_init_state(rng)]))
+    return cases
+
+
+_worker = {}
+
+
+def _init_worker(policy_path, policy_address, plan_horizon, history_len, max_steps):
+    from rl.inference import HrlPolicy
+    from rl.policy_server import PolicyClient
+    _worker['policy'] = PolicyClient(policy_address) if policy_address else HrlPolicy(policy_path)
+    _worker['plan_horizon'] = plan_horizon
+    _worker['history_len'] = history_len
+    _worker['max_steps'] = max_steps
+    _worker['envs'] = {}
+
+
+def _get_env(scenario):
+    # LasVSim keeps one simulation per process, so a worker switches scenarios by rebuilding the env
+    if scenario not in _worker['envs']:
+        from LasVSim.endtoend import EndtoendEnv, ObservationWrapper
+        _worker['envs'].clear()
+        env = EndtoendEnv(setting_path=scenario, plan_horizon=_worker['plan_horizon'],
+                          history_len=_worker['history_len'])
+        _worker['envs'][scenario] = ObservationWrapper(env)
+    return _worker['envs'][scenario]
+
+
+def run_case(case):
+    """Run one episode of `make_eval_cases` in the current worker and return its result row."""
+    from rl.inference import process_action
+    start = time.time()
+    env = _get_env(case['scenario'])
+    env.seed(case['seed'])
+    policy = _worker['policy']
+    max_steps = _worker['max_steps']
+    if max_steps is None:  # same limit as main.py: episode length / (times per action * min v)
+        naive_env = env.unwrapped
+        max_steps = int(naive_env.goal_length /
+                        ((naive_env.simulation.step_length / 1000 * naive_env.horizon) * 5))
+
+    observation = env.reset(init_state=case['init_state'])
+    episode_reward = 0.
+    done_type = 3
+    steps = 0
+    done = False
+    while not done and steps < max_steps:
+        action = process_action(policy.forward(observation))
+        observation, reward, done, info = env.step(action)
+        episode_reward += reward
+        done_type = info['done_type']
+        steps += 1
+    return dict(episode=case['episode'], scenario=os.path.basename(os.path.normpath(case['scenario'])),
+                seed=case['seed'], init_x=case['init_state'][0], init_y=case['init_state'][1],
+                init_v=case['init_state'][2], done_type=DONE_TYPES[done_type], reward=episode_reward,
+                steps=steps, seconds=time.time() - start)
+
+
+def evaluate(policy_path, cases, nb_workers=1, policy_address=None, plan_horizon=30, history_len=10,
+             max_steps=None):
+    """Run `cases` across `nb_workers` processes.
+
+    # Returns
+        The result rows sorted by episode and the wall clock time in seconds.
+    """
+    start = time.time()
+    initargs = (policy_path, policy_address, plan_horizon, history_len, max_steps)
+    if nb_workers <= 1:
+        _init_worker(*initargs)
+        results = [run_case(case) for case in cases]
+    else:
+        pool = multiprocessing.Pool(nb_workers, initializer=_init_worker, initargs=initargs)
+        try:
+            results = list(pool.imap_unordered(run_case, cases))
+        finally:
+            pool.close()
+            pool.join()
+    return sorted(results, key=lambda row: row['episode']), time.time() - start
+
+
+def summarize(results, wall_time):
+    lines = ['{:>16} {:>9} {:>7} {:>12} {:>10}'.format('done_type', 'episodes', 'ratio', 'mean_reward', 'mean_steps')]
+    for done_type in DONE_TYPES.values():
+        rows = [row for row in results if row['done_type'] == done_type]
+        if rows:
+            lines.append('{:>16} {:>9} {:>7.2f} {:>12.2f} {:>10.1f}'.format(
+                done_type, len(rows), len(rows) / float(len(results)),
+                np.mean([row['reward'] for row in rows]), np.mean([row['steps'] for row in rows])))
+    lines.append('{:>16} {:>9} {:>7.2f} {:>12.2f} {:>10.1f}'.format(
+        'all', len(results), 1., np.mean([row['reward'] for row in results]),
+        np.mean([row['steps'] for row in results])))
+    lines.append('{} episodes in {:.1f} s, {:.2f} episodes/sec'.format(
+        len(results), wall_time, len(results) / wall_time))
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('policy', help='policy artifact written by export_policy.py')
+    parser.add_argument('--episodes', type=int, default=100)
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--scenarios', nargs='+', default=[DEFAULT_SCENARIO])
+    parser.add_argument('--max-steps', type=int, default=None)
+    parser.add_argument('--server', default=None,
+                        help='query a running rl.policy_server at this Unix socket path or host:port instead')
+    parser.add_argument('--output', default=None, help='csv file for the per episode results')
+    args = parser.parse_args()
+
+    policy_address = args.server
+    if policy_address and ':' in policy_address:
+        host, port = policy_address.rsplit(':', 1)
+        policy_address = (host, int(port))
+    cases = make_eval_cases(args.episodes, args.seed, args.scenarios)
+    results, wall_time = evaluate(args.policy, cases, args.workers, policy_address, max_steps=args.max_steps)
+    for row in results:
+        print('{episode:>5} {seed:>11} x={init_x:8.1f} y={init_y:8.2f} v={init_v:5.1f} {done_type:>15} '
+              'reward={reward:9.2f} steps={steps:4d} {seconds:6.1f}s'.format(**row))
+    print(summarize(results, wall_time))
+    if args.output:
+        with open(args.output, 'w') as f:
+            writer = csv.DictWriter(f, fieldnames=RESULT_FIELDS)
+            writer.writeheader()
+            writer.writerows(results)
+
+
+if __name__ == '__main__':
+    main()
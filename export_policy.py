@@ -0,0 +1,88 @@
+"""Export a training checkpoint into a single inference artifact served by `rl.inference.HrlPolicy`.
+
+Only the networks are built, no environment, memories or optimizers. Both the single file `.npz`
+checkpoints of `ModelIntervalCheckpoint(asynchronous=True)` and the legacy `.h5f` + normalizer files
+are accepted. The exported policy is checked against the Keras models on random observations.
+
+usage: python export_policy.py rl/checkpoints/model_step10000.npz policy.npz
+"""
+import argparse
+import os
+import time
+import numpy as np
+
+
+def load_checkpoint(filepath, model_dict):
+    """Load the upper model, the actors and the normalizers of a checkpoint into `model_dict`."""
+    from rl.util import WhiteningNormalizer, load_weights_snapshot
+
+    normalizers = {}
+    filename, extension = os.path.splitext(filepath)
+    if extension == '.npz':
+        snapshot = load_weights_snapshot(filepath)
+        model_dict['upper_model'].set_weights(snapshot['upper'])
+        for option in ['left', 'straight', 'right']:
+            model_dict[option + '_actor_model'].set_weights(snapshot[option]['actor'])
+        for name, state in snapshot.get('normalizer', {}).items():
+            normalizers[name] = WhiteningNormalizer(shape=tuple(state['shape']))
+            normalizers[name].set_state(state)
+        return normalizers
+
+    model_dict['upper_model'].load_weights(filepath)
+    stats_filenames = dict(upper=filename)
+    for option in ['left', 'straight', 'right']:
+        option_filename = filename + '_' + option + '_model'
+        model_dict[option + '_actor_model'].load_weights(option_filename + '_actor' + extension)
+        stats_filenames[option] = option_filename
+    for name, stats_filename in stats_filenames.items():
+        for stats_filepath in [stats_filename + '_stats.npz', stats_filename + '.pickle']:
+            if os.path.exists(stats_filepath):
+                normalizers[name] = WhiteningNormalizer(shape=(1,))
+                normalizers[name].load_param(stats_filepath)
+                break
+    return normalizers
+
+
+def check_parity(policy, model_dict, normalizers, nb_samples=64):
+    from models import TIME_STEPS, TBD_total
+    from rl.inference import make_option_observations
+
+    def normalize(name, x):
+        return normalizers[name].normalize(x) if name in normalizers else x
+
+    observations = np.random.randn(nb_samples, TIME_STEPS, TBD_total).astype(np.float32)
+    errors = [np.max(np.abs(policy.q_values(observations) -
+                            model_dict['upper_model'].predict_on_batch(normalize('upper', observations))))]
+    for option in ['left', 'straight', 'right']:
+        option_observations = make_option_observations(observations, option)
+        keras_actions = model_dict[option + '_actor_model'].predict_on_batch(normalize(option, option_observations))
+        errors.append(np.max(np.abs(policy.option_actions(observations, option) - keras_actions)))
+    return max(errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('checkpoint')
+    parser.add_argument('output')
+    args = parser.parse_args()
+
+    import tensorflow as tf
+    from models import build_models
+    from rl.export import export_hrl_policy
+    from rl.inference import HrlPolicy
+    tf.compat.v1.disable_eager_execution()
+
+    model_dict, _ = build_models()
+    normalizers = load_checkpoint(args.checkpoint, model_dict)
+    actors = {option: model_dict[option + '_actor_model'] for option in ['left', 'straight', 'right']}
+    export_hrl_policy(args.output, model_dict['upper_model'], actors, normalizers)
+
+    start = time.time()
+    policy = HrlPolicy(args.output)
+    print('exported {} ({:.1f} kB), loaded in {:.1f} ms'.format(
+        args.output, os.path.getsize(args.output) / 1024., (time.time() - start) * 1000))
+    print('max abs difference to the keras models: {:.2e}'.format(check_parity(policy, model_dict, normalizers)))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,33 +1,30 @@
 import numpy as np
-import gym
 import os
 from LasVSim.endtoend import EndtoendEnv, ObservationWrapper
 import tensorflow as tf
-from tensorflow.python import keras
-from tensorflow.python.keras import layers, Model, Sequential, Input
-from tensorflow.python.keras.layers import Lambda
 from tensorflow.python.keras.optimizers import Adam
 #
 from rl.agents.dqn4hrl import DQNAgent4Hrl
 from rl.policy import BoltzmannQPolicy
-from rl.memory import SequentialMemory
+from rl.memory import SequentialMemory, OptionViewMemory
 from rl.random import OrnsteinUhlenbeckProcess
 from rl.agents.ddpg import DDPGAgent
+from rl.agents.option_learner import SharedTrunkOptionLearner
 from rl.processors import WhiteningNormalizerProcessor
 from rl.common.misc_util import set_global_seeds
+from models import build_models, upper_nb_actions, lower_nb_actions, TIME_STEPS
+from rl.common.runtime import configure_learner_runtime, get_lstm_dtype
+from rl.common.profiler import Profiler, instrument_hrl_agent
+from rl.callbacks import ProfilerLogger
 
 
 tf.compat.v1.disable_eager_execution()
+# learner runtime, see benchmark_learner.py --sweep for the fastest setting of a machine
+LEARNER_INTRA_OP_THREADS = None  # None for TF's default
+LEARNER_INTER_OP_THREADS = None
+LSTM_PRECISION = 'float32'  # 'float32', 'bfloat16' or 'float16'
+configure_learner_runtime(intra_op_threads=LEARNER_INTRA_OP_THREADS, inter_op_threads=LEARNER_INTER_OP_THREADS)
 
-upper_nb_actions = 3
-lower_nb_actions = 2
-TIME_STEPS = 10
-TBD_total = 56
-TBD_left = 38
-TBD_straight = 56
-TBD_right = 38
-LSTM_HIDDEN = 128
-ENCODE_LSTM_HIDDEN = 64
 # Get the environment and extract the number of actions.
 curr_path = os.path.dirname(__file__)
 env = EndtoendEnv(setting_path=curr_path + '/LasVSim/Scenario/Highway_endtoend/', plan_horizon=30, history_len=TIME_STEPS)
@@ -37,109 +34,6 @@ env.seed(11)
 # nb_actions = env.action_space.n
 
 
-def build_models():
-    # build upper model.
-    upper_model = Sequential(name='upper_model')
-    upper_model.add(layers.LSTM(128, input_shape=(TIME_STEPS, TBD_total)))  # A 3D tensor [batch, timesteps, inputdim]
-    upper_model.add(layers.Dense(upper_nb_actions, activation='relu'))
-
-    # build lower actor shared part----------------------------------------------
-    actor_lstm_model = Sequential(name='shared_actor_lstm_model')
-    actor_lstm_model.add(layers.LSTM(LSTM_HIDDEN, input_shape=(TIME_STEPS, ENCODE_LSTM_HIDDEN)))
-
-    dense_lstm_input = Input(shape=(LSTM_HIDDEN,))
-    dense_indicator_input = Input(shape=(3,))
-    dense_input = layers.concatenate([dense_lstm_input, dense_indicator_input])
-    h = layers.Dense(32)(dense_input)
-    # prob_output = layers.Dense(1, activation='sigmoid')(h)
-    # vel_output = layers.Dense(1, activation='relu')(h)
-    # out = layers.concatenate([prob_output, vel_output], axis=1)
-    out = layers.Dense(2, activation='tanh')(h)
-    actor_dense_model = Model(inputs=[dense_lstm_input, dense_indicator_input],
-                              outputs=out, name='shared_actor_dense_model')
-
-    # build lower actor left
-    left_state_input = Input(shape=(TIME_STEPS, TBD_left + 3), name='state_left')
-    lstm_input_left = Lambda(lambda x: x[:, :, :-3], output_shape=(TIME_STEPS, TBD_left))(left_state_input)
-    indicator_input_left = Lambda(lambda x: x[:, 0, -3:], output_shape=(3,))(left_state_input)
-
-    encoded_tensor = layers.LSTM(ENCODE_LSTM_HIDDEN, return_sequences=True, name='actor_left_encoder')(
-        lstm_input_left)
-    lstm_out = actor_lstm_model(encoded_tensor)  # reuse lstm_model
-    out = actor_dense_model([lstm_out, indicator_input_left])  # reuse dense_model
-    left_actor_model = Model(inputs=left_state_input,
-                             outputs=out, name='left_actor_model')
-
-    # build lower actor straight
-    straight_state_input = Input(shape=(TIME_STEPS, TBD_straight + 3), name='state_straight')
-    lstm_input_straight = Lambda(lambda x: x[:, :, :-3], output_shape=(TIME_STEPS, TBD_straight))(straight_state_input)
-    indicator_input_straight = Lambda(lambda x: x[:, 0, -3:], output_shape=(3,))(straight_state_input)
-
-    encoded_tensor = layers.LSTM(ENCODE_LSTM_HIDDEN, return_sequences=True, name='actor_straight_encoder')(
-        lstm_input_straight)
-    lstm_out = actor_lstm_model(encoded_tensor)  # reuse lstm_model
-    out = actor_dense_model([lstm_out, indicator_input_straight])  # reuse dense_model
-    straight_actor_model = Model(inputs=straight_state_input,
-                                 outputs=out, name='straight_actor_model')
-
-    # build lower actor right
-    right_state_input = Input(shape=(TIME_STEPS, TBD_right + 3), name='state_right')
-    lstm_input_right = Lambda(lambda x: x[:, :, :-3], output_shape=(TIME_STEPS, TBD_right))(right_state_input)
-    indicator_input_right = Lambda(lambda x: x[:, 0, -3:], output_shape=(3,))(right_state_input)
-
-    encoded_tensor = layers.LSTM(ENCODE_LSTM_HIDDEN, return_sequences=True, name='actor_right_encoder')(
-        lstm_input_right)
-    lstm_out = actor_lstm_model(encoded_tensor)  # reuse lstm_model
-    out = actor_dense_model([lstm_out, indicator_input_right])  # reuse dense_model
-    right_actor_model = Model(inputs=right_state_input,
-                              outputs=out, name='right_actor_model')
-
-    # build lower critic shared part--------------------------------------------
-    critic_lstm_model = Sequential(name='shared_critic_lstm_model')
-    critic_lstm_model.add(layers.LSTM(LSTM_HIDDEN, input_shape=(TIME_STEPS, ENCODE_LSTM_HIDDEN)))
-
-    dense_lstm_input = Input(shape=(LSTM_HIDDEN,))
-    dense_action_input = Input(shape=(2,))
-    dense_indicator_input = Input(shape=(3,))
-    dense_input = layers.concatenate([dense_lstm_input, dense_action_input, dense_indicator_input])
-    h = layers.Dense(32)(dense_input)
-    q_output = layers.Dense(1, activation='relu')(h)
-    critic_dense_model = Model(inputs=[dense_lstm_input, dense_action_input, dense_indicator_input],
-                                        outputs=q_output, name='shared_critic_dense_model')
-
-    # build lower critic left
-    action_input = Input(shape=(2,), name='action')
-
-    encoded_tensor = layers.LSTM(ENCODE_LSTM_HIDDEN, return_sequences=True, name='critic_left_encoder')(
-        lstm_input_left)
-    lstm_out = critic_lstm_model(encoded_tensor)  # reuse lstm_model
-    q_output = critic_dense_model([lstm_out, action_input, indicator_input_left])  # reuse dense_model
-    left_critic_model = Model(inputs=[left_state_input, action_input],
-                              outputs=q_output, name='left_critic_model')
-
-    # build lower critic straight
-    encoded_tensor = layers.LSTM(ENCODE_LSTM_HIDDEN, return_sequences=True, name='critic_straight_encoder')(
-        lstm_input_straight)
-    lstm_out = critic_lstm_model(encoded_tensor)  # reuse lstm_model
-    q_output = critic_dense_model([lstm_out, action_input, indicator_input_straight])  # reuse dense_model
-    straight_critic_model = Model(inputs=[straight_state_input, action_input],
-                                  outputs=q_output, name='straight_critic_model')
-
-    # build lower critic right
-    encoded_tensor = layers.LSTM(ENCODE_LSTM_HIDDEN, return_sequences=True, name='critic_right_encoder')(
-        lstm_input_right)
-    lstm_out = critic_lstm_model(encoded_tensor)  # reuse lstm_model
-    q_output = critic_dense_model([lstm_out, action_input, indicator_input_right])  # reuse dense_model
-    right_critic_model = Model(inputs=[right_state_input, action_input],
-                               outputs=q_output, name='right_critic_model')
-    model_dict = dict(upper_model=upper_model,
-                      left_actor_model=left_actor_model,
-                      left_critic_model=left_critic_model,
-                      straight_actor_model=straight_actor_model,
-                      straight_critic_model=straight_critic_model,
-                      right_actor_model=right_actor_model,
-                      right_critic_model=right_critic_model)
-    return model_dict, action_input
 def action_fn():
     upper_action = np.random.choice([0, 1, 2])
     delta_x_norm = (np.random.random() - 0.5) * 2
@@ -147,7 +41,7 @@ def action_fn():
 
     return [upper_action, delta_x_norm, acc_norm]
 
-model_dict, critic_action_input = build_models()
+model_dict, critic_action_input = build_models(lstm_dtype=get_lstm_dtype(LSTM_PRECISION))
 upper_model = model_dict['upper_model']
 
 left_actor_model = model_dict['left_actor_model']
@@ -214,7 +108,7 @@ NB_MAX_EPISODE_STEPS = goal_length / ((step_length * plan_horizon) * 5)  # episo
 
 # turn left agent
 left_processor = WhiteningNormalizerProcessor()
-left_memory = SequentialMemory(limit=MEMORY_LIMIT, window_length=WINDOW_LENGTH)
+left_memory = OptionViewMemory(limit=MEMORY_LIMIT, option='left', window_length=WINDOW_LENGTH)
 left_random_process = OrnsteinUhlenbeckProcess(size=lower_nb_actions, theta=RANDOM_PROCESS_THETA, mu=RANDOM_PROCESS_MU, sigma=RANDOM_PROCESS_SIGMA)
 left_agent = DDPGAgent(processor=left_processor, nb_actions=lower_nb_actions, actor=left_actor_model,
                        critic=left_critic_model, critic_action_input=critic_action_input,
@@ -225,7 +119,7 @@ left_agent.compile(Adam(lr=OPTIMIZER_LR, clipnorm=OPTIMIZER_CLIPNORM), metrics=[
 
 # go straight agent
 straight_processor = WhiteningNormalizerProcessor()
-straight_memory = SequentialMemory(limit=MEMORY_LIMIT, window_length=WINDOW_LENGTH)
+straight_memory = OptionViewMemory(limit=MEMORY_LIMIT, option='straight', window_length=WINDOW_LENGTH)
 straight_random_process = OrnsteinUhlenbeckProcess(size=lower_nb_actions, theta=RANDOM_PROCESS_THETA, mu=RANDOM_PROCESS_MU, sigma=RANDOM_PROCESS_SIGMA)
 straight_agent = DDPGAgent(processor=straight_processor, nb_actions=lower_nb_actions, actor=straight_actor_model,
                            critic=straight_critic_model, critic_action_input=critic_action_input,
@@ -236,7 +130,7 @@ straight_agent.compile(Adam(lr=OPTIMIZER_LR, clipnorm=OPTIMIZER_CLIPNORM), metri
 
 # turn right agent
 right_processor = WhiteningNormalizerProcessor()
-right_memory = SequentialMemory(limit=MEMORY_LIMIT, window_length=WINDOW_LENGTH)
+right_memory = OptionViewMemory(limit=MEMORY_LIMIT, option='right', window_length=WINDOW_LENGTH)
 right_random_process = OrnsteinUhlenbeckProcess(size=lower_nb_actions, theta=RANDOM_PROCESS_THETA, mu=RANDOM_PROCESS_MU, sigma=RANDOM_PROCESS_SIGMA)
 right_agent = DDPGAgent(processor=right_processor, nb_actions=lower_nb_actions, actor=right_actor_model, critic=right_critic_model,
                         critic_action_input=critic_action_input,
@@ -245,16 +139,36 @@ right_agent = DDPGAgent(processor=right_processor, nb_actions=lower_nb_actions,
                         batch_size=BATCH_SIZE_LOWER)
 right_agent.compile(Adam(lr=OPTIMIZER_LR, clipnorm=OPTIMIZER_CLIPNORM), metrics=['mae'])
 
+# train the option agents together, running the shared LSTM trunk once per batch
+SHARED_TRUNK_LEARNER = False
+option_learner = None
+if SHARED_TRUNK_LEARNER:
+    option_learner = SharedTrunkOptionLearner(critic_optimizer=Adam(lr=OPTIMIZER_LR, clipnorm=OPTIMIZER_CLIPNORM),
+                                              actor_optimizer=Adam(lr=OPTIMIZER_LR, clipnorm=OPTIMIZER_CLIPNORM))
+
 processor = WhiteningNormalizerProcessor()
 memory = SequentialMemory(limit=MEMORY_LIMIT_UPPER, window_length=WINDOW_LENGTH_UPPER)
 policy = BoltzmannQPolicy()
 dqn = DQNAgent4Hrl(processor=processor, model=upper_model, turn_left_agent=left_agent, go_straight_agent=straight_agent,
                    turn_right_agent=right_agent, nb_actions=upper_nb_actions, memory=memory, nb_steps_warmup=NB_STEPS_WARMUP_STEP,
-                   target_model_update=TARGET_MODEL_UPDATE_UPPER, policy=policy, enable_double_dqn=True, batch_size=BATCH_SIZE_UPPER)
+                   target_model_update=TARGET_MODEL_UPDATE_UPPER, policy=policy, enable_double_dqn=True, batch_size=BATCH_SIZE_UPPER,
+                   option_learner=option_learner)
 dqn.compile(Adam(lr=OPTIMIZER_LR_UPPER), metrics=['mae'])
 
-
-# dqn.fit_hrl(env, nb_steps=NB_STEPS, visualize=False, verbose=2, random_start_step_policy=action_fn,
+# time the hot path of the simulator and the learner, reported every SAVE_INTERVAL steps
+PROFILE = False
+callbacks = []
+if PROFILE:
+    from LasVSim.traffic_module import Traffic
+    profiler = Profiler(trace_filepath=curr_path + '/profile_trace.json')
+    profiler.instrument(Traffic, 'sim_step', 'traffic.sim_step')
+    profiler.instrument(Traffic, 'get_vehicles', 'traffic.get_vehicles')
+    profiler.instrument(EndtoendEnv, 'step', 'env.step')
+    profiler.instrument(ObservationWrapper, 'observation', 'env.encode_observation')
+    instrument_hrl_agent(profiler, dqn)
+    callbacks += [ProfilerLogger(profiler, interval=SAVE_INTERVAL, filepath=curr_path + '/profile.jsonl')]
+
+# dqn.fit_hrl(env, nb_steps=NB_STEPS, visualize=False, verbose=2, random_start_step_policy=action_fn, callbacks=callbacks,
 #             save_interval=SAVE_INTERVAL, pre_warm_steps=PRE_WARM_STEP, nb_max_episode_steps=NB_MAX_EPISODE_STEPS)
 
 # evaluation
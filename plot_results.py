@@ -13,28 +13,54 @@ def weighted_decay(orig_list, epsilon):
     return processed_list
 
 
-path = os.path.dirname(__file__) + os.sep + 'rl' + os.sep + 'log.json'
-
-with open(path, "r") as file:
-    fileJson = json.load(file)
-    loss = fileJson["loss"]
-    mae = fileJson["mae"]
-    mean_q = fileJson["mean_q"]
-    left_loss = fileJson["left_loss"]
-    left_mae = fileJson["left_mae"]
-    left_mean_q = fileJson["left_mean_q"]
-    straight_loss = fileJson["straight_loss"]
-    straight_mae = fileJson["straight_mae"]
-    straight_mean_q = fileJson["straight_mean_q"]
-    right_loss = fileJson["right_loss"]
-    right_mae = fileJson["right_mae"]
-    right_mean_q = fileJson["right_mean_q"]
-    episode_reward = fileJson["episode_reward"]
-    nb_episode_steps = fileJson["nb_episode_steps"]
-    nb_steps = fileJson["nb_steps"]
-    memory_len = fileJson["memory_len"]
-    episode = fileJson["episode"]
-    duration = fileJson["duration"]
+def load_log(path, keys=None):
+    """Read the json lines log of rl.callbacks.FileLogger one episode at a time.
+
+    Falls back to the whole-file json written by older versions. A truncated last line
+    (crashed run) is skipped. Returns a dict mapping each key to its values sorted by episode.
+    """
+    data = {}
+    with open(path, "r") as file:
+        if path.endswith('.json'):
+            data = json.load(file)
+        else:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                for key, value in record.items():
+                    if keys is None or key in keys or key == 'episode':
+                        data.setdefault(key, []).append(value)
+    episodes = data.get('episode', [])
+    if any(a > b for a, b in zip(episodes, episodes[1:])):
+        order = sorted(range(len(episodes)), key=lambda idx: episodes[idx])
+        data = {key: [values[idx] for idx in order] for key, values in data.items()}
+    return data
+
+
+log_dir = os.path.dirname(__file__) + os.sep + 'rl' + os.sep
+path = log_dir + 'log.jsonl' if os.path.exists(log_dir + 'log.jsonl') else log_dir + 'log.json'
+
+fileJson = load_log(path)
+loss = fileJson["loss"]
+mae = fileJson["mae"]
+mean_q = fileJson["mean_q"]
+left_loss = fileJson["left_loss"]
+left_mae = fileJson["left_mae"]
+left_mean_q = fileJson["left_mean_q"]
+straight_loss = fileJson["straight_loss"]
+straight_mae = fileJson["straight_mae"]
+straight_mean_q = fileJson["straight_mean_q"]
+right_loss = fileJson["right_loss"]
+right_mae = fileJson["right_mae"]
+right_mean_q = fileJson["right_mean_q"]
+episode_reward = fileJson["episode_reward"]
+nb_episode_steps = fileJson["nb_episode_steps"]
+nb_steps = fileJson["nb_steps"]
+memory_len = fileJson["memory_len"]
+episode = fileJson["episode"]
+duration = fileJson["duration"]
 
 # ——————————————————
 plt.figure('losses and metrics')
@@ -1,3 +1,4 @@
 from __future__ import absolute_import
 from .ddpg import DDPGAgent
-from .dqn4hrl import DQNAgent4Hrl
\ No newline at end of file
+from .dqn4hrl import DQNAgent4Hrl
+from .option_learner import SharedTrunkOptionLearner
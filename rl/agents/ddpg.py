@@ -111,6 +111,7 @@ class DDPGAgent(Agent):
         self.target_actor.compile(optimizer='sgd', loss='mse')
         self.target_critic = clone_model(self.critic, self.custom_model_objects)
         self.target_critic.compile(optimizer='sgd', loss='mse')
+        self.target_models_updater = TargetModelUpdater(self.target_model_pairs)
 
         # We also compile the actor. We never optimize the actor using Keras but instead compute
         # the policy gradient ourselves. However, we need the actor in feed-forward mode, hence
@@ -167,9 +168,23 @@ class DDPGAgent(Agent):
         self.actor.save_weights(actor_filepath, overwrite=overwrite)
         self.critic.save_weights(critic_filepath, overwrite=overwrite)
 
+    def snapshot_weights(self):
+        """Copy actor and critic weights to host memory."""
+        return dict(actor=self.actor.get_weights(), critic=self.critic.get_weights())
+
+    def restore_weights(self, snapshot, update_targets=True):
+        """Inverse of `snapshot_weights`."""
+        self.actor.set_weights(snapshot['actor'])
+        self.critic.set_weights(snapshot['critic'])
+        if update_targets:
+            self.update_target_models_hard()
+
+    @property
+    def target_model_pairs(self):
+        return [(self.target_actor, self.actor), (self.target_critic, self.critic)]
+
     def update_target_models_hard(self):
-        self.target_critic.set_weights(self.critic.get_weights())
-        self.target_actor.set_weights(self.actor.get_weights())
+        self.target_models_updater()
 
     # TODO: implement pickle
 
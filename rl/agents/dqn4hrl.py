@@ -1,7 +1,6 @@
 from __future__ import division
 import warnings
 import os
-from copy import deepcopy
 
 from tensorflow.python.keras import Input, Model, layers
 from tensorflow.python.keras.layers import Lambda
@@ -10,7 +9,9 @@ import tensorflow as tf
 # import keras.backend as K
 # from keras.layers import Lambda, Input, Layer, Dense
 from rl.util import WhiteningNormalizer
-from rl.core import Agent
+from rl.core import Agent, own_observation
+from rl.inference import OPTIONS, OptionViews, make_option_observations
+from rl.memory import OptionViewMemory
 from rl.policy import EpsGreedyQPolicy, GreedyQPolicy
 from rl.util import *
 from rl.callbacks import (
@@ -28,6 +29,13 @@ def mean_q(y_true, y_pred):
     return tf.reduce_mean(tf.reduce_max(y_pred, axis=-1))
 
 
+def reset_env(env, init_state_sampler=None):
+    """Reset `env` on the next state of `init_state_sampler`, or on the env's own init state sampling if None."""
+    if init_state_sampler is None:
+        return env.reset()
+    return env.reset(init_state=init_state_sampler.sample())
+
+
 class AbstractDQNAgent(Agent):
     """Write me
     """
@@ -118,10 +126,12 @@ class DQNAgent4Hrl(AbstractDQNAgent):
             `avg`: Q(s,a;theta) = V(s;theta) + (A(s,a;theta)-Avg_a(A(s,a;theta)))
             `max`: Q(s,a;theta) = V(s;theta) + (A(s,a;theta)-max_a(A(s,a;theta)))
             `naive`: Q(s,a;theta) = V(s;theta) + A(s,a;theta)
+        option_learner__: Optional `SharedTrunkOptionLearner` that trains the three option agents together,
+            running their shared LSTM trunk once per batch instead of calling each agent's `backward`.
 
     """
     def __init__(self, model, turn_left_agent, go_straight_agent, turn_right_agent, policy=None, test_policy=None, enable_double_dqn=False, enable_dueling_network=False,
-                 dueling_type='avg', *args, **kwargs):
+                 dueling_type='avg', option_learner=None, *args, **kwargs):
         super(DQNAgent4Hrl, self).__init__(*args, **kwargs)
 
         # Parameters.
@@ -166,8 +176,11 @@ class DQNAgent4Hrl(AbstractDQNAgent):
         self.turn_left_agent = turn_left_agent
         self.go_straight_agent = go_straight_agent
         self.turn_right_agent = turn_right_agent
+        self.option_learner = option_learner
+        self.option_views = OptionViews(shape=tuple(self.model.input_shape[1:]))
 
         # State.
+        self.episode = np.int64(0)
         self.reset_states()
 
     def get_config(self):
@@ -188,6 +201,8 @@ class DQNAgent4Hrl(AbstractDQNAgent):
         # We never train the target model, hence we can set the optimizer and loss arbitrarily.
         self.target_model = clone_model(self.model, self.custom_model_objects)
         self.target_model.compile(optimizer='sgd', loss='mse')
+        self.target_model_updater = TargetModelUpdater([(self.target_model, self.model)])
+        self.all_target_models_updater = None
         self.model.compile(optimizer='sgd', loss='mse')
 
         # Compile model.
@@ -221,24 +236,89 @@ class DQNAgent4Hrl(AbstractDQNAgent):
         trainable_model.compile(optimizer=optimizer, loss=losses, metrics=combined_metrics)
         self.trainable_model = trainable_model
 
+        if self.option_learner is not None:
+            self.option_learner.compile([self.turn_left_agent, self.go_straight_agent, self.turn_right_agent])
+
         self.compiled = True
 
+    def _named_processors(self):
+        return [('upper', self.processor, (10, 56)),
+                ('left', self.turn_left_agent.processor, (10, 41)),
+                ('straight', self.go_straight_agent.processor, (10, 59)),
+                ('right', self.turn_right_agent.processor, (10, 41))]
+
+    def _freeze_normalizers(self, frozen):
+        for _, processor, _ in self._named_processors():
+            if hasattr(processor, 'frozen'):
+                processor.frozen = frozen
+
+    def snapshot_weights(self):
+        """Copy the weights of all models and the normalizer statistics to host memory.
+
+        The snapshot can be written with `rl.util.save_weights_snapshot` from another thread
+        and loaded with `load_weights` (files ending with `.npz`).
+        """
+        snapshot = dict(upper=self.model.get_weights(),
+                        left=self.turn_left_agent.snapshot_weights(),
+                        straight=self.go_straight_agent.snapshot_weights(),
+                        right=self.turn_right_agent.snapshot_weights(),
+                        step=np.int64(self.step),
+                        episode=np.int64(self.episode),
+                        normalizer={})
+        for name, processor, _ in self._named_processors():
+            if processor.normalizer:
+                snapshot['normalizer'][name] = processor.normalizer.get_state()
+        return snapshot
+
+    def _load_snapshot(self, filepath):
+        snapshot = load_weights_snapshot(filepath)
+        self.model.set_weights(snapshot['upper'])
+        self.turn_left_agent.restore_weights(snapshot['left'], update_targets=False)
+        self.go_straight_agent.restore_weights(snapshot['straight'], update_targets=False)
+        self.turn_right_agent.restore_weights(snapshot['right'], update_targets=False)
+        self.update_all_target_models_hard()
+        for name, processor, shape in self._named_processors():
+            if name in snapshot.get('normalizer', {}):
+                if not processor.normalizer:
+                    processor.normalizer = WhiteningNormalizer(shape=shape)
+                processor.normalizer.set_state(snapshot['normalizer'][name])
+        # checkpoints written before the counters were stored resume from step 0
+        self._set_step(snapshot.get('step', 0))
+        self.episode = np.int64(snapshot.get('episode', 0))
+
+    def _set_step(self, step):
+        self.step = np.int64(step)
+        self.turn_left_agent.step = np.int64(step)
+        self.go_straight_agent.step = np.int64(step)
+        self.turn_right_agent.step = np.int64(step)
+
+    @staticmethod
+    def _processor_filepath(filename):
+        filepath = filename + '_stats.npz'
+        if not os.path.exists(filepath):
+            filepath = filename + '.pickle'
+        return filepath
+
     def load_weights(self, filepath):
+        filename, extension = os.path.splitext(filepath)
+        if extension == '.npz':
+            # single file checkpoint written by `ModelIntervalCheckpoint(asynchronous=True)`
+            self._load_snapshot(filepath)
+            return
         # load models weights
         self.model.load_weights(filepath)
         self.update_target_model_hard()
-        filename, extension = os.path.splitext(filepath)
         left_model_filepath = filename + '_left_model' + extension
         straight_model_filepath = filename + '_straight_model' + extension
         right_model_filepath = filename + '_right_model' + extension
         self.turn_left_agent.load_weights(left_model_filepath)
         self.go_straight_agent.load_weights(straight_model_filepath)
         self.turn_right_agent.load_weights(right_model_filepath)
-        # load state processor
-        upper_processor_filepath = filename + '.pickle'
-        left_processor_filepath = filename + '_left_model' + '.pickle'
-        straight_processor_filepath = filename + '_straight_model' + '.pickle'
-        right_processor_filepath = filename + '_right_model' + '.pickle'
+        # load state processor, checkpoints written before the versioned stats format used .pickle files
+        upper_processor_filepath = self._processor_filepath(filename)
+        left_processor_filepath = self._processor_filepath(filename + '_left_model')
+        straight_processor_filepath = self._processor_filepath(filename + '_straight_model')
+        right_processor_filepath = self._processor_filepath(filename + '_right_model')
         if not self.processor.normalizer:
             self.processor.normalizer = WhiteningNormalizer(shape=(10, 56))
         if not self.turn_left_agent.processor.normalizer:
@@ -263,10 +343,10 @@ class DQNAgent4Hrl(AbstractDQNAgent):
         self.go_straight_agent.save_weights(straight_model_filepath, overwrite=overwrite)
         self.turn_right_agent.save_weights(right_model_filepath, overwrite=overwrite)
         # save state processor
-        upper_processor_filepath = filename + '.pickle'
-        left_processor_filepath = filename + '_left_model' + '.pickle'
-        straight_processor_filepath = filename + '_straight_model' + '.pickle'
-        right_processor_filepath = filename + '_right_model' + '.pickle'
+        upper_processor_filepath = filename + '_stats.npz'
+        left_processor_filepath = filename + '_left_model' + '_stats.npz'
+        straight_processor_filepath = filename + '_straight_model' + '_stats.npz'
+        right_processor_filepath = filename + '_right_model' + '_stats.npz'
         if self.processor.normalizer:
             self.processor.normalizer.save_param(upper_processor_filepath)
         if self.turn_left_agent.processor.normalizer:
@@ -287,7 +367,16 @@ class DQNAgent4Hrl(AbstractDQNAgent):
         self.turn_right_agent.reset_states()
 
     def update_target_model_hard(self):
-        self.target_model.set_weights(self.model.get_weights())
+        self.target_model_updater()
+
+    def update_all_target_models_hard(self):
+        """Hard update the upper target model and the targets of all option agents in one go."""
+        if self.all_target_models_updater is None:
+            model_pairs = [(self.target_model, self.model)]
+            for agent in [self.turn_left_agent, self.go_straight_agent, self.turn_right_agent]:
+                model_pairs += agent.target_model_pairs
+            self.all_target_models_updater = TargetModelUpdater(model_pairs)
+        self.all_target_models_updater()
 
     def forward(self, observation):  # observation = [timesteps, features]
         # Select an action.
@@ -298,15 +387,9 @@ class DQNAgent4Hrl(AbstractDQNAgent):
         else:
             upper_action = self.test_policy.select_action(q_values=q_values)
 
-        if upper_action == 0:  # left
-            left_obs = np.column_stack((observation[:, :30], observation[:, -8:], np.tile(np.array([1, 0, 0]), (observation.shape[0], 1)))) # 30 + 8 + 3 = 41
-            lower_action = self.turn_left_agent.forward(left_obs)  # lower_action = [goal_delta_x, acc]
-        elif upper_action == 1:  # go_straight
-            straight_obs = np.column_stack((deepcopy(observation), np.tile(np.array([0, 1, 0]), (observation.shape[0], 1))))  # 56 + 3 = 59
-            lower_action = self.go_straight_agent.forward(straight_obs)
-        else:
-            right_obs = np.column_stack((observation[:, 18:], np.tile(np.array([0, 0, 1]), (observation.shape[0], 1))))  # 56- 18 + 3 = 41
-            lower_action = self.turn_right_agent.forward(right_obs)
+        # left: 30 + 8 + 3 = 41, go_straight: 56 + 3 = 59, right: 56 - 18 + 3 = 41 columns
+        option_observation = self.option_views.view(OPTIONS[upper_action], observation)
+        lower_action = self.option_agents[upper_action].forward(option_observation)  # lower_action = [goal_delta_x, acc]
 
         # Book-keeping.
         self.recent_observation = observation
@@ -314,23 +397,25 @@ class DQNAgent4Hrl(AbstractDQNAgent):
 
         return [upper_action, lower_action[0], lower_action[1]]
 
+    @property
+    def option_agents(self):
+        return [self.turn_left_agent, self.go_straight_agent, self.turn_right_agent]
+
+    def _append_option_memory(self, upper_action, observation, lower_action, reward):
+        # an `OptionViewMemory` keeps the upper observation itself, other memories get an option observation
+        # of their own because the one passed to the option agent is a reused `OptionViews` buffer
+        agent = self.option_agents[upper_action]
+        if not isinstance(agent.memory, OptionViewMemory):
+            observation = make_option_observations(observation[np.newaxis], OPTIONS[upper_action])[0]
+        agent.memory.append(observation, lower_action, reward, 1, training=self.training)
+
     def backward(self, reward, terminal):
         # Store most recent experience in memory.
         if self.step % self.memory_interval == 0:
             self.memory.append(self.recent_observation, self.recent_action, reward, terminal,
                                training=self.training)
-            if self.recent_action == 0:
-                self.turn_left_agent.memory.append(self.turn_left_agent.recent_observation,
-                                                   self.turn_left_agent.recent_action, reward, 1,
-                                                   training=self.training)
-            elif self.recent_action == 1:
-                self.go_straight_agent.memory.append(self.go_straight_agent.recent_observation,
-                                                     self.go_straight_agent.recent_action, reward, 1,
-                                                     training=self.training)
-            else:
-                self.turn_right_agent.memory.append(self.turn_right_agent.recent_observation,
-                                                    self.turn_right_agent.recent_action, reward, 1,
-                                                    training=self.training)
+            self._append_option_memory(self.recent_action, self.recent_observation,
+                                       self.option_agents[self.recent_action].recent_action, reward)
 
         metrics = [np.nan for _ in self.metrics_names]
         if not self.training:
@@ -340,9 +425,12 @@ class DQNAgent4Hrl(AbstractDQNAgent):
 
         # Train the network on a single stochastic batch.
         if self.step > self.nb_steps_warmup and self.step % self.train_interval == 0:
-            left_metrics = self.turn_left_agent.backward(0, 0)  # these parameters have no use
-            straight_metrics = self.go_straight_agent.backward(0, 0)
-            right_metrics = self.turn_right_agent.backward(0, 0)
+            if self.option_learner is not None:
+                left_metrics, straight_metrics, right_metrics = self.option_learner.backward()
+            else:
+                left_metrics = self.turn_left_agent.backward(0, 0)  # these parameters have no use
+                straight_metrics = self.go_straight_agent.backward(0, 0)
+                right_metrics = self.turn_right_agent.backward(0, 0)
             experiences = self.memory.sample(self.batch_size)
             assert len(experiences) == self.batch_size
 
@@ -428,7 +516,17 @@ class DQNAgent4Hrl(AbstractDQNAgent):
 
     def fit_hrl(self, env, nb_steps, random_start_step_policy, callbacks=None, verbose=1,
             visualize=False, pre_warm_steps=0, log_interval=100, save_interval=1,
-            nb_max_episode_steps=None):
+            nb_max_episode_steps=None, keep_checkpoints=None, resume=False, init_state_sampler=None):
+        """Train the agent for `nb_steps` environment steps.
+
+        Episodes start on the states of `init_state_sampler` (see `LasVSim.init_states`), e.g. a
+        `DensityCurriculumSampler` whose difficulty grows with the number of episodes. Without it the env
+        samples its init states itself.
+
+        With `resume=True` the step and episode counters restored by `load_weights` from a `.npz`
+        checkpoint are kept, so exploration schedules, warm up, train intervals and target updates
+        continue where the checkpointed run stopped and `nb_steps` counts from the start of that run.
+        """
 
         if not self.compiled:
             raise RuntimeError('Your tried to fit your agent but it hasn\'t been'
@@ -438,6 +536,7 @@ class DQNAgent4Hrl(AbstractDQNAgent):
         self.turn_left_agent.training = True
         self.go_straight_agent.training = True
         self.turn_right_agent.training = True
+        self._freeze_normalizers(False)
 
         callbacks = [] if not callbacks else callbacks[:]
 
@@ -449,10 +548,12 @@ class DQNAgent4Hrl(AbstractDQNAgent):
             callbacks += [Visualizer()]
 
         parent_dir = os.path.dirname(os.path.dirname(__file__))
-        callbacks += [FileLogger(filepath=parent_dir + os.sep + 'log.json')]
-        callbacks += [ModelIntervalCheckpoint(filepath=parent_dir + '/checkpoints/model_step{step}.h5f',
+        callbacks += [FileLogger(filepath=parent_dir + os.sep + 'log.jsonl', append=resume)]
+        callbacks += [ModelIntervalCheckpoint(filepath=parent_dir + '/checkpoints/model_step{step}.npz',
                                               interval=save_interval,
-                                              verbose=1)]
+                                              verbose=1,
+                                              asynchronous=True,
+                                              keep_last=keep_checkpoints)]
         history = History()
         callbacks += [history]
         callbacks = CallbackList(callbacks)
@@ -462,14 +563,15 @@ class DQNAgent4Hrl(AbstractDQNAgent):
             'nb_steps': nb_steps,
         }
         callbacks.set_params(params)
+        if resume:
+            self._set_step(self.step)
+        else:
+            self._set_step(0)
+            self.episode = np.int64(0)
+        episode = self.episode
         self._on_train_begin()
         callbacks.on_train_begin()
 
-        episode = np.int16(0)
-        self.step = np.int16(0)
-        self.turn_left_agent.step = np.int16(0)
-        self.go_straight_agent.step = np.int16(0)
-        self.turn_right_agent.step = np.int16(0)
         observation = env.encoded_obs
         episode_reward = None
         episode_step = None
@@ -485,31 +587,14 @@ class DQNAgent4Hrl(AbstractDQNAgent):
 
             callbacks.on_action_begin(action)
             observation, reward, done, info = env.step(action)
-            observation = deepcopy(observation)
+            observation = own_observation(observation)
             if self.processor is not None:
                 observation, reward, done, info = self.processor.process_step(observation, reward, done, info)
             callbacks.on_action_end(action)
 
             self.memory.append(recent_observation, recent_action[0], reward, done,
                                training=self.training)
-            if recent_action[0] == 0:
-                left_obs = np.column_stack((recent_observation[:, :30], recent_observation[:, -8:], np.tile(np.array([1, 0, 0]), (
-                    recent_observation.shape[0], 1))))  # 30 + 8 + 3 = 41
-                lower_action = recent_action[1:]
-                self.turn_left_agent.memory.append(left_obs, lower_action, reward, 1,
-                                                   training=self.training)
-            elif recent_action[0] == 1:
-                straight_obs = np.column_stack((deepcopy(recent_observation), np.tile(np.array([0, 1, 0]),
-                                                                      (recent_observation.shape[0], 1)))) # 56 + 3 = 59
-                lower_action = recent_action[1:]
-                self.go_straight_agent.memory.append(straight_obs, lower_action, reward, 1,
-                                                     training=self.training)
-            else:
-                right_obs = np.column_stack((recent_observation[:, 18:], np.tile(np.array([0, 0, 1]),
-                                                                 (recent_observation.shape[0], 1))))  # 56- 18 + 3 = 41
-                lower_action = recent_action[1:]
-                self.turn_right_agent.memory.append(right_obs, lower_action, reward, 1,
-                                                    training=self.training)
+            self._append_option_memory(int(recent_action[0]), recent_observation, recent_action[1:], reward)
             print('————————————————————————————————————————')
             print({'upper_memory_len: ': self.memory.nb_entries,
                    'left_memory_len: ': self.turn_left_agent.memory.nb_entries,
@@ -518,20 +603,7 @@ class DQNAgent4Hrl(AbstractDQNAgent):
             print('————————————————————————————————————————')
             # TODO: always has a point is not done, but there would be only one bad point in the buffer
             if done:
-                def random_init_state(flag=True):
-                    init_state = [-800, -150 - 3.75 * 5 / 2, 5, 0]
-                    if flag:
-                        x = np.random.random() * 1000 - 800
-                        lane = np.random.choice([0, 1, 2, 3])
-                        y_fn = lambda lane: \
-                        [-150 - 3.75 * 7 / 2, -150 - 3.75 * 5 / 2, -150 - 3.75 * 3 / 2, -150 - 3.75 * 1 / 2][lane]
-                        y = y_fn(lane)
-                        v = np.random.random() * 25
-                        heading = 0
-                        init_state = [x, y, v, heading]
-                    return init_state
-
-                observation = deepcopy(env.reset(init_state=random_init_state(flag=True)))
+                observation = own_observation(reset_env(env, init_state_sampler))
                 if self.processor is not None:
                     observation = self.processor.process_observation(observation)
 
@@ -541,25 +613,13 @@ class DQNAgent4Hrl(AbstractDQNAgent):
             while self.step < nb_steps:
                 if observation is None:  # start of a new episode
                     callbacks.on_episode_begin(episode)
-                    episode_step = np.int16(0)
+                    episode_step = np.int64(0)
                     episode_reward = np.float32(0)
 
                     # Obtain the initial observation by resetting the environment.
                     self.reset_states()
 
-                    def random_init_state(flag=True):
-                        init_state = [-800, -150-3.75*5/2, 5, 0]
-                        if flag:
-                            x = np.random.uniform(0, 1) * 1000 - 800
-                            lane = np.random.choice([0, 1, 2, 3])
-                            y_fn = lambda lane: [-150-3.75*7/2, -150-3.75*5/2, -150-3.75*3/2, -150-3.75*1/2][lane]
-                            y = y_fn(lane)
-                            v = np.random.uniform(0, 1) * 25
-                            heading = 0
-                            init_state = [x, y, v, heading]
-                        return init_state
-
-                    observation = deepcopy(env.reset(init_state=random_init_state()))
+                    observation = own_observation(reset_env(env, init_state_sampler))
                     if self.processor is not None:
                         observation = self.processor.process_observation(observation)
                     assert observation is not None
@@ -579,7 +639,7 @@ class DQNAgent4Hrl(AbstractDQNAgent):
 
                 callbacks.on_action_begin(action)
                 observation, reward, done, info = env.step(action)
-                observation = deepcopy(observation)
+                observation = own_observation(observation)
                 if self.processor is not None:
                     observation, reward, done, info = self.processor.process_step(observation, reward, done, info)
                 callbacks.on_action_end(action)
@@ -618,6 +678,7 @@ class DQNAgent4Hrl(AbstractDQNAgent):
                     callbacks.on_episode_end(episode, episode_logs)
 
                     episode += 1
+                    self.episode = episode
                     observation = None
                     episode_step = None
                     episode_reward = None
@@ -632,7 +693,7 @@ class DQNAgent4Hrl(AbstractDQNAgent):
         return history
 
     def test_hrl(self, env, nb_episodes=1, callbacks=None, visualize=True,
-             nb_max_episode_steps=None, verbose=2, model_path=None):
+             nb_max_episode_steps=None, verbose=2, model_path=None, init_state_sampler=None):
 
         if model_path is not None:
             self.load_weights(model_path)
@@ -644,10 +705,8 @@ class DQNAgent4Hrl(AbstractDQNAgent):
         self.turn_left_agent.training = False
         self.go_straight_agent.training = False
         self.turn_right_agent.training = False
-        self.step = np.int16(0)
-        self.turn_left_agent.step = np.int16(0)
-        self.go_straight_agent.step = np.int16(0)
-        self.turn_right_agent.step = np.int16(0)
+        self._freeze_normalizers(True)
+        self._set_step(0)
 
         callbacks = [] if not callbacks else callbacks[:]
 
@@ -674,20 +733,7 @@ class DQNAgent4Hrl(AbstractDQNAgent):
             # Obtain the initial observation by resetting the environment.
             self.reset_states()
 
-            def random_init_state(flag=True):
-                init_state = [-800, -150 - 3.75 * 5 / 2, 5, 0]
-                if flag:
-                    x = np.random.random() * 1000 - 800
-                    lane = np.random.choice([0, 1, 2, 3])
-                    y_fn = lambda lane: \
-                    [-150 - 3.75 * 7 / 2, -150 - 3.75 * 5 / 2, -150 - 3.75 * 3 / 2, -150 - 3.75 * 1 / 2][lane]
-                    y = y_fn(lane)
-                    v = np.random.random() * 25
-                    heading = 0
-                    init_state = [x, y, v, heading]
-                return init_state
-
-            observation = deepcopy(env.reset(init_state=random_init_state(flag=True)))
+            observation = own_observation(reset_env(env, init_state_sampler))
             assert observation is not None
 
             # Run the episode until we're done.
@@ -700,7 +746,7 @@ class DQNAgent4Hrl(AbstractDQNAgent):
                 reward = 0.
                 callbacks.on_action_begin(action)
                 observation, reward, done, info = env.step(action)
-                observation = deepcopy(observation)
+                observation = own_observation(observation)
                 callbacks.on_action_end(action)
                 if nb_max_episode_steps and episode_step >= nb_max_episode_steps - 1:
                     done = True
@@ -0,0 +1,154 @@
+from __future__ import division
+import numpy as np
+import tensorflow as tf
+import tensorflow.python.keras.backend as K
+
+from rl.util import huber_loss, get_soft_target_model_updates
+
+OPTIONS = ['left', 'straight', 'right']
+
+
+class SharedTrunkOptionLearner(object):
+    """Trains the three option DDPG agents of `DQNAgent4Hrl` with the shared recurrent trunk run once per batch.
+
+    The option actors (and critics) built by `models.build_models` each have their own encoder LSTM, but
+    share the LSTM behind it and the dense head. Instead of three `DDPGAgent.backward` calls, each running
+    the shared LSTM on its own small batch for the critic update, the actor update and the critic inside the
+    actor update, the encoded batches of all options are concatenated and pushed through the shared LSTM in
+    one go. Targets of all options are computed in one session call, critic and actor updates in one call each.
+
+    Each option's loss only depends on its own slice of the batch, so the option specific encoders get the
+    same gradients as before. The shared trunk and head take one step of `critic_optimizer`/`actor_optimizer`
+    on the sum of the option gradients instead of one step of every option's own optimizer.
+
+    # Arguments
+        critic_optimizer (keras optimizer): Optimizer of the critics.
+        actor_optimizer (keras optimizer): Optimizer of the actors.
+        feature_slice (function): Maps an option state tensor to the encoder input.
+        indicator_slice (function): Maps an option state tensor to the option indicator input of the head.
+    """
+    def __init__(self, critic_optimizer, actor_optimizer,
+                 feature_slice=lambda x: x[:, :, :-3], indicator_slice=lambda x: x[:, 0, -3:]):
+        self.critic_optimizer = critic_optimizer
+        self.actor_optimizer = actor_optimizer
+        self.feature_slice = feature_slice
+        self.indicator_slice = indicator_slice
+        self.agents = None
+        self.compiled = False
+
+    def _trunk_outputs(self, kind, models, state_inputs, action_inputs=None):
+        """Run the option encoders, the shared LSTM once on the concatenated batch and the shared head."""
+        encoded = [model.get_layer('{}_{}_encoder'.format(kind, option))(self.feature_slice(state))
+                   for option, model, state in zip(OPTIONS, models, state_inputs)]
+        sizes = [tf.shape(e)[0] for e in encoded]
+        trunk = models[0].get_layer('shared_{}_lstm_model'.format(kind))
+        head = models[0].get_layer('shared_{}_dense_model'.format(kind))
+        trunk_outputs = tf.split(trunk(tf.concat(encoded, axis=0)), sizes, axis=0)
+        outputs = []
+        for idx, state in enumerate(state_inputs):
+            if action_inputs is None:
+                outputs.append(head([trunk_outputs[idx], self.indicator_slice(state)]))
+            else:
+                outputs.append(head([trunk_outputs[idx], action_inputs[idx], self.indicator_slice(state)]))
+        return outputs
+
+    def compile(self, agents):
+        """Build the fused graphs, `agents` are the compiled left, straight and right `DDPGAgent`s."""
+        assert len(agents) == len(OPTIONS)
+        assert all(agent.compiled for agent in agents)
+        self.agents = agents
+        actors = [agent.actor for agent in agents]
+        critics = [agent.critic for agent in agents]
+
+        state0_inputs = [K.placeholder(shape=K.int_shape(agent.actor.input)) for agent in agents]
+        state1_inputs = [K.placeholder(shape=K.int_shape(agent.actor.input)) for agent in agents]
+        action_inputs = [K.placeholder(shape=(None, agent.nb_actions)) for agent in agents]
+        target_inputs = [K.placeholder(shape=(None, 1)) for _ in agents]
+
+        # targets: the target models are per option copies, evaluate all of them in a single call
+        target_q_values = []
+        for agent, state1 in zip(agents, state1_inputs):
+            critic_inputs = [state1]
+            critic_inputs.insert(agent.critic_action_input_idx, agent.target_actor(state1))
+            target_q_values.append(agent.target_critic(critic_inputs))
+        self.target_fn = K.function(state1_inputs, target_q_values)
+
+        # critic update
+        q_values = self._trunk_outputs('critic', critics, state0_inputs, action_inputs)
+        critic_losses = [K.mean(huber_loss(y, q, agent.delta_clip))
+                         for agent, y, q in zip(agents, target_inputs, q_values)]
+        critic_maes = [K.mean(K.abs(y - q)) for y, q in zip(target_inputs, q_values)]
+        critic_mean_qs = [K.mean(K.max(q, axis=-1)) for q in q_values]  # ddpg.mean_q
+        critic_params = _unique_weights(sum([critic.trainable_weights for critic in critics], []))
+        critic_updates = self.critic_optimizer.get_updates(params=critic_params, loss=tf.add_n(critic_losses))
+        for agent in agents:
+            if agent.target_model_update < 1.:
+                critic_updates += get_soft_target_model_updates(agent.target_critic, agent.critic,
+                                                                agent.target_model_update)
+        self.critic_train_fn = K.function(state0_inputs + action_inputs + target_inputs,
+                                          critic_losses + critic_maes + critic_mean_qs, updates=critic_updates)
+
+        # actor update, the actions are fed to the critics through the shared critic trunk
+        actions = self._trunk_outputs('actor', actors, state0_inputs)
+        combined_outputs = self._trunk_outputs('critic', critics, state0_inputs, actions)
+        actor_loss = -tf.add_n([K.mean(output) for output in combined_outputs])
+        actor_params = _unique_weights(sum([actor.trainable_weights for actor in actors], []))
+        actor_updates = self.actor_optimizer.get_updates(params=actor_params, loss=actor_loss)
+        for agent in agents:
+            if agent.target_model_update < 1.:
+                actor_updates += get_soft_target_model_updates(agent.target_actor, agent.actor,
+                                                               agent.target_model_update)
+        actor_updates += _unique_weights(sum([actor.updates for actor in actors], []))
+        self.actor_train_fn = K.function(state0_inputs, actions, updates=actor_updates)
+        self.compiled = True
+
+    def backward(self):
+        """One learner step of all options, returns the metrics of each agent like `DDPGAgent.backward`."""
+        agents = self.agents
+        metrics = [[np.nan for _ in agent.metrics_names] for agent in agents]
+        if not all(agent.training for agent in agents):
+            return metrics
+        train_critic = all(agent.step > agent.nb_steps_warmup_critic for agent in agents)
+        train_actor = all(agent.step > agent.nb_steps_warmup_actor for agent in agents)
+        if not (train_critic or train_actor) or any(agent.step % agent.train_interval for agent in agents):
+            return metrics
+
+        state0_batches, state1_batches, action_batches, reward_batches, terminal1_batches = [], [], [], [], []
+        for agent in agents:
+            experiences = agent.memory.sample(agent.batch_size)
+            state0_batches.append(agent.process_state_batch([e.state0 for e in experiences]))
+            state1_batches.append(agent.process_state_batch([e.state1 for e in experiences]))
+            action_batches.append(np.array([e.action for e in experiences]))
+            reward_batches.append(agent.process_reward_batch([e.reward for e in experiences]))
+            terminal1_batches.append(np.array([0. if e.terminal1 else 1. for e in experiences]))
+
+        if train_critic:
+            target_q_values = self.target_fn(state1_batches)
+            targets = [(reward + agent.gamma * q.flatten() * terminal1).reshape(-1, 1)
+                       for agent, reward, q, terminal1 in zip(agents, reward_batches, target_q_values,
+                                                              terminal1_batches)]
+            outputs = self.critic_train_fn(state0_batches + action_batches + targets)
+            nb_agents = len(agents)
+            for idx, agent in enumerate(agents):
+                values = {'loss': outputs[idx], 'mae': outputs[nb_agents + idx],
+                          'mean_absolute_error': outputs[nb_agents + idx], 'mean_q': outputs[2 * nb_agents + idx]}
+                metrics[idx] = [values.get(name, np.nan) for name in agent.metrics_names]
+
+        if train_actor:
+            self.actor_train_fn(state0_batches)
+
+        for agent in agents:
+            if agent.target_model_update >= 1 and agent.step % agent.target_model_update == 0:
+                agent.update_target_models_hard()
+        return metrics
+
+
+def _unique_weights(weights):
+    # shared layers show up in the weights of every option model
+    seen = set()
+    unique = []
+    for w in weights:
+        if id(w) not in seen:
+            seen.add(id(w))
+            unique.append(w)
+    return unique
@@ -3,7 +3,14 @@ from __future__ import print_function
 import warnings
 import timeit
 import json
+import glob
+import os
+import threading
 from tempfile import mkdtemp
+try:
+    import queue
+except ImportError:  # python 2
+    import Queue as queue
 
 import numpy as np
 
@@ -11,6 +18,9 @@ from tensorflow.python.keras import __version__ as KERAS_VERSION
 from tensorflow.python.keras.callbacks import Callback as KerasCallback, CallbackList as KerasCallbackList
 from tensorflow.python.keras.utils.generic_utils import Progbar
 
+from rl.util import save_weights_snapshot
+from rl.common.profiler import format_summary
+
 
 class Callback(KerasCallback):
     def _set_env(self, env):
@@ -135,6 +145,7 @@ class TrainEpisodeLogger(Callback):
         """ Print training values at beginning of training """
         self.train_start = timeit.default_timer()
         self.metrics_names = self.model.metrics_names
+        self.step = int(getattr(self.model, 'step', 0))
         print('Training for {} steps ...'.format(self.params['nb_steps']))
         
     def on_train_end(self, logs):
@@ -248,6 +259,7 @@ class TrainIntervalLogger(Callback):
         """ Initialize training statistics at beginning of training """
         self.train_start = timeit.default_timer()
         self.metrics_names = self.model.metrics_names
+        self.step = int(getattr(self.model, 'step', 0))
         print('Training for {} steps ...'.format(self.params['nb_steps']))
 
     def on_train_end(self, logs):
@@ -301,23 +313,48 @@ class TrainIntervalLogger(Callback):
 
 
 class FileLogger(Callback):
-    def __init__(self, filepath, interval=None):
+    """ Append-only logger writing one json object per episode and line (json lines).
+
+    Only the episodes finished since the last flush are written, by a background thread,
+    so saving does not get slower as training goes on. Every flush ends with complete
+    lines, hence a crash loses at most the episodes of the current interval (readers such as
+    `plot_results.py` skip a truncated last line).
+
+    # Arguments
+        filepath (str): Path of the json lines file.
+        interval (integer): Number of episodes between two flushes, every episode if `None`.
+        append (boolean): Keep the records already in `filepath`, e.g. when resuming training.
+    """
+    def __init__(self, filepath, interval=None, append=False):
         self.filepath = filepath
         self.interval = interval
+        self.append = append
 
         # Some algorithms compute multiple episodes at once since they are multi-threaded.
         # We therefore use a dict that maps from episode to metrics array.
         self.metrics = {}
         self.starts = {}
-        self.data = {}
+        self.pending = []
+        self.queue = None
+        self.writer = None
 
     def on_train_begin(self, logs):
-        """ Initialize model metrics before training """
+        """ Initialize model metrics and start the writer thread before training """
         self.metrics_names = self.model.metrics_names
+        if not self.append:
+            open(self.filepath, 'w').close()
+        self.queue = queue.Queue()
+        self.writer = threading.Thread(target=self._write_loop, name='file-logger')
+        self.writer.daemon = True
+        self.writer.start()
 
     def on_train_end(self, logs):
-        """ Save model at the end of training """
+        """ Flush the remaining episodes and wait for the writer at the end of training """
         self.save_data()
+        if self.writer is not None:
+            self.queue.put(None)
+            self.writer.join()
+            self.writer = None
 
     def on_episode_begin(self, episode, logs):
         """ Initialize metrics at the beginning of each episode """
@@ -327,7 +364,7 @@ class FileLogger(Callback):
         self.starts[episode] = timeit.default_timer()
 
     def on_episode_end(self, episode, logs):
-        """ Compute and print metrics at the end of each episode """ 
+        """ Compute metrics at the end of each episode and queue them for writing """
         duration = timeit.default_timer() - self.starts[episode]
 
         metrics = self.metrics[episode]
@@ -335,20 +372,16 @@ class FileLogger(Callback):
             mean_metrics = np.array([np.nan for _ in self.metrics_names])
         else:
             mean_metrics = np.nanmean(metrics, axis=0)
-        # print(metrics)
-        # print('mean_metrics', mean_metrics)
-        # print(self.metrics_names)
         assert len(mean_metrics) == len(self.metrics_names)
 
         data = list(zip(self.metrics_names, mean_metrics))
         data += list(logs.items())
         data += [('episode', episode), ('duration', duration)]
-        for key, value in data:
-            if key not in self.data:
-                self.data[key] = []
-            self.data[key].append(value)
+        # We convert to np.array() and then to list to convert from np datatypes to native datatypes.
+        # This is necessary because json.dump cannot handle np.float32, for example.
+        self.pending.append(json.dumps({key: np.array(value).tolist() for key, value in data}))
 
-        if self.interval is not None and episode % self.interval == 0:
+        if self.interval is None or episode % self.interval == 0:
             self.save_data()
 
         # Clean up.
@@ -357,44 +390,141 @@ class FileLogger(Callback):
 
     def on_step_end(self, step, logs):
         """ Append metric at the end of each step """
-        # print('logs_metrics', logs['metrics'])
         self.metrics[logs['episode']].append(logs['metrics'])
 
     def save_data(self):
-        """ Save metrics in a json file """
-        print('i am saving all of data, do you see it?')
-        if len(self.data.keys()) == 0:
+        """ Hand the episodes logged since the last call to the writer thread """
+        if len(self.pending) == 0:
             return
+        lines, self.pending = self.pending, []
+        if self.writer is None:
+            self._write(lines)
+        else:
+            self.queue.put(lines)
+
+    def _write(self, lines):
+        with open(self.filepath, 'a') as f:
+            f.write('\n'.join(lines) + '\n')
+            f.flush()
+
+    def _write_loop(self):
+        while True:
+            lines = self.queue.get()
+            if lines is None:
+                break
+            self._write(lines)
+
+
+class ProfilerLogger(Callback):
+    """ Report the sections timed by a `rl.common.profiler.Profiler` every `interval` steps.
+
+    The profiler is closed at the end of training, which restores the instrumented methods and
+    finishes its trace file.
+
+    # Arguments
+        profiler (Profiler): Profiler with the hot path methods already instrumented.
+        interval (integer): Number of steps between two reports.
+        filepath (str): Also append each report with its step as a json line, `None` to only print.
+        verbose (integer): Print a table per report if > 0.
+    """
+    def __init__(self, profiler, interval=1000, filepath=None, verbose=1):
+        super(ProfilerLogger, self).__init__()
+        self.profiler = profiler
+        self.interval = interval
+        self.filepath = filepath
+        self.verbose = verbose
+        self.step = 0
+        self.last_report = None
+
+    def on_train_begin(self, logs={}):
+        """ Drop what was timed before training and start counting from the agent's step """
+        self.step = int(getattr(self.model, 'step', 0))
+        self.profiler.summary()
+
+    def on_step_end(self, step, logs={}):
+        """ Count steps and report at interval steps """
+        self.step += 1
+        self.profiler.count('steps')
+        if self.step % self.interval == 0:
+            self.report()
 
-        # Sort everything by episode.
-        assert 'episode' in self.data
-        sorted_indexes = np.argsort(self.data['episode'])
-        sorted_data = {}
-        for key, values in self.data.items():
-            assert len(self.data[key]) == len(sorted_indexes)
-            # We convert to np.array() and then to list to convert from np datatypes to native datatypes.
-            # This is necessary because json.dump cannot handle np.float32, for example.
-            sorted_data[key] = np.array([self.data[key][idx] for idx in sorted_indexes]).tolist()
+    def on_train_end(self, logs={}):
+        """ Report the last partial interval and close the profiler """
+        self.report()
+        self.profiler.close()
 
-        # Overwrite already open file. We can simply seek to the beginning since the file will
-        # grow strictly monotonously.
-        with open(self.filepath, 'w') as f:
-            json.dump(sorted_data, f)
+    def report(self):
+        summary = self.profiler.summary()
+        if not summary['sections']:
+            return
+        summary['step'] = self.step
+        self.last_report = summary
+        if self.verbose > 0:
+            print('Profile at step {}:'.format(self.step))
+            print(format_summary(summary))
+        if self.filepath is not None:
+            with open(self.filepath, 'a') as f:
+                f.write(json.dumps(summary) + '\n')
 
 
 class Visualizer(Callback):
+    def on_train_begin(self, logs={}):
+        """ Ask the environment to record the frames it renders, if it records them lazily """
+        enable_frame_recording = getattr(self.env, 'enable_frame_recording', None)
+        if callable(enable_frame_recording):
+            enable_frame_recording()
+
     def on_action_end(self, action, logs):
         """ Render environment at the end of each action """
         self.env.render(mode='human')
 
 
 class ModelIntervalCheckpoint(Callback):
-    def __init__(self, filepath, interval, verbose=0):
+    """ Save the agent's weights every `interval` steps.
+
+    # Arguments
+        filepath (str): Path template, formatted with `step` and the step logs.
+        interval (integer): Number of steps between two checkpoints.
+        verbose (integer): Print a line per checkpoint if > 0.
+        asynchronous (boolean): Only snapshot the weights to host memory on the training thread
+            (requires an agent with `snapshot_weights`) and leave the atomic write to a background
+            thread. `filepath` should then end with `.npz`.
+        keep_last (integer): Only keep the files of the `keep_last` most recent checkpoints,
+            keep all of them if `None`.
+    """
+    def __init__(self, filepath, interval, verbose=0, asynchronous=False, keep_last=None):
         super(ModelIntervalCheckpoint, self).__init__()
         self.filepath = filepath
         self.interval = interval
         self.verbose = verbose
+        self.asynchronous = asynchronous
+        self.keep_last = keep_last
         self.total_steps = 0
+        self.saved_filepaths = []
+        self.queue = None
+        self.writer = None
+
+    def on_train_begin(self, logs={}):
+        """ Continue the step count of a resumed agent and start the writer thread for asynchronous checkpoints """
+        self.total_steps = int(getattr(self.model, 'step', 0))
+        if self.asynchronous and not callable(getattr(self.model, 'snapshot_weights', None)):
+            warnings.warn('{} cannot snapshot its weights, falling back to synchronous checkpoints.'.format(
+                type(self.model).__name__))
+            self.asynchronous = False
+        if self.asynchronous:
+            # At most two snapshots wait for the disk, after that training waits for the writer
+            # instead of piling up weights in memory.
+            self.queue = queue.Queue(maxsize=2)
+            self.writer = threading.Thread(target=self._write_loop, name='checkpoint-writer')
+            self.writer.daemon = True
+            self.writer.start()
+
+    def on_train_end(self, logs={}):
+        """ Wait for pending checkpoints to be written """
+        if self.writer is not None:
+            self.queue.put(None)
+            self.writer.join()
+            self.writer = None
 
     def on_step_end(self, step, logs={}):
         """ Save weights at interval steps during training """
@@ -406,4 +536,28 @@ class ModelIntervalCheckpoint(Callback):
         filepath = self.filepath.format(step=self.total_steps, **logs)
         if self.verbose > 0:
             print('Step {}: saving model to {}'.format(self.total_steps, filepath))
-        self.model.save_weights(filepath, overwrite=True)
+        if self.writer is not None:
+            self.queue.put((filepath, self.model.snapshot_weights()))
+        else:
+            self.model.save_weights(filepath, overwrite=True)
+            self._remove_old_checkpoints(filepath)
+
+    def _write_loop(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                break
+            filepath, snapshot = job
+            save_weights_snapshot(snapshot, filepath)
+            self._remove_old_checkpoints(filepath)
+
+    def _remove_old_checkpoints(self, filepath):
+        self.saved_filepaths.append(filepath)
+        if self.keep_last is None:
+            return
+        while len(self.saved_filepaths) > self.keep_last:
+            # an agent may save several files per checkpoint, all named after the checkpoint,
+            # e.g. `model_step200.h5f`, `model_step200_left_model_actor.h5f`, `model_step200.pickle`
+            filename, _ = os.path.splitext(self.saved_filepaths.pop(0))
+            for path in glob.glob(glob.escape(filename) + '.*') + glob.glob(glob.escape(filename) + '_*'):
+                os.remove(path)
@@ -0,0 +1,167 @@
+"""Opt-in wall clock profiler of the training hot path.
+
+Nothing is timed until `Profiler.instrument` wraps a method, so training without a profiler runs the
+original code. A timed call costs two `perf_counter` calls and a list append, durations are aggregated
+per reporting interval (count, percentiles and a log2 histogram in microseconds, see `summary`) and
+can also be written as complete events of the Chrome trace event format, which chrome://tracing and
+Perfetto open directly.
+
+usage:
+    from LasVSim.traffic_module import Traffic
+    profiler = Profiler(trace_filepath='trace.json')
+    profiler.instrument(Traffic, 'sim_step', 'traffic.sim_step')
+    instrument_hrl_agent(profiler, dqn)
+    dqn.fit_hrl(env, ..., callbacks=[ProfilerLogger(profiler, interval=200)])
+"""
+import functools
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+import numpy as np
+
+# histogram bucket i counts durations in [2**i, 2**(i+1)) microseconds, the last one everything above
+HISTOGRAM_BUCKETS = 26
+
+
+class Profiler(object):
+    """Durations of named sections of the training loop.
+
+    # Arguments
+        trace_filepath (str): Also write every timed call to this Chrome trace (JSON array format),
+            None for aggregated statistics only.
+    """
+    def __init__(self, trace_filepath=None):
+        self.trace_filepath = trace_filepath
+        self.durations = defaultdict(list)
+        self.counters = defaultdict(int)
+        self.events = [] if trace_filepath else None
+        self.patches = []
+        self.origin = time.perf_counter()
+        self.nb_trace_events = 0
+        if trace_filepath:
+            with open(trace_filepath, 'w') as f:
+                f.write('[\n')
+
+    def record(self, name, start, end):
+        self.durations[name].append(end - start)
+        if self.events is not None:
+            self.events.append((name, start, end - start, threading.current_thread().ident))
+
+    @contextmanager
+    def section(self, name):
+        """Time the body of a `with` statement as section `name`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, start, time.perf_counter())
+
+    def count(self, name, value=1):
+        self.counters[name] += value
+
+    def instrument(self, owner, attr, name=None):
+        """Time every call of the method `attr` of `owner`, a class or an instance, as section `name`."""
+        name = name or '{}.{}'.format(getattr(owner, '__name__', type(owner).__name__), attr)
+        original = getattr(owner, attr)
+        previous = vars(owner).get(attr)
+        record = self.record
+
+        @functools.wraps(original)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                record(name, start, time.perf_counter())
+
+        setattr(owner, attr, timed)
+        self.patches.append((owner, attr, previous))
+
+    def uninstrument(self):
+        """Restore all methods wrapped by `instrument`."""
+        while self.patches:
+            owner, attr, previous = self.patches.pop()
+            if previous is None:
+                delattr(owner, attr)
+            else:
+                setattr(owner, attr, previous)
+
+    def flush_trace(self):
+        if not self.events:
+            return
+        events, self.events = self.events, []
+        pid = os.getpid()
+        lines = []
+        for name, start, duration, tid in events:
+            lines.append(json.dumps(dict(name=name, ph='X', pid=pid, tid=tid,
+                                         ts=round((start - self.origin) * 1e6, 3), dur=round(duration * 1e6, 3))))
+        with open(self.trace_filepath, 'a') as f:
+            f.write((',\n' if self.nb_trace_events else '') + ',\n'.join(lines))
+        self.nb_trace_events += len(lines)
+
+    def summary(self, reset=True):
+        """Statistics of the sections timed since the last reset.
+
+        # Returns
+            A dict of sections, each with count, total, mean, p50, p90, p99 and max in seconds and the
+            `HISTOGRAM_BUCKETS` log2 histogram counts, and a dict of the counters.
+        """
+        sections = {}
+        for name, durations in self.durations.items():
+            durations = np.asarray(durations)
+            p50, p90, p99 = np.percentile(durations, [50, 90, 99])
+            buckets = np.log2(np.maximum(durations * 1e6, 1.)).astype(np.int64)
+            histogram = np.bincount(np.minimum(buckets, HISTOGRAM_BUCKETS - 1), minlength=HISTOGRAM_BUCKETS)
+            sections[name] = dict(count=len(durations), total=float(durations.sum()), mean=float(durations.mean()),
+                                  p50=float(p50), p90=float(p90), p99=float(p99), max=float(durations.max()),
+                                  histogram=histogram.tolist())
+        counters = dict(self.counters)
+        if reset:
+            self.durations.clear()
+            self.counters.clear()
+        self.flush_trace()
+        return dict(sections=sections, counters=counters)
+
+    def close(self):
+        """Restore the wrapped methods and finish the trace file."""
+        self.uninstrument()
+        self.flush_trace()
+        if self.trace_filepath:
+            with open(self.trace_filepath, 'a') as f:
+                f.write('\n]\n')
+            self.trace_filepath = None
+            self.events = None
+
+
+def format_summary(summary):
+    """Table of a `Profiler.summary`, sections sorted by total time."""
+    sections = summary['sections']
+    lines = ['{:<28} {:>8} {:>10} {:>10} {:>10} {:>10} {:>10}'.format(
+        'section', 'calls', 'total s', 'mean ms', 'p50 ms', 'p99 ms', 'max ms')]
+    for name in sorted(sections, key=lambda name: -sections[name]['total']):
+        stats = sections[name]
+        lines.append('{:<28} {:>8d} {:>10.3f} {:>10.3f} {:>10.3f} {:>10.3f} {:>10.3f}'.format(
+            name, stats['count'], stats['total'], stats['mean'] * 1e3, stats['p50'] * 1e3, stats['p99'] * 1e3,
+            stats['max'] * 1e3))
+    for name, value in sorted(summary['counters'].items()):
+        lines.append('{:<28} {:>8}'.format(name, value))
+    return '\n'.join(lines)
+
+
+def instrument_hrl_agent(profiler, agent):
+    """Time action selection, replay sampling and training of a `DQNAgent4Hrl` and its option agents."""
+    profiler.instrument(agent, 'forward', 'agent.forward')
+    profiler.instrument(agent, 'backward', 'agent.backward')
+    profiler.instrument(agent.memory, 'sample', 'upper.memory.sample')
+    profiler.instrument(agent.trainable_model, 'train_on_batch', 'upper.train_on_batch')
+    for option, option_agent in zip(['left', 'straight', 'right'], agent.option_agents):
+        profiler.instrument(option_agent.memory, 'sample', option + '.memory.sample')
+        profiler.instrument(option_agent.critic, 'train_on_batch', option + '.critic.train_on_batch')
+        if getattr(option_agent, 'actor_train_fn', None) is not None:
+            profiler.instrument(option_agent, 'actor_train_fn', option + '.actor_train')
+    if agent.option_learner is not None:
+        profiler.instrument(agent.option_learner, 'backward', 'options.shared_trunk_backward')
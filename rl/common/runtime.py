@@ -0,0 +1,59 @@
+"""Runtime settings of the learner on CPU-only machines: thread pools, oneDNN and reduced precision LSTMs."""
+import os
+import sys
+import warnings
+
+# Keras dtype policies for the LSTM stacks, see `models.build_models(lstm_dtype=...)`
+LSTM_PRECISIONS = {
+    'float32': None,
+    'bfloat16': 'mixed_bfloat16',
+    'float16': 'mixed_float16',
+}
+
+
+def get_lstm_dtype(precision):
+    """Map 'float32', 'bfloat16' or 'float16' to the dtype policy passed to the LSTM layers."""
+    if precision not in LSTM_PRECISIONS:
+        raise ValueError('Unknown LSTM precision "{}", expected one of {}'.format(
+            precision, sorted(LSTM_PRECISIONS)))
+    if precision == 'float16':
+        warnings.warn('float16 LSTMs are trained without loss scaling, prefer bfloat16 on CPU.')
+    return LSTM_PRECISIONS[precision]
+
+
+def configure_learner_runtime(intra_op_threads=None, inter_op_threads=None, onednn=None, omp_threads=None):
+    """Configure the TF runtime used by the learner. Call it before any model is built.
+
+    `onednn` and `omp_threads` are read by TensorFlow when it is imported, so they only take
+    effect if this is called before the first `import tensorflow`.
+
+    # Arguments
+        intra_op_threads (integer): Threads used inside a single op (matmuls of the LSTM cells), None for TF's default.
+        inter_op_threads (integer): Ops run in parallel, None for TF's default.
+        onednn (boolean): Enable or disable the oneDNN (MKL-DNN) CPU kernels, None to keep TF's default.
+        omp_threads (integer): OpenMP threads of the oneDNN kernels, defaults to `intra_op_threads`.
+
+    # Returns
+        The `tf.compat.v1.Session` installed as the Keras session.
+    """
+    if omp_threads is None:
+        omp_threads = intra_op_threads
+    if onednn is not None or omp_threads is not None:
+        if 'tensorflow' in sys.modules:
+            warnings.warn('TensorFlow is already imported, oneDNN and OpenMP settings will not take effect.')
+        if onednn is not None:
+            os.environ['TF_ENABLE_ONEDNN_OPTS'] = '1' if onednn else '0'
+        if omp_threads is not None:
+            os.environ['OMP_NUM_THREADS'] = str(omp_threads)
+
+    import tensorflow as tf
+    import tensorflow.python.keras.backend as K
+
+    config = tf.compat.v1.ConfigProto()
+    if intra_op_threads is not None:
+        config.intra_op_parallelism_threads = intra_op_threads
+    if inter_op_threads is not None:
+        config.inter_op_parallelism_threads = inter_op_threads
+    session = tf.compat.v1.Session(config=config)
+    K.set_session(session)
+    return session
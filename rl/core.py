@@ -3,15 +3,19 @@ import warnings
 from copy import deepcopy
 
 import numpy as np
-from tensorflow.python.keras.callbacks import History
 
-from rl.callbacks import (
-    CallbackList,
-    TestLogger,
-    TrainEpisodeLogger,
-    TrainIntervalLogger,
-    Visualizer
-)
+# Keras and the callbacks are imported by `fit` and `test`, so that envs and processors can be used without
+# loading TensorFlow
+
+
+def own_observation(observation):
+    """Return `observation` in a form the agent can keep, see the ownership note of `Env`.
+
+    Read-only numpy arrays are kept as they are, anything else is deep-copied.
+    """
+    if isinstance(observation, np.ndarray) and not observation.flags.writeable:
+        return observation
+    return deepcopy(observation)
 
 
 class Agent(object):
@@ -86,6 +90,9 @@ class Agent(object):
         if action_repetition < 1:
             raise ValueError('action_repetition must be >= 1, is {}'.format(action_repetition))
 
+        from tensorflow.python.keras.callbacks import History
+        from rl.callbacks import CallbackList, TrainEpisodeLogger, TrainIntervalLogger, Visualizer
+
         self.training = True
 
         callbacks = [] if not callbacks else callbacks[:]
@@ -111,11 +118,11 @@ class Agent(object):
             callbacks.set_params(params)
         else:
             callbacks._set_params(params)
+        episode = np.int64(0)
+        self.step = np.int64(0)
         self._on_train_begin()
         callbacks.on_train_begin()
 
-        episode = np.int16(0)
-        self.step = np.int16(0)
         observation = None
         episode_reward = None
         episode_step = None
@@ -124,12 +131,12 @@ class Agent(object):
             while self.step < nb_steps:
                 if observation is None:  # start of a new episode
                     callbacks.on_episode_begin(episode)
-                    episode_step = np.int16(0)
+                    episode_step = np.int64(0)
                     episode_reward = np.float32(0)
 
                     # Obtain the initial observation by resetting the environment.
                     self.reset_states()
-                    observation = deepcopy(env.reset())
+                    observation = own_observation(env.reset())
                     if self.processor is not None:
                         observation = self.processor.process_observation(observation)
                     assert observation is not None
@@ -146,13 +153,13 @@ class Agent(object):
                             action = self.processor.process_action(action)
                         callbacks.on_action_begin(action)
                         observation, reward, done, info = env.step(action)
-                        observation = deepcopy(observation)
+                        observation = own_observation(observation)
                         if self.processor is not None:
                             observation, reward, done, info = self.processor.process_step(observation, reward, done, info)
                         callbacks.on_action_end(action)
                         if done:
                             warnings.warn('Env ended before {} random steps could be performed at the start. You should probably lower the `nb_max_start_steps` parameter.'.format(nb_random_start_steps))
-                            observation = deepcopy(env.reset())
+                            observation = own_observation(env.reset())
                             if self.processor is not None:
                                 observation = self.processor.process_observation(observation)
                             break
@@ -175,7 +182,7 @@ class Agent(object):
                 for _ in range(action_repetition):
                     callbacks.on_action_begin(action)
                     observation, r, done, info = env.step(action)
-                    observation = deepcopy(observation)
+                    observation = own_observation(observation)
                     if self.processor is not None:
                         observation, r, done, info = self.processor.process_step(observation, r, done, info)
                     for key, value in info.items():
@@ -272,6 +279,9 @@ class Agent(object):
         if action_repetition < 1:
             raise ValueError('action_repetition must be >= 1, is {}'.format(action_repetition))
 
+        from tensorflow.python.keras.callbacks import History
+        from rl.callbacks import CallbackList, TestLogger, Visualizer
+
         self.training = False
         self.step = 0
 
@@ -306,7 +316,7 @@ class Agent(object):
 
             # Obtain the initial observation by resetting the environment.
             self.reset_states()
-            observation = deepcopy(env.reset())
+            observation = own_observation(env.reset())
             if self.processor is not None:
                 observation = self.processor.process_observation(observation)
             assert observation is not None
@@ -323,13 +333,13 @@ class Agent(object):
                     action = self.processor.process_action(action)
                 callbacks.on_action_begin(action)
                 observation, r, done, info = env.step(action)
-                observation = deepcopy(observation)
+                observation = own_observation(observation)
                 if self.processor is not None:
                     observation, r, done, info = self.processor.process_step(observation, r, done, info)
                 callbacks.on_action_end(action)
                 if done:
                     warnings.warn('Env ended before {} random steps could be performed at the start. You should probably lower the `nb_max_start_steps` parameter.'.format(nb_random_start_steps))
-                    observation = deepcopy(env.reset())
+                    observation = own_observation(env.reset())
                     if self.processor is not None:
                         observation = self.processor.process_observation(observation)
                     break
@@ -347,7 +357,7 @@ class Agent(object):
                 for _ in range(action_repetition):
                     callbacks.on_action_begin(action)
                     observation, r, d, info = env.step(action)
-                    observation = deepcopy(observation)
+                    observation = own_observation(observation)
                     if self.processor is not None:
                         observation, r, d, info = self.processor.process_step(observation, r, d, info)
                     callbacks.on_action_end(action)
@@ -618,6 +628,11 @@ class Env(object):
     - `close`
 
     Refer to the [Gym documentation](https://gym.openai.com/docs/#environments).
+
+    Agents keep the observations returned by `step` and `reset` (recent observation, replay memory).
+    An environment that returns a new numpy array on every call and never writes to it again can mark
+    it read-only (`observation.flags.writeable = False`) so that agents keep it without copying it;
+    any other observation is deep-copied on every step.
     """
     reward_range = (-np.inf, np.inf)
     action_space = None
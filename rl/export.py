@@ -0,0 +1,88 @@
+"""Export the trained hierarchical policy into a single inference artifact, see `rl.inference.HrlPolicy`."""
+import json
+import numpy as np
+
+from rl.snapshot import save_weights_snapshot
+
+ARTIFACT_VERSION = 1
+OPTIONS = ['left', 'straight', 'right']
+
+
+def _export_layer(layer):
+    class_name = layer.__class__.__name__
+    config = layer.get_config()
+    weights = [np.asarray(w, dtype=np.float32) for w in layer.get_weights()]
+    if class_name == 'LSTM':
+        if not config.get('use_bias', True):
+            weights.append(np.zeros(weights[1].shape[1], dtype=np.float32))
+        spec = dict(type='lstm', units=config['units'], activation=config['activation'],
+                    recurrent_activation=config['recurrent_activation'],
+                    return_sequences=config['return_sequences'])
+    elif class_name == 'Dense':
+        if not config.get('use_bias', True):
+            weights.append(np.zeros(weights[0].shape[1], dtype=np.float32))
+        spec = dict(type='dense', units=config['units'], activation=config['activation'])
+    else:
+        raise ValueError('Layer "{}" of type {} can not be exported'.format(layer.name, class_name))
+    return spec, weights
+
+
+def _export_layers(layers):
+    specs, weights = [], []
+    for layer in layers:
+        if layer.__class__.__name__ in ('InputLayer', 'Concatenate'):
+            continue
+        spec, layer_weights = _export_layer(layer)
+        specs.append(spec)
+        weights.append(layer_weights)
+    return specs, weights
+
+
+def _export_normalizer(normalizer):
+    if normalizer is None:
+        return None
+    return dict(mean=normalizer.mean.astype(np.float32), inv_std=(1. / normalizer.std).astype(np.float32))
+
+
+def export_hrl_policy(filepath, upper_model, actors, normalizers=None):
+    """Write the upper Q network, the option actors and the frozen normalizers into one npz file.
+
+    The actors must have the structure built by `models.build_models`: an option encoder LSTM
+    `actor_<option>_encoder`, the shared LSTM model `shared_actor_lstm_model` and the shared dense head
+    `shared_actor_dense_model` fed with the LSTM output and the option indicator. Weights are stored as
+    float32 and the normalizers as mean and 1 / std, so the runtime needs numpy only.
+
+    # Arguments
+        filepath (str): Path of the artifact.
+        upper_model (keras model): Upper Q network, a stack of LSTM and Dense layers.
+        actors (dict): Actor models keyed by 'left', 'straight' and 'right'.
+        normalizers (dict): `WhiteningNormalizer`s keyed by 'upper', 'left', 'straight' and 'right', None for raw inputs.
+    """
+    normalizers = normalizers or {}
+    spec = dict(version=ARTIFACT_VERSION, input_shape=list(upper_model.input_shape[1:]), networks={})
+    artifact = dict(spec=None, weights={}, normalizer={})
+
+    spec['networks']['upper'], artifact['weights']['upper'] = _export_layers(upper_model.layers)
+    for option in OPTIONS:
+        actor = actors[option]
+        encoder_spec, encoder_weights = _export_layer(actor.get_layer('actor_{}_encoder'.format(option)))
+        trunk_specs, trunk_weights = _export_layers(actor.get_layer('shared_actor_lstm_model').layers)
+        head_specs, head_weights = _export_layers(actor.get_layer('shared_actor_dense_model').layers)
+        spec['networks'][option] = dict(encoder=[encoder_spec] + trunk_specs, head=head_specs)
+        artifact['weights'][option] = dict(encoder=[encoder_weights] + trunk_weights, head=head_weights)
+    for name in ['upper'] + OPTIONS:
+        normalizer = _export_normalizer(normalizers.get(name))
+        if normalizer is not None:
+            artifact['normalizer'][name] = normalizer
+    artifact['spec'] = np.array(json.dumps(spec))
+    save_weights_snapshot(artifact, filepath)
+
+
+def export_agent(agent, filepath):
+    """Export a `DQNAgent4Hrl` with `export_hrl_policy`."""
+    actors = dict(left=agent.turn_left_agent.actor, straight=agent.go_straight_agent.actor,
+                  right=agent.turn_right_agent.actor)
+    processors = dict(upper=agent.processor, left=agent.turn_left_agent.processor,
+                      straight=agent.go_straight_agent.processor, right=agent.turn_right_agent.processor)
+    normalizers = {name: getattr(processor, 'normalizer', None) for name, processor in processors.items()}
+    export_hrl_policy(filepath, agent.model, actors, normalizers)
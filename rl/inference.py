@@ -0,0 +1,186 @@
+"""Numpy runtime of a hierarchical policy exported by `rl.export`.
+
+Loading and running the policy needs neither TensorFlow nor the training agents, so it starts in
+milliseconds and can be used by rollout workers, evaluation scripts and `rl.policy_server`.
+"""
+import json
+import numpy as np
+
+from rl.snapshot import load_weights_snapshot
+
+SUPPORTED_ARTIFACT_VERSION = 1
+OPTIONS = ['left', 'straight', 'right']
+OPTION_INDICATORS = dict(left=[1, 0, 0], straight=[0, 1, 0], right=[0, 0, 1])
+# feature columns of the upper observation seen by each option: 30 + 8, 56 and 38
+OPTION_SLICES = dict(left=[slice(None, 30), slice(-8, None)], straight=[slice(None)], right=[slice(18, None)])
+
+
+def _sigmoid(x):
+    return 1. / (1. + np.exp(-x))
+
+
+def _hard_sigmoid(x):
+    return np.clip(0.2 * x + 0.5, 0., 1.)
+
+
+ACTIVATIONS = {
+    'linear': lambda x: x,
+    'relu': lambda x: np.maximum(x, 0.),
+    'tanh': np.tanh,
+    'sigmoid': _sigmoid,
+    'hard_sigmoid': _hard_sigmoid,
+}
+
+
+def _dense(x, spec, weights):
+    kernel, bias = weights
+    return ACTIVATIONS[spec['activation']](np.dot(x, kernel) + bias)
+
+
+def _lstm(x, spec, weights):
+    """Keras LSTM (gate order i, f, c, o) over a (batch, timesteps, features) input."""
+    kernel, recurrent_kernel, bias = weights
+    units = spec['units']
+    activation = ACTIVATIONS[spec['activation']]
+    recurrent_activation = ACTIVATIONS[spec['recurrent_activation']]
+    batch_size, timesteps, _ = x.shape
+    # input projections of all timesteps in one matmul
+    projected = np.dot(x, kernel) + bias
+    h = np.zeros((batch_size, units), dtype=x.dtype)
+    c = np.zeros((batch_size, units), dtype=x.dtype)
+    outputs = np.empty((batch_size, timesteps, units), dtype=x.dtype) if spec['return_sequences'] else None
+    for t in range(timesteps):
+        z = projected[:, t] + np.dot(h, recurrent_kernel)
+        i = recurrent_activation(z[:, :units])
+        f = recurrent_activation(z[:, units:2 * units])
+        o = recurrent_activation(z[:, 3 * units:])
+        c = f * c + i * activation(z[:, 2 * units:3 * units])
+        h = o * activation(c)
+        if outputs is not None:
+            outputs[:, t] = h
+    return outputs if outputs is not None else h
+
+
+_LAYERS = dict(dense=_dense, lstm=_lstm)
+
+
+def _run_layers(x, specs, weights):
+    for spec, layer_weights in zip(specs, weights):
+        x = _LAYERS[spec['type']](x, spec, layer_weights)
+    return x
+
+
+def process_action(action):
+    """Map `[upper_action, delta_x_norm, acc_norm]` to the env action `[upper_action, delta_x, acc]`.
+
+    delta_x_norm in [-1, 1] becomes a goal distance of 10 to 60 m, acc_norm in [-1, 1] an acceleration of -3 to 3 m/s^2.
+    """
+    upper_action, delta_x_norm, acc_norm = action
+    delta_x = np.clip((delta_x_norm + 1) / 2 * 50 + 10, 10, 60)
+    acc = np.clip(acc_norm * 3, -3, 3)
+
+    return upper_action, delta_x, acc
+
+
+def make_option_observations(observations, option):
+    """Option observation of `DQNAgent4Hrl.forward` for a (batch, timesteps, 56) array."""
+    features = [observations[:, :, columns] for columns in OPTION_SLICES[option]]
+    indicator = np.broadcast_to(np.asarray(OPTION_INDICATORS[option], dtype=observations.dtype),
+                                observations.shape[:2] + (3,))
+    return np.concatenate(features + [indicator], axis=2)
+
+
+class OptionViews(object):
+    """Preallocated option observations of one (timesteps, features) upper observation.
+
+    The indicator columns of each option buffer are written once, `view` only copies the feature
+    columns of the option. The returned buffer is overwritten by the next `view` of the same option,
+    use `make_option_observations` for option observations that are kept.
+
+    # Arguments
+        shape (tuple): Shape (timesteps, features) of the upper observations.
+        dtype (numpy dtype): Dtype of the buffers.
+    """
+    def __init__(self, shape=(10, 56), dtype=np.float64):
+        timesteps, nb_features = shape
+        columns = np.arange(nb_features)
+        self.buffers = {}
+        self.copies = {}
+        for option in OPTIONS:
+            copies = []
+            start = 0
+            for source in OPTION_SLICES[option]:
+                width = len(columns[source])
+                copies.append((source, slice(start, start + width)))
+                start += width
+            buffer = np.empty((timesteps, start + 3), dtype=dtype)
+            buffer[:, start:] = OPTION_INDICATORS[option]
+            self.buffers[option] = buffer
+            self.copies[option] = copies
+
+    def view(self, option, observation):
+        """Option observation of `observation`, written into the buffer of `option`."""
+        buffer = self.buffers[option]
+        for source, target in self.copies[option]:
+            buffer[:, target] = observation[:, source]
+        return buffer
+
+
+class HrlPolicy(object):
+    """Greedy hierarchical policy: argmax of the upper Q network, then the actor of the chosen option.
+
+    Equivalent to `DQNAgent4Hrl.forward` in test mode, with the normalizer statistics frozen at export time.
+
+    # Arguments
+        filepath (str): Artifact written by `rl.export.export_hrl_policy`.
+    """
+    def __init__(self, filepath):
+        artifact = load_weights_snapshot(filepath)
+        spec = json.loads(str(artifact['spec']))
+        if spec['version'] > SUPPORTED_ARTIFACT_VERSION:
+            raise ValueError('Policy artifact version {} is newer than the supported version {}'.format(
+                spec['version'], SUPPORTED_ARTIFACT_VERSION))
+        self.input_shape = tuple(spec['input_shape'])
+        self.networks = spec['networks']
+        self.weights = artifact['weights']
+        self.normalizers = artifact.get('normalizer', {})
+
+    def _normalize(self, name, x):
+        normalizer = self.normalizers.get(name)
+        if normalizer is None:
+            return x
+        return (x - normalizer['mean']) * normalizer['inv_std']
+
+    def q_values(self, observations):
+        x = self._normalize('upper', observations)
+        return _run_layers(x, self.networks['upper'], self.weights['upper'])
+
+    def option_actions(self, observations, option):
+        x = self._normalize(option, make_option_observations(observations, option))
+        network, weights = self.networks[option], self.weights[option]
+        encoded = _run_layers(x[:, :, :-3], network['encoder'], weights['encoder'])
+        return _run_layers(np.concatenate([encoded, x[:, 0, -3:]], axis=1), network['head'], weights['head'])
+
+    def forward_batch(self, observations):
+        """Actions of a (batch, timesteps, features) array of observations.
+
+        # Returns
+            Upper actions (batch,) and normalized lower actions (batch, 2), `[delta_x_norm, acc_norm]`.
+        """
+        observations = np.asarray(observations, dtype=np.float32)
+        upper_actions = np.argmax(self.q_values(observations), axis=1)
+        lower_actions = None
+        for idx, option in enumerate(OPTIONS):
+            rows = np.flatnonzero(upper_actions == idx)
+            if len(rows) == 0:
+                continue
+            actions = self.option_actions(observations[rows], option)
+            if lower_actions is None:
+                lower_actions = np.empty((len(observations), actions.shape[1]), dtype=actions.dtype)
+            lower_actions[rows] = actions
+        return upper_actions, lower_actions
+
+    def forward(self, observation):
+        """Same output as `DQNAgent4Hrl.forward`: `[upper_action, delta_x_norm, acc_norm]`."""
+        upper_actions, lower_actions = self.forward_batch(observation[np.newaxis])
+        return [int(upper_actions[0]), float(lower_actions[0, 0]), float(lower_actions[0, 1])]
@@ -5,6 +5,8 @@ import random
 
 import numpy as np
 
+from rl.inference import make_option_observations
+
 
 # This is to be understood as a transition: Given `state0`, performing `action`
 # yields `reward` and results in `state1`, which might be `terminal`.
@@ -246,6 +248,35 @@ class SequentialMemory(Memory):
         return config
 
 
+class OptionViewMemory(SequentialMemory):
+    """Replay memory of an option agent of `DQNAgent4Hrl` that keeps upper observations.
+
+    `append` takes the (timesteps, features) observation of the upper agent, the same array the upper
+    memory keeps, instead of a copy of the option observation. The option observations are only built
+    for the sampled batches, see `rl.inference.make_option_observations`.
+
+    # Arguments
+        option (str): 'left', 'straight' or 'right'.
+    """
+    def __init__(self, limit, option, **kwargs):
+        super(OptionViewMemory, self).__init__(limit, **kwargs)
+        if self.window_length != 1:
+            raise ValueError('OptionViewMemory only supports window_length=1, got {}'.format(self.window_length))
+        self.option = option
+
+    def sample(self, batch_size, batch_idxs=None):
+        experiences = super(OptionViewMemory, self).sample(batch_size, batch_idxs)
+        state0_batch = make_option_observations(np.array([e.state0 for e in experiences]), self.option)
+        state1_batch = make_option_observations(np.array([e.state1 for e in experiences]), self.option)
+        return [e._replace(state0=state0, state1=state1)
+                for e, state0, state1 in zip(experiences, state0_batch, state1_batch)]
+
+    def get_config(self):
+        config = super(OptionViewMemory, self).get_config()
+        config['option'] = self.option
+        return config
+
+
 class EpisodeParameterMemory(Memory):
     def __init__(self, limit, **kwargs):
         super(EpisodeParameterMemory, self).__init__(**kwargs)
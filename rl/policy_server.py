@@ -0,0 +1,237 @@
+"""Local inference server hosting an exported hierarchical policy, see `rl.inference.HrlPolicy`.
+
+Rollout workers and evaluation processes connect over a Unix socket or localhost TCP and send their
+observations. Requests arriving within `max_latency` of each other are run as one batch, so many
+environment processes share one model process and none of them has to load TensorFlow.
+
+usage: python -m rl.policy_server policy.npz --port 5555
+       python -m rl.policy_server policy.npz --unix /tmp/hrl_policy.sock
+"""
+import argparse
+import os
+import socket
+import struct
+import threading
+import time
+try:
+    import queue
+except ImportError:  # python 2
+    import Queue as queue
+import numpy as np
+
+from rl.inference import HrlPolicy
+
+# request: uint32 number of observations, then the float32 observations
+# response: uint32 number of observations, then int32 upper actions and float32 (n, 2) lower actions,
+# or only _ERROR if the request failed
+_HEADER = struct.Struct('<I')
+_ERROR = 0xFFFFFFFF
+
+
+def _recv_exactly(sock, size):
+    chunks = []
+    while size > 0:
+        chunk = sock.recv(size)
+        if not chunk:
+            raise EOFError('connection closed')
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def _make_socket(address):
+    if isinstance(address, str):
+        return socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return sock
+
+
+class PolicyServer(object):
+    """Serve `HrlPolicy.forward_batch` to local clients with dynamic batching.
+
+    # Arguments
+        policy (HrlPolicy or str): The policy or the path of an exported artifact.
+        address (str or tuple): Unix socket path or (host, port) to listen on.
+        max_batch_size (integer): Maximum number of observations run in one batch, larger requests are refused.
+        max_latency (float): Seconds the first request of a batch waits for others to join it.
+    """
+    def __init__(self, policy, address=('127.0.0.1', 5555), max_batch_size=64, max_latency=0.002):
+        self.policy = HrlPolicy(policy) if isinstance(policy, str) else policy
+        self.address = address
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.observation_size = int(np.prod(self.policy.input_shape))
+        self.requests = queue.Queue()
+        self.running = False
+        self.sock = None
+        # served batches and observations, mean batch size = nb_observations / nb_batches
+        self.nb_batches = 0
+        self.nb_observations = 0
+
+    def start(self):
+        """Start listening, the accept loop and the batching loop run in daemon threads."""
+        if isinstance(self.address, str) and os.path.exists(self.address):
+            os.remove(self.address)
+        self.sock = _make_socket(self.address)
+        self.sock.bind(self.address)
+        self.sock.listen(128)
+        if not isinstance(self.address, str):
+            self.address = self.sock.getsockname()
+        self.running = True
+        for target in [self._accept_loop, self._batch_loop]:
+            thread = threading.Thread(target=target)
+            thread.daemon = True
+            thread.start()
+        return self
+
+    def serve_forever(self):
+        self.start()
+        try:
+            while self.running:
+                time.sleep(1.)
+        except KeyboardInterrupt:
+            self.stop()
+
+    def stop(self):
+        self.running = False
+        self.requests.put(None)
+        if self.sock is not None:
+            self.sock.close()
+        if isinstance(self.address, str) and os.path.exists(self.address):
+            os.remove(self.address)
+
+    def _accept_loop(self):
+        while self.running:
+            try:
+                conn, _ = self.sock.accept()
+            except (OSError, socket.error):
+                break
+            if conn.family == socket.AF_INET:
+                conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            thread = threading.Thread(target=self._connection_loop, args=(conn,))
+            thread.daemon = True
+            thread.start()
+
+    def _connection_loop(self, conn):
+        try:
+            while self.running:
+                count, = _HEADER.unpack(_recv_exactly(conn, _HEADER.size))
+                if count == 0:
+                    conn.sendall(_HEADER.pack(0))
+                    continue
+                if count > self.max_batch_size:
+                    # the observations are not read, so the connection can not be used any more
+                    conn.sendall(_HEADER.pack(_ERROR))
+                    break
+                data = _recv_exactly(conn, count * self.observation_size * 4)
+                observations = np.frombuffer(data, dtype=np.float32).reshape((count,) + self.policy.input_shape)
+                # one request in flight per connection, so replies can not be reordered
+                reply = queue.Queue(maxsize=1)
+                self.requests.put((observations, reply))
+                result = self._wait_reply(reply)
+                if isinstance(result, Exception):
+                    conn.sendall(_HEADER.pack(_ERROR))
+                    continue
+                upper_actions, lower_actions = result
+                conn.sendall(_HEADER.pack(count) + upper_actions.astype('<i4').tobytes() +
+                             lower_actions.astype('<f4').tobytes())
+        except (EOFError, OSError, socket.error):
+            pass
+        finally:
+            conn.close()
+
+    def _wait_reply(self, reply):
+        """Actions of a request, or the exception of its batch, EOFError if the server stops first."""
+        while True:
+            try:
+                return reply.get(timeout=0.1)
+            except queue.Empty:
+                if not self.running:
+                    raise EOFError('server stopped')
+
+    def _batch_loop(self):
+        while True:
+            request = self.requests.get()
+            if request is None:
+                break
+            batch = [request]
+            size = len(request[0])
+            deadline = time.time() + self.max_latency
+            while size < self.max_batch_size:
+                timeout = deadline - time.time()
+                if timeout <= 0:
+                    break
+                try:
+                    request = self.requests.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if request is None:
+                    self.requests.put(None)
+                    break
+                batch.append(request)
+                size += len(request[0])
+            observations = batch[0][0] if len(batch) == 1 else np.concatenate([obs for obs, _ in batch])
+            try:
+                upper_actions, lower_actions = self.policy.forward_batch(observations)
+            except Exception as error:
+                # fail the requests of this batch, not the server
+                for _, reply in batch:
+                    reply.put(error)
+                continue
+            self.nb_batches += 1
+            self.nb_observations += size
+            start = 0
+            for obs, reply in batch:
+                reply.put((upper_actions[start:start + len(obs)], lower_actions[start:start + len(obs)]))
+                start += len(obs)
+
+
+class PolicyClient(object):
+    """Connection of a worker to a `PolicyServer`, drop-in for `HrlPolicy.forward`/`forward_batch`.
+
+    # Arguments
+        address (str or tuple): Unix socket path or (host, port) of the server.
+        input_shape (tuple): Shape of one observation.
+    """
+    def __init__(self, address=('127.0.0.1', 5555), input_shape=(10, 56)):
+        self.input_shape = tuple(input_shape)
+        self.sock = _make_socket(address)
+        self.sock.connect(address)
+
+    def forward_batch(self, observations):
+        observations = np.ascontiguousarray(observations, dtype='<f4').reshape((-1,) + self.input_shape)
+        count = len(observations)
+        self.sock.sendall(_HEADER.pack(count) + observations.tobytes())
+        reply_count, = _HEADER.unpack(_recv_exactly(self.sock, _HEADER.size))
+        if reply_count == _ERROR:
+            raise RuntimeError('the policy server refused or failed a request of {} observations'.format(count))
+        upper_actions = np.frombuffer(_recv_exactly(self.sock, count * 4), dtype='<i4')
+        lower_actions = np.frombuffer(_recv_exactly(self.sock, count * 8), dtype='<f4').reshape(count, 2)
+        return upper_actions, lower_actions
+
+    def forward(self, observation):
+        upper_actions, lower_actions = self.forward_batch(observation[np.newaxis])
+        return [int(upper_actions[0]), float(lower_actions[0, 0]), float(lower_actions[0, 1])]
+
+    def close(self):
+        self.sock.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve an exported hierarchical policy.')
+    parser.add_argument('policy')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5555)
+    parser.add_argument('--unix', default=None, help='listen on this Unix socket path instead of TCP')
+    parser.add_argument('--max-batch-size', type=int, default=64)
+    parser.add_argument('--max-latency-ms', type=float, default=2.)
+    args = parser.parse_args()
+    address = args.unix if args.unix else (args.host, args.port)
+    server = PolicyServer(args.policy, address, args.max_batch_size, args.max_latency_ms / 1000.)
+    print('serving {} on {}'.format(args.policy, address))
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
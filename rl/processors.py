@@ -1,7 +1,7 @@
 import numpy as np
 
 from rl.core import Processor
-from rl.util import WhiteningNormalizer
+from rl.inference import process_action
 
 
 class MultiInputProcessor(Processor):
@@ -45,22 +45,46 @@ class WhiteningNormalizerProcessor(Processor):
     on different scales. However, it complicates training in the sense that you will have to store
     these weights alongside the policy if you intend to load it later. It is the responsibility of
     the user to do so.
+
+    While frozen (e.g. during testing) the statistics are only applied, not updated. Batches are
+    normalized in `dtype` with a cached mean and 1 / std, the statistics themselves are accumulated
+    in float64.
+
+    # Arguments
+        dtype (numpy dtype): Dtype of the normalized batches fed to the network.
+        frozen (boolean): Start with frozen statistics.
     """
-    def __init__(self):
+    def __init__(self, dtype=np.float32, frozen=False):
         self.normalizer = None
+        self.dtype = dtype
+        self.frozen = frozen
 
-    def process_state_batch(self, batch):
+    def freeze(self):
+        self.frozen = True
+
+    def unfreeze(self):
+        self.frozen = False
+
+    def update(self, batch):
+        batch = np.asarray(batch, dtype=self.dtype)
         if self.normalizer is None:
-            self.normalizer = WhiteningNormalizer(shape=batch.shape[1:], dtype=batch.dtype)
+            from rl.util import WhiteningNormalizer  # rl.util loads TensorFlow, keep it out of the import
+            self.normalizer = WhiteningNormalizer(shape=batch.shape[1:])
         self.normalizer.update(batch)
+
+    def normalize(self, batch):
+        batch = np.asarray(batch, dtype=self.dtype)
+        if self.normalizer is None:
+            return batch
         return self.normalizer.normalize(batch)
 
-    def process_action(self, action):
-        upper_action, delta_x_norm, acc_norm = action
-        delta_x = np.clip((delta_x_norm + 1) / 2 * 50 + 10, 10, 60)
-        acc = np.clip(acc_norm * 3, -3, 3)
+    def process_state_batch(self, batch):
+        if not self.frozen:
+            self.update(batch)
+        return self.normalize(batch)
 
-        return upper_action, delta_x, acc
+    def process_action(self, action):
+        return process_action(action)
 
     @staticmethod
     def process_reward_batch(batch):
@@ -0,0 +1,57 @@
+"""Single file npz storage of nested dicts/lists of numpy arrays, used for checkpoints and exported policies.
+
+Only depends on numpy so it can be used by processes that never import TensorFlow.
+"""
+import os
+import numpy as np
+
+
+def _flatten_snapshot(snapshot, prefix, flat):
+    if isinstance(snapshot, dict):
+        for key, value in snapshot.items():
+            _flatten_snapshot(value, prefix + str(key) + '/', flat)
+    elif isinstance(snapshot, (list, tuple)):
+        for idx, value in enumerate(snapshot):
+            _flatten_snapshot(value, prefix + '#{}/'.format(idx), flat)
+    else:
+        flat[prefix[:-1]] = np.asarray(snapshot)
+
+
+def save_weights_snapshot(snapshot, filepath):
+    """Write a (nested dict/list of numpy arrays) weights snapshot into a single npz file.
+
+    The file is first written next to `filepath` and then renamed, so a crash never
+    leaves a half written checkpoint behind.
+    """
+    flat = {}
+    _flatten_snapshot(snapshot, '', flat)
+    dirname = os.path.dirname(filepath)
+    if dirname and not os.path.exists(dirname):
+        os.makedirs(dirname)
+    tmp_filepath = filepath + '.tmp'
+    with open(tmp_filepath, 'wb') as f:
+        np.savez(f, **flat)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_filepath, filepath)
+
+
+def load_weights_snapshot(filepath):
+    """Read a snapshot written by `save_weights_snapshot` back into nested dicts and lists."""
+    snapshot = {}
+    with np.load(filepath) as f:
+        for key in f.files:
+            node = snapshot
+            parts = key.split('/')
+            for part in parts[:-1]:
+                node = node.setdefault(part, {})
+            node[parts[-1]] = f[key]
+
+    def restore_lists(node):
+        if not isinstance(node, dict):
+            return node
+        node = {key: restore_lists(value) for key, value in node.items()}
+        if node and all(key.startswith('#') for key in node):
+            return [node['#{}'.format(idx)] for idx in range(len(node))]
+        return node
+    return restore_lists(snapshot)
@@ -2,8 +2,11 @@ import numpy as np
 import tensorflow as tf
 from tensorflow.python.keras.models import model_from_config, Sequential, Model, model_from_config
 import tensorflow.python.keras.optimizers as optimizers
+import tensorflow.python.keras.backend as K
 import pickle
 
+from rl.snapshot import save_weights_snapshot, load_weights_snapshot
+
 
 
 def clone_model(model, custom_objects={}):
@@ -34,18 +37,49 @@ def clone_optimizer(optimizer):
     return clone
 
 
-def get_soft_target_model_updates(target, source, tau):
+def _get_target_source_weights(target, source):
     target_weights = target.trainable_weights + sum([l.non_trainable_weights for l in target.layers], [])
     source_weights = source.trainable_weights + sum([l.non_trainable_weights for l in source.layers], [])
     assert len(target_weights) == len(source_weights)
+    return zip(target_weights, source_weights)
 
+
+def get_soft_target_model_updates(target, source, tau):
     # Create updates.
     updates = []
-    for tw, sw in zip(target_weights, source_weights):
+    for tw, sw in _get_target_source_weights(target, source):
         updates.append((tw, tau * sw + (1. - tau) * tw))
     return updates
 
 
+def get_hard_target_model_updates(target, source):
+    return [(tw, sw) for tw, sw in _get_target_source_weights(target, source)]
+
+
+class TargetModelUpdater(object):
+    """Synchronizes target models with their source models by running a single grouped assign op.
+
+    Unlike `target.set_weights(source.get_weights())` the weights never leave the TF runtime,
+    and any number of (target, source) pairs are updated in one session call.
+
+    # Arguments
+        model_pairs (list): List of (target model, source model) tuples.
+        tau (float): `1.` for a hard update, otherwise soft update `tau * source + (1 - tau) * target`.
+    """
+    def __init__(self, model_pairs, tau=1.):
+        assign_ops = []
+        for target, source in model_pairs:
+            if tau >= 1.:
+                updates = get_hard_target_model_updates(target, source)
+            else:
+                updates = get_soft_target_model_updates(target, source, tau)
+            assign_ops += [tf.compat.v1.assign(tw, value) for tw, value in updates]
+        self.op = tf.group(*assign_ops)
+
+    def __call__(self):
+        K.get_session().run(self.op)
+
+
 def get_object_config(o):
     if o is None:
         return None
@@ -96,43 +130,108 @@ class AdditionalUpdatesOptimizer(optimizers.Optimizer):
 
 # Based on https://github.com/openai/baselines/blob/master/baselines/common/mpi_running_mean_std.py
 class WhiteningNormalizer(object):
+    """Running mean and standard deviation of the observations.
+
+    The statistics are kept as count, mean and sum of squared deviations (m2) and combined with the
+    parallel algorithm of Chan et al., which stays accurate over millions of samples and lets
+    normalizers fed by different workers be reduced with `merge`.
+    """
+    STATS_VERSION = 2
+
     def __init__(self, shape, eps=1e-2, dtype=np.float64):
         self.eps = eps
         self.shape = shape
         self.dtype = dtype
 
-        self._sum = np.zeros(shape, dtype=dtype)
-        self._sumsq = np.zeros(shape, dtype=dtype)
         self._count = 0
+        self._m2 = np.zeros(shape, dtype=dtype)
 
         self.mean = np.zeros(shape, dtype=dtype)
         self.std = np.ones(shape, dtype=dtype)
+        # mean and 1 / std cast to the dtype of the inputs, rebuilt after each update
+        self._apply_params = {}
 
     def load_param(self, filepath):
-        list_to_be_load = []
         with open(filepath, 'rb') as f:
-            list_to_be_load = pickle.load(f)
-        self.shape, self.dtype, self._sum, self._sumsq, self._count, self.mean, self.std = list_to_be_load
+            is_npz = f.read(2) == b'PK'
+            f.seek(0)
+            if is_npz:
+                with np.load(f) as stats:
+                    self.set_state(dict(stats.items()))
+            else:
+                # legacy format: pickled [shape, dtype, sum, sumsq, count, mean, std] list
+                shape, dtype, _sum, _sumsq, count, _, _ = pickle.load(f)
+                self.set_state(dict(shape=shape, dtype=np.dtype(dtype).name, sum=_sum, sumsq=_sumsq,
+                                    count=count))
 
     def save_param(self, filepath):
-        list_to_be_saved = [self.shape, self.dtype, self._sum, self._sumsq, self._count, self.mean, self.std]
         with open(filepath, 'wb') as f:
-            pickle.dump(list_to_be_saved, f)
+            np.savez(f, **self.get_state())
+
+    def get_state(self):
+        """Return a copy of the statistics as a dict of numpy arrays."""
+        return dict(version=np.array(self.STATS_VERSION), shape=np.array(self.shape),
+                    dtype=np.array(np.dtype(self.dtype).name), eps=np.array(self.eps),
+                    count=np.array(self._count), mean=self.mean.copy(), m2=self._m2.copy())
+
+    def set_state(self, state):
+        version = int(state.get('version', 1))
+        if version > self.STATS_VERSION:
+            raise ValueError('Normalizer statistics version {} is newer than the supported version {}'.format(
+                version, self.STATS_VERSION))
+        self.shape = tuple(int(d) for d in state['shape'])
+        self.dtype = np.dtype(str(state['dtype']))
+        self.eps = float(state.get('eps', self.eps))
+        self._count = int(state['count'])
+        if 'm2' in state:
+            self.mean = np.array(state['mean'], dtype=self.dtype)
+            self._m2 = np.array(state['m2'], dtype=self.dtype)
+        else:
+            # version 1 kept raw sums
+            count = max(self._count, 1)
+            self.mean = np.array(state['sum'], dtype=self.dtype) / count
+            self._m2 = np.maximum(np.array(state['sumsq'], dtype=self.dtype) - count * np.square(self.mean), 0.)
+        self._update_std()
+
+    def _update_std(self):
+        if self._count > 0:
+            self.std = np.sqrt(np.maximum(np.square(self.eps), self._m2 / float(self._count)))
+        self._apply_params = {}
+
+    def _get_apply_params(self, dtype):
+        params = self._apply_params.get(dtype)
+        if params is None:
+            params = (self.mean.astype(dtype), (1. / self.std).astype(dtype))
+            self._apply_params[dtype] = params
+        return params
 
     def normalize(self, x):
-        return (x - self.mean) / self.std
+        mean, inv_std = self._get_apply_params(x.dtype)
+        return (x - mean) * inv_std
 
     def denormalize(self, x):
         return self.std * x + self.mean
 
+    def _combine(self, count, mean, m2):
+        if count == 0:
+            return
+        total = self._count + count
+        delta = mean - self.mean
+        self.mean = self.mean + delta * (count / float(total))
+        self._m2 = self._m2 + m2 + np.square(delta) * (self._count * count / float(total))
+        self._count = total
+        self._update_std()
+
     def update(self, x):
         if x.ndim == len(self.shape):
             x = x.reshape(-1, *self.shape)
         assert x.shape[1:] == self.shape
 
-        self._count += x.shape[0]
-        self._sum += np.sum(x, axis=0)
-        self._sumsq += np.sum(np.square(x), axis=0)
+        batch_mean = np.mean(x, axis=0, dtype=self.dtype)
+        batch_m2 = np.sum(np.square(x - batch_mean), axis=0, dtype=self.dtype)
+        self._combine(x.shape[0], batch_mean, batch_m2)
 
-        self.mean = self._sum / float(self._count)
-        self.std = np.sqrt(np.maximum(np.square(self.eps), self._sumsq / float(self._count) - np.square(self.mean)))
+    def merge(self, other):
+        """Fold the statistics of another normalizer of the same shape into this one."""
+        assert tuple(other.shape) == tuple(self.shape)
+        self._combine(other._count, other.mean.astype(self.dtype), other._m2.astype(self.dtype))